@@ -6,22 +6,176 @@ import json
 # Add the parent directory to Python path to access core module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, g
+import threading
 import time
-from datetime import datetime
-from core.user_input import get_user_input, display_prediction
-from core.save_urls import save_specific_urls
-from core.scrap_specific_ads import scrap_specific_ads
-from core.train_user_model import train_user_model, predict_user_price
-from core.config import get_user_data_file, get_user_model_file, get_search_history_file
-import pandas as pd
+import uuid
+# Selenium, pandas and scikit-learn are imported inside the routes that need them,
+# so workers boot (and the home page serves) without loading the browser and ML stacks
+from core.user_input import get_user_input, display_prediction, validate_user_data
+from core.config import (STATE_TTL, API_MAX_BATCH, WEB_LATENCY_BUDGET, MAX_BUDGET_ADS, PROFILE_PIPELINE,
+                         PROGRESS_STREAM_MAX_SECONDS, PROGRESS_STREAMS_PER_WORKER,
+                         GLOBAL_MODEL_FILE, normalize_search_query, ensure_data_dirs)
+from core.global_model import GlobalModelTrainer
+from core.prewarm import Prewarmer
+from core.state_store import get_state_store
+from core.progress import StoreProgressPublisher
+from core.singleflight import SingleFlight, Unshared
+from core.result_cache import PredictionCache
+from core.model_registry import get_model_registry
+from core.pipeline import PredictionPipeline, run_prediction_pipeline, quick_prediction, save_search_history
+from core.cancellation import CancellationToken, OperationCancelled, store_cancel_check
+from core.latency_budget import LatencyModel
+from core.jobs import JobQueue
+from core.browser import BrowserCapacityError
+from core.metrics import REGISTRY
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'  # Change this in production
 app.config['PERMANENT_SESSION_LIFETIME'] = 1800  # 30 minutes
 
-# Store pipeline data temporarily
-pipeline_data = {}
+PROGRESS_POLL_INTERVAL = 0.25  # Seconds between event log reads in /progress/stream
+PROGRESS_BUSY_RETRY = 10000  # Milliseconds before a browser turned away from a full worker reconnects
+
+# Each open stream holds a worker thread, the rest stay free for the pipeline steps
+progress_streams = threading.BoundedSemaphore(PROGRESS_STREAMS_PER_WORKER)
+
+# Pipeline data is shared through the state store so any worker can serve any step
+pipeline_store = get_state_store()
+
+# Measured scroll/ad/training costs, used to fit scrape depth into a latency budget
+latency_model = LatencyModel(pipeline_store)
+
+# Identical searches running at the same time share one browser session and one result
+search_flight = SingleFlight(pipeline_store)
+
+# Recently priced specs are answered immediately, stale answers refresh in the background
+prediction_cache = PredictionCache(
+    pipeline_store,
+    refresh=lambda user_data: run_prediction_pipeline(user_data, max_ads=50, max_scrolls=40)
+)
+
+# Trained models and the global model that answer without opening a browser
+model_registry = get_model_registry()
+global_model_file = GLOBAL_MODEL_FILE
+
+def run_pricing_job(user_data, budget=None, depth=50, profile=False):
+    """Full scrape/train/predict for an API item that had no cached answer or model"""
+    result = run_prediction_pipeline(user_data, max_ads=depth, max_scrolls=40, budget=budget,
+                                     profile=profile or PROFILE_PIPELINE)
+    if not result:
+        return None
+    prediction_cache.put(user_data, result['predicted_price'], result['samples'])
+    save_search_history(user_data, result['predicted_price'], result['samples'], 'scrape')
+    answer = {'predicted_price': result['predicted_price'], 'samples': result['samples'], 'source': 'scrape'}
+    if result.get('profile_dir'):
+        answer['profile_dir'] = result['profile_dir']
+    return answer
+
+pricing_jobs = JobQueue(pipeline_store, run_pricing_job)
+
+# The global model is retrained from every scraped ad in the background (GLOBAL_MODEL_RETRAIN_INTERVAL)
+global_model_trainer = GlobalModelTrainer(pipeline_store)
+
+# The most requested specs are kept answered from fresh data in the background (PREWARM_INTERVAL, off by default)
+prewarmer = Prewarmer(pipeline_store, prediction_cache)
+
+def start_background_tasks():
+    """Create the data directories and start the background schedules
+
+    Called by the wsgi/run entrypoints, never at import: tests and scripts
+    importing the app start no threads unless they opt in.
+    """
+    ensure_data_dirs()
+    global_model_trainer.start()
+    prewarmer.start()
+
+def pipeline_key(session_id):
+    return f"pipeline:{session_id}"
+
+def load_pipeline_data():
+    """Return (session_id, data) for the current user session"""
+    session_id = session.get('session_id')
+    if not session_id:
+        return None, None
+    return session_id, pipeline_store.get(pipeline_key(session_id))
+
+def save_pipeline_data(session_id, data):
+    pipeline_store.set(pipeline_key(session_id), data, ttl=STATE_TTL)
+
+def capacity_response(error):
+    """503 with Retry-After for requests that found every browser slot busy"""
+    response = jsonify({
+        'success': False,
+        'error': str(error),
+        'retry_after': error.retry_after,
+        'queue_position': error.position
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def cancel_key(session_id):
+    return f"cancel:{session_id}"
+
+def profiling_requested():
+    """Stages of this request are profiled when PROFILE_PIPELINE is on or the client sends X-Profile: 1"""
+    return PROFILE_PIPELINE or request.headers.get('X-Profile', '').lower() in ('1', 'true', 'yes')
+
+@app.after_request
+def add_profile_header(response):
+    if g.get('profile_run'):
+        response.headers['X-Profile-Run'] = g.profile_run
+    return response
+
+def session_pipeline(session_id, data, profile=False):
+    """PredictionPipeline continuing from the state saved by earlier steps
+
+    Its token is cancelled from any worker by /cleanup, so a user leaving the
+    page stops the browser work of the step that is still running. With
+    profile, its stages are added to the session's profile report.
+    """
+    cancel_token = CancellationToken(check=store_cancel_check(pipeline_store, cancel_key(session_id)))
+    pipeline = PredictionPipeline(data['user_data'], max_ads=data.get('max_ads', 50),
+                                  max_scrolls=data.get('max_scrolls', 40), deadlines=data.get('deadlines'),
+                                  progress=session_progress(session_id), cancel_token=cancel_token,
+                                  latency_model=latency_model)
+    if profile:
+        # Every step of the session adds its stages to the same report
+        from core.profiling import StageProfiler
+        g.profile_run = StageProfiler(run_id=f"session-{session_id}").attach(pipeline).run_id
+    return pipeline.restore(data)
+
+def shared_stages(pipeline, *stages, answer=None):
+    """Run stages for search_flight, returns the last result (or answer() once they all succeeded)
+
+    A result cut short by this session's cancel token or deadline, or its
+    cancellation, is kept to this session (Unshared): users waiting on the
+    same flight run it themselves.
+    """
+    result = None
+    for stage in stages:
+        try:
+            result = pipeline.run_stage(stage)
+        except OperationCancelled as e:
+            raise Unshared(error=e)
+        if not result or pipeline.cancelled:
+            break
+    if result and answer is not None:
+        result = answer()
+    if pipeline.cancelled or any(stage in pipeline.deadline_hits for stage in stages):
+        raise Unshared(result)
+    return result
+
+def cancelled_response():
+    return jsonify({'success': False, 'cancelled': True, 'error': 'درخواست لغو شد'})
+
+def events_key(session_id):
+    return f"events:{session_id}"
+
+def session_progress(session_id):
+    """Progress callback that publishes pipeline events for /progress/stream"""
+    return StoreProgressPublisher(pipeline_store, events_key(session_id), ttl=STATE_TTL)
 
 @app.route('/')
 def index():
@@ -42,12 +196,45 @@ def predict():
         
         print(f"🔵 User data: {user_data}")
         
+        cached, cache_state = prediction_cache.get(user_data)
+        if cached:
+            print(f"✅ STEP 1: Answered from {cache_state} cache ({cached['age']:.0f}s old)")
+            save_search_history(user_data, cached['predicted_price'], cached['samples'], 'cache')
+            return jsonify({
+                'success': True,
+                'cached': True,
+                'cache_state': cache_state,
+                'answer_age': round(cached['age']),
+                'predicted_price': cached['predicted_price'],
+                'formatted_price': f"{cached['predicted_price']:,.0f}",
+                'car_info': user_data,
+                'message': 'پیش‌بینی قیمت با موفقیت انجام شد',
+                'next_step': 'done'
+            })
+        
+        # An existing model of this brand or the global model prices the car without opening a browser
+        answer = quick_prediction(user_data, registry=model_registry, global_model_file=global_model_file)
+        if answer:
+            print(f"✅ STEP 1: Answered by the {answer['source']} ({answer['samples']} samples)")
+            save_search_history(user_data, answer['predicted_price'], answer['samples'], answer['source'])
+            prediction_cache.put(user_data, answer['predicted_price'], answer['samples'])
+            return jsonify({
+                'success': True,
+                'cached': False,
+                'source': answer['source'],
+                'predicted_price': answer['predicted_price'],
+                'formatted_price': f"{answer['predicted_price']:,.0f}",
+                'car_info': user_data,
+                'message': 'پیش‌بینی قیمت با موفقیت انجام شد',
+                'next_step': 'done'
+            })
+        
         # Generate unique session ID for this prediction
-        session_id = f"{user_data['brand_model']}_{user_data['year_model']}_{int(time.time())}"
+        session_id = uuid.uuid4().hex
         session['session_id'] = session_id
         
         # Initialize pipeline data
-        pipeline_data[session_id] = {
+        data = {
             'user_data': user_data,
             'current_step': 'starting',
             'urls': [],
@@ -55,6 +242,15 @@ def predict():
             'model_file': ''
         }
         
+        # With a latency budget the scrape depth of every step is planned up front
+        budget = request.form.get('budget', type=int) or WEB_LATENCY_BUDGET
+        if budget:
+            plan = latency_model.plan(budget)
+            data.update(budget=budget, max_ads=plan['max_ads'], max_scrolls=plan['max_scrolls'],
+                        deadlines=plan['deadlines'])
+            print(f"🔵 Budget {budget}s: {plan['max_ads']} ads, {plan['max_scrolls']} scrolls")
+        save_pipeline_data(session_id, data)
+        
         print("✅ STEP 1: Predict completed successfully")
         return jsonify({
             'success': True,
@@ -74,33 +270,33 @@ def search_ads():
     """Search for ads based on user input"""
     try:
         print("🔵 STEP 2: Starting search_ads")
-        session_id = session.get('session_id')
-        if not session_id or session_id not in pipeline_data:
+        session_id, data = load_pipeline_data()
+        if not data:
             print("❌ No session found")
             return jsonify({'success': False, 'error': 'جلسه کاربر یافت نشد'})
         
-        data = pipeline_data[session_id]
         user_data = data['user_data']
         data['current_step'] = 'searching'
+        save_pipeline_data(session_id, data)
         
         print(f"🔵 Searching for: {user_data['brand_model']}")
         
-        # Search for ads
-        urls = save_specific_urls(
-            brand_model=user_data['brand_model'],
-            year_model=user_data['year_model'],
-            mileage=user_data['mileage'],
-            gearbox=user_data['gearbox'],
-            fuel_type=user_data['fuel_type'],
-            max_ads=50,
-            max_scrolls=40
-        )
+        # Search for ads, joining an identical search if one is already running
+        query = normalize_search_query(user_data['brand_model'])
+        pipeline = session_pipeline(session_id, data, profile=profiling_requested())
+        if pipeline.cancelled:
+            return cancelled_response()
+        urls = search_flight.do(f"search:{query}", lambda: shared_stages(pipeline, 'search'))
+        if pipeline.cancelled:
+            print("⏹️ STEP 2: search_ads cancelled")
+            return cancelled_response()
         
         print(f"✅ Found {len(urls)} URLs")
         
         # Store URLs for later use
         data['urls'] = urls
         data['current_step'] = 'scraping'
+        save_pipeline_data(session_id, data)
         
         print("✅ STEP 2: search_ads completed successfully")
         return jsonify({
@@ -110,6 +306,12 @@ def search_ads():
             'next_step': 'scrape_data'
         })
         
+    except BrowserCapacityError as e:
+        print(f"⏳ STEP 2: search_ads rejected - {e}")
+        return capacity_response(e)
+    except OperationCancelled:
+        print("⏹️ STEP 2: search_ads cancelled")
+        return cancelled_response()
     except Exception as e:
         print(f"❌ STEP 2: search_ads failed - {e}")
         return jsonify({
@@ -122,11 +324,10 @@ def scrape_data():
     """Scrape data from found ads"""
     try:
         print("🔵 STEP 3: Starting scrape_data")
-        session_id = session.get('session_id')
-        if not session_id or session_id not in pipeline_data:
+        session_id, data = load_pipeline_data()
+        if not data:
             return jsonify({'success': False, 'error': 'جلسه کاربر یافت نشد'})
         
-        data = pipeline_data[session_id]
         user_data = data['user_data']
         urls = data['urls']
         
@@ -135,21 +336,23 @@ def scrape_data():
         if not urls:
             return jsonify({'success': False, 'error': 'آگهی‌ای برای استخراج یافت نشد'})
         
-        # Generate file paths
-        data_file = get_user_data_file(
-            user_data['brand_model'], 
-            user_data['year_model'], 
-            user_data['mileage'], 
-            user_data['gearbox'], 
-            user_data['fuel_type']
-        )
-        
-        # Scrape ads using the URLs we already found
-        ads_count = scrap_specific_ads(urls, data_file)
-        
+        # Scrape ads using the URLs we already found, duplicates reuse the leader's rows.
+        # Rows go to the training step through the state store, the CSV is written in the background
+        pipeline = session_pipeline(session_id, data, profile=profiling_requested())
+        if pipeline.cancelled:
+            return cancelled_response()
+        query = normalize_search_query(user_data['brand_model'])
+        rows = search_flight.do(f"scrape:{query}", lambda: shared_stages(pipeline, 'scrape'))
+        if pipeline.cancelled:
+            print("⏹️ STEP 3: scrape_data cancelled")
+            return cancelled_response()
+        ads_count = len(rows)
+        
+        data['rows'] = rows
         data['ads_count'] = ads_count
-        data['data_file'] = data_file
+        data['data_file'] = pipeline.data_file
         data['current_step'] = 'training'
+        save_pipeline_data(session_id, data)
         
         print(f"✅ STEP 3: Scraped {ads_count} ads")
         return jsonify({
@@ -159,6 +362,12 @@ def scrape_data():
             'next_step': 'train_model'
         })
         
+    except BrowserCapacityError as e:
+        print(f"⏳ STEP 3: scrape_data rejected - {e}")
+        return capacity_response(e)
+    except OperationCancelled:
+        print("⏹️ STEP 3: scrape_data cancelled")
+        return cancelled_response()
     except Exception as e:
         print(f"❌ STEP 3: scrape_data failed - {e}")
         return jsonify({
@@ -171,57 +380,58 @@ def train_model():
     """Train ML model on collected data"""
     try:
         print("🔵 STEP 4: Starting train_model")
-        session_id = session.get('session_id')
-        if not session_id or session_id not in pipeline_data:
+        session_id, data = load_pipeline_data()
+        if not data:
             return jsonify({'success': False, 'error': 'جلسه کاربر یافت نشد'})
         
-        data = pipeline_data[session_id]
-        user_data = data['user_data']
-        data_file = data.get('data_file')
-        
-        if not data_file or not os.path.exists(data_file):
-            return jsonify({'success': False, 'error': 'فایل داده‌ها یافت نشد'})
-        
-        # Check if data file has enough records
-        try:
-            df = pd.read_csv(data_file)
-            print(f"🔵 Data file has {len(df)} records")
-            if len(df) < 3:
-                return jsonify({
-                    'success': False, 
-                    'error': f'داده‌های کافی برای آموزش وجود ندارد (فقط {len(df)} نمونه)'
-                })
-        except Exception as e:
-            return jsonify({'success': False, 'error': f'خطا در خواندن فایل داده: {str(e)}'})
-        
-        # Generate model file path
-        model_file = get_user_model_file(
-            user_data['brand_model'], 
-            user_data['year_model'], 
-            user_data['mileage'], 
-            user_data['gearbox'], 
-            user_data['fuel_type']
-        )
-        
-        # Train model
-        model_data = train_user_model(data_file, model_file, user_data)
-        
-        if not model_data:
+        rows = data.get('rows')
+        if not rows:
+            return jsonify({'success': False, 'error': 'داده‌ای برای آموزش یافت نشد'})
+        
+        print(f"🔵 Training on {len(rows)} records")
+        if len(rows) < 3:
+            return jsonify({
+                'success': False, 
+                'error': f'داده‌های کافی برای آموزش وجود ندارد (فقط {len(rows)} نمونه)'
+            })
+        
+        pipeline = session_pipeline(session_id, data, profile=profiling_requested())
+        if pipeline.cancelled:
+            return cancelled_response()
+        
+        # Train and predict with the model still in memory, once per model file even if
+        # several users wait for it. The model file is saved in the background.
+        def train():
+            return shared_stages(pipeline, 'train', 'predict', answer=lambda: {
+                'samples': pipeline.samples, 'predicted_price': pipeline.predicted_price
+            })
+        
+        trained = search_flight.do(f"train:{pipeline.model_file}", train)
+        
+        if pipeline.cancelled:
+            print("⏹️ STEP 4: train_model cancelled")
+            return cancelled_response()
+        if not trained:
             return jsonify({'success': False, 'error': 'آموزش مدل با شکست مواجه شد'})
         
-        data['model_file'] = model_file
+        data['rows'] = None
+        data['model_file'] = pipeline.model_file
         data['current_step'] = 'predicting'
-        data['samples_count'] = model_data['metrics']['samples']
-        data['model_data'] = model_data
+        data['samples_count'] = trained['samples']
+        data['predicted_price'] = trained['predicted_price']
+        save_pipeline_data(session_id, data)
         
         print("✅ STEP 4: Model training completed")
         return jsonify({
             'success': True,
-            'samples_count': model_data['metrics']['samples'],
-            'message': f'مدل با {model_data["metrics"]["samples"]} داده آموزش داده شد',
+            'samples_count': trained['samples'],
+            'message': f'مدل با {trained["samples"]} داده آموزش داده شد',
             'next_step': 'get_prediction'
         })
         
+    except OperationCancelled:
+        print("⏹️ STEP 4: train_model cancelled")
+        return cancelled_response()
     except Exception as e:
         print(f"❌ STEP 4: train_model failed - {e}")
         return jsonify({
@@ -234,32 +444,33 @@ def get_prediction():
     """Get final price prediction"""
     try:
         print("🔵 STEP 5: Starting get_prediction")
-        session_id = session.get('session_id')
-        if not session_id or session_id not in pipeline_data:
+        session_id, data = load_pipeline_data()
+        if not data:
             return jsonify({'success': False, 'error': 'جلسه کاربر یافت نشد'})
         
-        data = pipeline_data[session_id]
         user_data = data['user_data']
         model_file = data.get('model_file')
         
-        if not model_file or not os.path.exists(model_file):
-            return jsonify({'success': False, 'error': 'فایل مدل یافت نشد'})
-        
-        # Predict price
-        predicted_price = predict_user_price(model_file, user_data)
+        # The training step already predicted with the in-memory model
+        predicted_price = data.get('predicted_price')
+        if not predicted_price:
+            if not model_file or not os.path.exists(model_file):
+                return jsonify({'success': False, 'error': 'فایل مدل یافت نشد'})
+            from core.train_user_model import predict_user_price
+            predicted_price = predict_user_price(model_file, user_data)
         
         if not predicted_price:
             return jsonify({'success': False, 'error': 'پیش‌بینی قیمت با شکست مواجه شد'})
         
-        data['current_step'] = 'completed'
-        data['predicted_price'] = predicted_price
+        predicted_price = float(predicted_price)
         
-        # Save to search history
-        save_search_history(user_data, predicted_price, data.get('samples_count', 0))
+        # Save to search history and the result cache
+        save_search_history(user_data, predicted_price, data.get('samples_count', 0), 'scrape')
+        prediction_cache.put(user_data, predicted_price, data.get('samples_count', 0))
+        session_progress(session_id)('prediction_done', {'predicted_price': predicted_price})
         
         # Clean up temporary data after successful completion
-        if session_id in pipeline_data:
-            del pipeline_data[session_id]
+        pipeline_store.delete(pipeline_key(session_id))
         
         print("✅ STEP 5: Prediction completed successfully")
         return jsonify({
@@ -280,9 +491,8 @@ def get_prediction():
 @app.route('/status')
 def get_status():
     """Get current progress status"""
-    session_id = session.get('session_id')
-    if session_id and session_id in pipeline_data:
-        data = pipeline_data[session_id]
+    session_id, data = load_pipeline_data()
+    if data:
         return jsonify({
             'current_step': data.get('current_step', 'not_started'),
             'user_data': data.get('user_data'),
@@ -291,39 +501,162 @@ def get_status():
         })
     return jsonify({'current_step': 'not_started'})
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics of this worker process"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Prediction cache hit ratio and answer age for this worker"""
+    return jsonify(prediction_cache.stats())
+
+@app.route('/storage/stats')
+def storage_stats():
+    """Disk budget, last scan and bytes reclaimed by eviction in this worker"""
+    from core.storage import get_storage_manager
+    return jsonify(get_storage_manager().stats())
+
+@app.route('/prewarm/stats')
+def prewarm_stats():
+    """Pre-warming settings and the last round of this worker"""
+    return jsonify(prewarmer.stats())
+
+@app.route('/history/popular')
+def history_popular():
+    """Most requested car models of the last `days` days (default 7) from the search history"""
+    from core.history_store import get_history_store
+    days = request.args.get('days', 7, type=float)
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    since = time.time() - days * 24 * 3600 if days > 0 else None
+    store = get_history_store()
+    return jsonify({
+        'days': days,
+        'searches': store.count(since=since),
+        'models': store.most_requested(limit, since=since)
+    })
+
+@app.route('/progress/stream')
+def progress_stream():
+    """Stream pipeline progress events to the browser as Server-Sent Events"""
+    session_id = session.get('session_id')
+    if not session_id:
+        return jsonify({'success': False, 'error': 'جلسه کاربر یافت نشد'}), 404
+    
+    try:
+        cursor = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        cursor = 0
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if not progress_streams.acquire(blocking=False):
+        # An empty stream makes EventSource reconnect later instead of giving up
+        return Response(f'retry: {PROGRESS_BUSY_RETRY}\n\n', mimetype='text/event-stream', headers=headers)
+    
+    def generate():
+        nonlocal cursor
+        # Short streams free the thread, EventSource resumes from Last-Event-ID
+        deadline = time.time() + PROGRESS_STREAM_MAX_SECONDS
+        last_sent = time.time()
+        last_state_check = 0
+        finished = False
+        yield 'retry: 2000\n\n'
+        while time.time() < deadline:
+            events, cursor = pipeline_store.read_events(events_key(session_id), cursor)
+            for event in events:
+                payload = json.dumps(event['data'], ensure_ascii=False)
+                yield f"id: {cursor}\nevent: {event['event']}\ndata: {payload}\n\n"
+                last_sent = time.time()
+                if event['event'] == 'prediction_done':
+                    return
+            if finished:
+                return
+            
+            # Finished, cancelled or expired pipelines end the stream after one last read
+            if time.time() - last_state_check > 2:
+                last_state_check = time.time()
+                finished = pipeline_store.get(pipeline_key(session_id)) is None
+                if finished:
+                    continue
+            
+            if time.time() - last_sent > 15:
+                yield ': keep-alive\n\n'
+                last_sent = time.time()
+            time.sleep(PROGRESS_POLL_INTERVAL)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+    response.call_on_close(progress_streams.release)
+    return response
+
 @app.route('/cleanup', methods=['POST'])
 def cleanup():
-    """Clean up session data"""
+    """Clean up session data and stop any pipeline step still running for it"""
     session_id = session.get('session_id')
-    if session_id and session_id in pipeline_data:
-        del pipeline_data[session_id]
+    if session_id:
+        pipeline_store.set(cancel_key(session_id), {'cancelled_at': time.time()}, ttl=STATE_TTL)
+        pipeline_store.delete(pipeline_key(session_id))
+        pipeline_store.delete(events_key(session_id))
     session.clear()
     return jsonify({'success': True})
 
-def save_search_history(user_data, predicted_price, samples_count):
-    """Save search history"""
-    try:
-        history_file = get_search_history_file()
-        
-        history_data = {
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'brand_model': user_data['brand_model'],
-            'year_model': user_data['year_model'],
-            'mileage': user_data['mileage'],
-            'gearbox': user_data['gearbox'],
-            'fuel_type': user_data['fuel_type'],
-            'predicted_price': predicted_price,
-            'training_samples': samples_count
-        }
-        
-        df = pd.DataFrame([history_data])
-        
-        if os.path.exists(history_file):
-            df.to_csv(history_file, mode='a', header=False, index=False, encoding='utf-8-sig')
-        else:
-            df.to_csv(history_file, index=False, encoding='utf-8-sig')
-    except Exception as e:
-        print(f"Error saving search history: {e}")
+@app.route('/api/v1/price', methods=['POST'])
+def api_price():
+    """Price a batch of cars in one request: cached answers now, job handles for the rest"""
+    payload = request.get_json(silent=True)
+    cars = payload.get('cars') if isinstance(payload, dict) else payload
+    if not isinstance(cars, list) or not cars:
+        return jsonify({'success': False, 'error': 'لیست خودروها (cars) ارسال نشده است'}), 400
+    if len(cars) > API_MAX_BATCH:
+        return jsonify({'success': False, 'error': f'حداکثر {API_MAX_BATCH} خودرو در هر درخواست'}), 413
+    
+    # Jobs either fit a latency budget (seconds) or collect a fixed depth of ads
+    options = {}
+    if isinstance(payload, dict):
+        for name, limit in (('budget', 3600), ('depth', MAX_BUDGET_ADS)):
+            if payload.get(name) is None:
+                continue
+            try:
+                value = int(payload[name])
+            except (TypeError, ValueError):
+                value = 0
+            if not 0 < value <= limit:
+                return jsonify({'success': False, 'error': f'مقدار {name} باید بین 1 و {limit} باشد'}), 400
+            options[name] = value
+    if profiling_requested():
+        options['profile'] = True
+    
+    results = []
+    for index, car in enumerate(cars):
+        user_data, error = validate_user_data(car)
+        if error:
+            results.append({'index': index, 'status': 'invalid', 'error': error})
+            continue
+        
+        answer = quick_prediction(user_data, prediction_cache, model_registry, global_model_file)
+        if answer:
+            save_search_history(user_data, answer['predicted_price'], answer['samples'], answer['source'])
+            results.append({'index': index, 'status': 'done', 'car_info': user_data, **answer})
+            continue
+        
+        job = pricing_jobs.submit(user_data, options)
+        results.append({
+            'index': index,
+            'status': job['status'],
+            'car_info': user_data,
+            'job_id': job['job_id'],
+            'status_url': f"/api/v1/jobs/{job['job_id']}"
+        })
+    
+    return jsonify({'success': True, 'results': results})
+
+@app.route('/api/v1/jobs/<job_id>')
+def api_job(job_id):
+    """Status and result of a queued pricing job"""
+    job = pricing_jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'کار مورد نظر یافت نشد'}), 404
+    return jsonify({'success': True, **job})
 
 if __name__ == '__main__':
+    start_background_tasks()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
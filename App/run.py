@@ -5,7 +5,7 @@ import os
 # Add the parent directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from App.app import app
+from App.app import app, start_background_tasks
 
 if __name__ == '__main__':
     print("🚀 Starting Car Price Predictor Web App...")
@@ -14,4 +14,5 @@ if __name__ == '__main__':
     print("   - Web App: /App")
     print("   - Core Logic: /core") 
     print("   - Data: /Data")
+    start_background_tasks()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
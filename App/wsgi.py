@@ -1,4 +1,6 @@
-from app import app
+from app import app, start_background_tasks
+
+start_background_tasks()
 
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
@@ -0,0 +1,180 @@
+# benchmarks/bench_browser_profiles.py - FULL VS LEAN BROWSER PROFILE BENCHMARK
+"""Load the same ad pages with every browser profile against a local fixture server.
+
+    python benchmarks/bench_browser_profiles.py --pages 20 --asset-delay 0.05 --output profiles.json
+
+Needs Chrome. The server serves a Divar-like ad page that pulls images,
+fonts, a video and map tiles, each asset slowed down by --asset-delay, and
+counts what every profile actually requested.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.browser import BROWSER_PROFILES, create_driver
+
+AD_PAGE = """<!DOCTYPE html>
+<html lang="fa" dir="rtl"><head><meta charset="utf-8"><title>پژو 206 تیپ 2</title>
+<style>@font-face {{ font-family: Vazir; src: url('/static/vazir.woff2') format('woff2'); }}
+body {{ font-family: Vazir, sans-serif; }}</style>
+<script src="/static/analytics.js" async></script>
+</head><body>
+<div class="kt-base-row"><p class="kt-base-row__title">برند و تیپ</p>
+<a class="kt-unexpandable-row__action">پژو 206 تیپ 2</a></div>
+<table class="kt-group-row"><tbody><tr class="kt-group-row__data-row">
+<td class="kt-group-row-item__value">۱۲۰٬۰۰۰</td><td class="kt-group-row-item__value">۱۳۹۸</td>
+<td class="kt-group-row-item__value">سفید</td></tr></tbody></table>
+<div class="kt-base-row"><p class="kt-base-row__title">گیربکس</p>
+<p class="kt-unexpandable-row__value">دنده ای</p></div>
+<div class="kt-base-row"><p class="kt-base-row__title">نوع سوخت</p>
+<p class="kt-unexpandable-row__value">بنزینی</p></div>
+<div class="kt-base-row"><p class="kt-base-row__title">قیمت پایه</p>
+<p class="kt-unexpandable-row__value">۶۵۰٬۰۰۰٬۰۰۰ تومان</p></div>
+{images}
+<video src="/static/clip.mp4" autoplay muted></video>
+{tiles}
+</body></html>
+"""
+
+ASSET_TYPES = {
+    '.jpg': 'image/jpeg', '.woff2': 'font/woff2', '.mp4': 'video/mp4', '.png': 'image/png',
+    '.js': 'application/javascript'
+}
+
+class FixtureServer:
+    """Local HTTP server for one ad page and its assets, counting requests and bytes"""
+
+    def __init__(self, images=12, tiles=6, asset_kb=80, asset_delay=0.05):
+        self.asset_bytes = b'\0' * (asset_kb * 1024)
+        self.asset_delay = asset_delay
+        self.page = AD_PAGE.format(
+            images='\n'.join(f'<img src="/static/photo-{i}.jpg">' for i in range(images)),
+            tiles='\n'.join(f'<img src="/tile/{i}.png">' for i in range(tiles))
+        ).encode('utf-8')
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def _handler(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/v/'):
+                    body, content_type = fixture.page, 'text/html; charset=utf-8'
+                else:
+                    time.sleep(fixture.asset_delay)
+                    extension = os.path.splitext(self.path)[1]
+                    body = b'' if extension == '.js' else fixture.asset_bytes
+                    content_type = ASSET_TYPES.get(extension, 'application/octet-stream')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(body)
+                with fixture._lock:
+                    fixture.requests += 1
+                    fixture.bytes_sent += len(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.bytes_sent = 0
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+def measure(profile, server, pages):
+    """Median page load time, requests, bytes and JS heap per page for one profile"""
+    from bs4 import BeautifulSoup
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from core.scrap_specific_ads import extract_ad_data
+
+    started = time.perf_counter()
+    driver = create_driver(profile)
+    startup = time.perf_counter() - started
+    server.reset()
+    timings = []
+    heap = []
+    parsed = 0
+    try:
+        driver.execute_cdp_cmd('Performance.enable', {})
+        for index in range(pages):
+            url = f"{server.base_url}/v/peugeot-206/AaBbCc{index:04d}"
+            started = time.perf_counter()
+            driver.get(url)
+            WebDriverWait(driver, 8).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+            row = extract_ad_data(BeautifulSoup(driver.page_source, 'html.parser'), url)
+            timings.append(time.perf_counter() - started)
+            parsed += bool(row[0] and row[6])
+            metrics = driver.execute_cdp_cmd('Performance.getMetrics', {})['metrics']
+            heap.extend(metric['value'] for metric in metrics if metric['name'] == 'JSHeapUsedSize')
+    finally:
+        driver.quit()
+    return {
+        'profile': profile,
+        'pages': pages,
+        'parsed': parsed,
+        'startup_seconds': round(startup, 3),
+        'page_seconds_median': round(statistics.median(timings), 4),
+        'page_seconds_max': round(max(timings), 4),
+        'requests_per_page': round(server.requests / pages, 1),
+        'kb_per_page': round(server.bytes_sent / pages / 1024, 1),
+        'js_heap_mb_median': round(statistics.median(heap) / 2 ** 20, 2) if heap else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--images', type=int, default=12)
+    parser.add_argument('--asset-kb', type=int, default=80)
+    parser.add_argument('--asset-delay', type=float, default=0.05, help='seconds the server waits per asset')
+    parser.add_argument('--profiles', default=','.join(BROWSER_PROFILES))
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    with FixtureServer(images=args.images, asset_kb=args.asset_kb, asset_delay=args.asset_delay) as server:
+        results = [measure(profile, server, args.pages) for profile in args.profiles.split(',')]
+
+    report = {'python': sys.version.split()[0], 'asset_delay': args.asset_delay, 'results': results}
+    by_profile = {result['profile']: result for result in results}
+    if 'full' in by_profile and 'lean' in by_profile:
+        full, lean = by_profile['full'], by_profile['lean']
+        report['lean_speedup'] = round(full['page_seconds_median'] / max(lean['page_seconds_median'], 1e-6), 2)
+        report['lean_bandwidth_saved'] = round(1 - lean['kb_per_page'] / max(full['kb_per_page'], 1e-6), 3)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+    # Both profiles must still read the ad fields
+    sys.exit(0 if all(result['parsed'] == result['pages'] for result in results) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# benchmarks/bench_e2e_throughput.py - END-TO-END PIPELINE THROUGHPUT ON THE FAKE DIVAR SERVER
+"""Run whole prediction pipelines against a local fake Divar at several concurrency levels.
+
+    python benchmarks/bench_e2e_throughput.py --cars 8 --concurrency 1,2,4 --ad-latency 0.2 --output e2e.json
+
+Needs Chrome. Every level runs --cars pipelines (search, scrape, train,
+predict) with that many running at once and browser slots to match, and
+reports wall time, pipelines per minute, ads per second and the server's
+request counters. Data and model files, the model registry and the disk
+budget scans all stay in a temporary directory, Data/ is left untouched.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from benchmarks.fake_divar_server import FakeDivarServer
+
+CARS = ['پژو 206 تیپ 2', 'پژو 206 تیپ 5', 'پراید 131 SE', 'سمند LX EF7', 'پژو پارس سال', 'تیبا 2 EX']
+
+def user_data(index):
+    return {'brand_model': CARS[index % len(CARS)], 'year_model': 1395 + index % 5, 'mileage': 80000,
+            'gearbox': 'دنده ای', 'fuel_type': 'بنزینی'}
+
+def run_level(concurrency, cars, max_ads, workdir):
+    # core is imported after DIVAR_HOME_URL is set, see main()
+    from core.browser import BrowserLimiter
+    import core.browser
+    import core.save_urls
+    import core.scrap_specific_ads
+    from core.pipeline import PredictionPipeline
+    from core.model_registry import ModelRegistry
+    from core.storage import StorageManager
+
+    registry = ModelRegistry(os.path.join(workdir, f'registry_{concurrency}.sqlite'))
+    storage = StorageManager(workdir, workdir, registry=registry)
+    limiter = BrowserLimiter(slots=concurrency, lock_dir=os.path.join(workdir, f'locks_{concurrency}'))
+    for module in (core.browser, core.save_urls, core.scrap_specific_ads):
+        module.browser_limiter = limiter
+
+    def run_one(index):
+        pipeline = PredictionPipeline(user_data(index), max_ads=max_ads, max_scrolls=20, progress=lambda e, d: None,
+                                      convergence_tolerance=0, skip_seen=False, registry=registry, storage=storage)
+        pipeline.data_file = os.path.join(workdir, f'ads_{concurrency}_{index}.csv')
+        pipeline.model_file = os.path.join(workdir, f'model_{concurrency}_{index}.joblib')
+        started = time.perf_counter()
+        result = pipeline.run()
+        pipeline.wait_persisted()
+        return {'seconds': time.perf_counter() - started, 'ads': len(pipeline.rows or []),
+                'ok': bool(result), 'timings': pipeline.timings}
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            runs = list(executor.map(run_one, range(cars)))
+    wall = time.perf_counter() - started
+
+    ads = sum(run['ads'] for run in runs)
+    return {
+        'concurrency': concurrency,
+        'pipelines': cars,
+        'succeeded': sum(run['ok'] for run in runs),
+        'wall_seconds': round(wall, 2),
+        'pipelines_per_minute': round(cars / wall * 60, 2),
+        'ads_per_second': round(ads / wall, 2),
+        'pipeline_seconds_max': round(max(run['seconds'] for run in runs), 2),
+        'stage_seconds_mean': {
+            stage: round(sum(run['timings'].get(stage, 0) for run in runs) / cars, 2)
+            for stage in ('search', 'scrape', 'train', 'predict')
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cars', type=int, default=8, help='pipelines per concurrency level')
+    parser.add_argument('--concurrency', default='1,2,4')
+    parser.add_argument('--max-ads', type=int, default=30)
+    parser.add_argument('--feed-pages', type=int, default=6)
+    parser.add_argument('--page-latency', type=float, default=0.1)
+    parser.add_argument('--ad-latency', type=float, default=0.2)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    server = FakeDivarServer(feed_pages=args.feed_pages, page_latency=args.page_latency,
+                             ad_latency=args.ad_latency, error_rate=args.error_rate)
+    # Must happen before core.config is imported
+    os.environ['DIVAR_HOME_URL'] = server.base_url
+    os.environ.pop('DIVAR_SEARCH_URL', None)
+    os.environ.setdefault('SEEN_ADS_FILE', os.path.join(tempfile.gettempdir(), 'bench_seen_ads.bloom'))
+
+    results = []
+    with server, tempfile.TemporaryDirectory() as workdir:
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            before = dict(server.stats)
+            result = run_level(concurrency, args.cars, args.max_ads, workdir)
+            result['requests'] = {kind: server.stats[kind] - before[kind] for kind in server.stats}
+            results.append(result)
+
+    report = {
+        'python': sys.version.split()[0],
+        'server': {'feed_pages': args.feed_pages, 'page_latency': args.page_latency,
+                   'ad_latency': args.ad_latency, 'error_rate': args.error_rate},
+        'results': results
+    }
+    if len(results) > 1:
+        report['scaling'] = round(results[-1]['pipelines_per_minute'] / max(results[0]['pipelines_per_minute'], 1e-9), 2)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+    sys.exit(0 if all(result['succeeded'] for result in results) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_training_scaling.py - TRAINING STAGES AT 10^4-10^6 ROWS
+"""Time and peak memory of every training stage on synthetic datasets of growing size.
+
+    python benchmarks/bench_training_scaling.py --sizes 10000,100000 --output scaling.json
+    python benchmarks/bench_training_scaling.py --sizes 10000,100000,1000000 --no-fit
+
+Stages: read_csv, clean_and_preprocess_data,
+preprocess_features_with_engineering, fit (create_optimized_model) and
+predict. Peak memory is measured with tracemalloc, which also counts numpy
+and pandas buffers. `growth` is the exponent k in time ∝ rows^k between
+consecutive sizes: ~1 is linear, clearly above 1 marks a hot spot.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from benchmarks.synthetic_ads import write_ads_csv
+
+FEATURE_COLUMNS = ['year_model', 'mileage', 'gearbox', 'fuel_type']
+
+def measure(function):
+    """(result, seconds, peak MB) of function(), its prints are discarded"""
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = function()
+            seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+def run_size(rows, data_file, fit=True):
+    import pandas as pd
+    from core.train_user_model import (CSV_DTYPES, clean_and_preprocess_data, preprocess_features_with_engineering,
+                                       create_optimized_model)
+
+    stages = {}
+
+    def record(stage, function):
+        result, seconds, peak_mb = measure(function)
+        stages[stage] = {'seconds': round(seconds, 4), 'peak_mb': round(peak_mb, 1)}
+        return result
+
+    df = record('read_csv', lambda: pd.read_csv(data_file, encoding='utf-8-sig', dtype=CSV_DTYPES))
+    df_clean, info = record('clean_and_preprocess_data', lambda: clean_and_preprocess_data(df))
+    X, _ = record('preprocess_features_with_engineering',
+                  lambda: preprocess_features_with_engineering(df_clean[FEATURE_COLUMNS], df_clean['price']))
+    if fit:
+        y = df_clean['price'].loc[X.index]
+        model = record('fit', lambda: create_optimized_model(len(X)).fit(X, y))
+        record('predict', lambda: model.predict(X.head(1000)))
+
+    return {
+        'rows': rows,
+        'rows_after_cleaning': int(info['final_samples']),
+        'dataframe_mb': round(info['memory_before_mb'], 1),
+        'clean_dataframe_mb': round(info['memory_after_mb'], 1),
+        'stages': stages
+    }
+
+def add_growth(results):
+    """Scaling exponent of each stage between consecutive sizes"""
+    for previous, current in zip(results, results[1:]):
+        size_ratio = math.log(current['rows'] / previous['rows'])
+        for stage, timing in current['stages'].items():
+            before = previous['stages'].get(stage)
+            if before and before['seconds'] > 0 and timing['seconds'] > 0:
+                timing['growth'] = round(math.log(timing['seconds'] / before['seconds']) / size_ratio, 2)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-fit', action='store_true', help='skip model fitting and prediction')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            data_file = os.path.join(workdir, f'ads_{rows}.csv')
+            started = time.perf_counter()
+            write_ads_csv(data_file, rows, seed=args.seed)
+            generate_seconds = time.perf_counter() - started
+            result = run_size(rows, data_file, fit=not args.no_fit)
+            result['generate_seconds'] = round(generate_seconds, 2)
+            results.append(result)
+            os.remove(data_file)
+    add_growth(results)
+
+    text = json.dumps({'python': sys.version.split()[0], 'results': results}, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+if __name__ == '__main__':
+    main()
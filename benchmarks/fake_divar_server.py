@@ -0,0 +1,273 @@
+# benchmarks/fake_divar_server.py - LOCAL DIVAR STAND-IN FOR END-TO-END TESTS
+"""Serve an infinite-scroll search feed and ad pages in Divar's markup on localhost.
+
+    python benchmarks/fake_divar_server.py --port 8765 --feed-pages 10 --ad-latency 0.2 --error-rate 0.05
+    DIVAR_HOME_URL=http://127.0.0.1:8765 python main_pipeline.py
+
+Search pages (/s/<region>/car?q=...&sort=...) load more cards from
+/api/feed as the page is scrolled and pause behind an "آگهی‌های بیشتر"
+button every --show-more-every feed pages. Ad pages (/v/<title>/<token>)
+use the kt-base-row/kt-group-row markup extract_ad_data reads, with
+prices that follow year and mileage. Feed and ad requests can be slowed
+down and fail at a configurable rate; /__stats returns request counters.
+"""
+import argparse
+import hashlib
+import html
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+TOKEN_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+PERSIAN_DIGITS = str.maketrans('0123456789', '۰۱۲۳۴۵۶۷۸۹')
+COLORS = ['سفید', 'مشکی', 'نقره‌ای', 'خاکستری', 'آبی']
+GEARBOXES = ['دنده ای', 'دنده ای', 'دنده ای', 'اتوماتیک']
+FUEL_TYPES = ['بنزینی', 'بنزینی', 'دوگانه سوز']
+
+SEARCH_PAGE = """<!DOCTYPE html>
+<html lang="fa" dir="rtl"><head><meta charset="utf-8"><title>{query} | دیوار</title>
+<style>article {{ height: 180px; border-bottom: 1px solid #eee; }} #show-more {{ display: none; }}</style>
+</head><body>
+<header><a href="/">دیوار</a><a href="/s/{region}/car">خودرو</a><a href="/my-divar/login">ورود</a></header>
+<main class="browse-post-list">
+{cards}
+</main>
+<button id="show-more" data-testid="show-more-button">آگهی‌های بیشتر</button>
+<script>
+var page = 1, loading = false, paused = false, hasMore = {has_more};
+var button = document.getElementById('show-more');
+function loadMore() {{
+  if (loading || paused || !hasMore) return;
+  loading = true;
+  fetch('/api/feed?page=' + page + '&{params}')
+    .then(function (r) {{ if (!r.ok) throw r.status; return r.json(); }})
+    .then(function (data) {{
+      document.querySelector('main').insertAdjacentHTML('beforeend', data.html);
+      page += 1;
+      hasMore = data.has_more;
+      if (data.show_more && hasMore) {{ paused = true; button.style.display = 'block'; }}
+    }})
+    .catch(function () {{}})
+    .finally(function () {{ loading = false; }});
+}}
+window.addEventListener('scroll', function () {{
+  if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 600) loadMore();
+}});
+button.addEventListener('click', function () {{ button.style.display = 'none'; paused = false; loadMore(); }});
+</script>
+</body></html>
+"""
+
+CARD = """<article class="kt-post-card">
+  <a class="kt-post-card__action" href="/v/{slug}/{token}">
+    <h2 class="kt-post-card__title">{title}</h2>
+    <div class="kt-post-card__description">{mileage} کیلومتر</div>
+    <div class="kt-post-card__description">{price} تومان</div>
+  </a>
+</article>"""
+
+AD_PAGE = """<!DOCTYPE html>
+<html lang="fa" dir="rtl"><head><meta charset="utf-8"><title>{title} | دیوار</title></head><body>
+<main class="kt-container"><div class="kt-col-5">
+<h1 class="kt-page-title__title">{title}</h1>
+<table class="kt-group-row"><tbody><tr class="kt-group-row__data-row">
+<td class="kt-group-row-item__value">{mileage}</td>
+<td class="kt-group-row-item__value">{year}</td>
+<td class="kt-group-row-item__value">{color}</td>
+</tr></tbody></table>
+{rows}
+</div></main></body></html>
+"""
+
+BASE_ROW = """<div class="kt-base-row kt-base-row--large kt-unexpandable-row">
+<div class="kt-base-row__start"><p class="kt-base-row__title kt-unexpandable-row__title">{label}</p></div>
+<div class="kt-base-row__end"><p class="kt-unexpandable-row__value">{value}</p></div>
+</div>"""
+
+def persian_number(value):
+    return f'{value:,}'.translate(PERSIAN_DIGITS).replace(',', '٬')
+
+def ad_token(query, index):
+    digest = hashlib.sha256(f'{query}|{index}'.encode('utf-8')).digest()
+    return ''.join(TOKEN_CHARS[byte % len(TOKEN_CHARS)] for byte in digest[:8])
+
+def ad_spec(token):
+    """Deterministic car of an ad token, prices follow year and mileage"""
+    rng = random.Random(token)
+    year = rng.randint(1385, 1400)
+    mileage = rng.randint(0, 60) * 5000
+    price = (300 + (year - 1385) * 35 - mileage // 5000 * 2 + rng.randint(-25, 25)) * 1000000
+    return {
+        'year': year, 'mileage': mileage, 'price': max(price, 50000000), 'color': rng.choice(COLORS),
+        'gearbox': rng.choice(GEARBOXES), 'fuel_type': rng.choice(FUEL_TYPES)
+    }
+
+class FakeDivarServer:
+    """Threaded HTTP server standing in for divar.ir, use as a context manager or with start()/stop()"""
+
+    def __init__(self, host='127.0.0.1', port=0, feed_pages=10, page_size=24, show_more_every=3,
+                 page_latency=0.0, ad_latency=0.0, error_rate=0.0, seed=0):
+        self.feed_pages = feed_pages
+        self.page_size = page_size
+        self.show_more_every = show_more_every
+        self.page_latency = page_latency
+        self.ad_latency = ad_latency
+        self.error_rate = error_rate
+        self.stats = {'search': 0, 'feed': 0, 'ad': 0, 'errors': 0, 'not_found': 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, kind):
+        with self._lock:
+            self.stats[kind] += 1
+
+    def _fails(self):
+        with self._lock:
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.stats['errors'] += 1
+        return failed
+
+    def feed_cards(self, query, region, sort, page):
+        """Cards of one feed page; every region/sort lists the same ads in its own order"""
+        total = self.feed_pages * self.page_size
+        order = list(range(total))
+        random.Random(f'{region}|{sort}').shuffle(order)
+        slug = quote(query.replace(' ', '-'))
+        cards = []
+        for index in order[page * self.page_size:(page + 1) * self.page_size]:
+            token = ad_token(query, index)
+            spec = ad_spec(token)
+            cards.append(CARD.format(slug=slug, token=token, title=html.escape(f"{query} مدل {spec['year']}"),
+                                     mileage=persian_number(spec['mileage']), price=persian_number(spec['price'])))
+        return '\n'.join(cards)
+
+    def search_page(self, region, params):
+        query = params.get('q', [''])[0]
+        sort = params.get('sort', [''])[0]
+        return SEARCH_PAGE.format(
+            query=html.escape(query), region=html.escape(region), cards=self.feed_cards(query, region, sort, 0),
+            has_more='true' if self.feed_pages > 1 else 'false',
+            params=f"q={quote(query)}&region={quote(region)}&sort={quote(sort)}"
+        )
+
+    def feed_page(self, params):
+        page = int(params.get('page', ['1'])[0])
+        query, region, sort = (params.get(name, [''])[0] for name in ('q', 'region', 'sort'))
+        return {
+            'html': self.feed_cards(query, region, sort, page) if page < self.feed_pages else '',
+            'has_more': page + 1 < self.feed_pages,
+            'show_more': bool(self.show_more_every) and (page + 1) % self.show_more_every == 0
+        }
+
+    def ad_page(self, title, token):
+        spec = ad_spec(token)
+        brand_model = title.replace('-', ' ')
+        rows = [
+            BASE_ROW.format(label='برند و تیپ', value=html.escape(brand_model)),
+            BASE_ROW.format(label='نوع سوخت', value=spec['fuel_type']),
+            BASE_ROW.format(label='گیربکس', value=spec['gearbox']),
+            BASE_ROW.format(label='قیمت پایه', value=f"{persian_number(spec['price'])} تومان")
+        ]
+        return AD_PAGE.format(title=html.escape(f"{brand_model} مدل {spec['year']}"),
+                              mileage=persian_number(spec['mileage']),
+                              year=str(spec['year']).translate(PERSIAN_DIGITS), color=spec['color'],
+                              rows='\n'.join(rows))
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                parts = [unquote(part) for part in parsed.path.strip('/').split('/')]
+                params = parse_qs(parsed.query)
+
+                if len(parts) == 3 and parts[0] == 's' and parts[2] == 'car':
+                    fake._count('search')
+                    time.sleep(fake.page_latency)
+                    return self.reply(200, fake.search_page(parts[1], params))
+                if parts[:2] == ['api', 'feed']:
+                    fake._count('feed')
+                    time.sleep(fake.page_latency)
+                    if fake._fails():
+                        return self.reply(503, 'unavailable')
+                    return self.reply(200, json.dumps(fake.feed_page(params), ensure_ascii=False),
+                                      'application/json; charset=utf-8')
+                if len(parts) == 3 and parts[0] == 'v':
+                    fake._count('ad')
+                    time.sleep(fake.ad_latency)
+                    if fake._fails():
+                        return self.reply(502, 'bad gateway')
+                    return self.reply(200, fake.ad_page(parts[1], parts[2]))
+                if parts == ['__stats']:
+                    with fake._lock:
+                        return self.reply(200, json.dumps(fake.stats), 'application/json')
+                fake._count('not_found')
+                return self.reply(404, 'not found')
+
+            def reply(self, status, body, content_type='text/html; charset=utf-8'):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--feed-pages', type=int, default=10, help='feed pages per search, page 0 included')
+    parser.add_argument('--page-size', type=int, default=24, help='cards per feed page')
+    parser.add_argument('--show-more-every', type=int, default=3, help='feed pages between "show more" buttons')
+    parser.add_argument('--page-latency', type=float, default=0.0, help='seconds per search/feed request')
+    parser.add_argument('--ad-latency', type=float, default=0.0, help='seconds per ad page')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of feed/ad requests that fail')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeDivarServer(args.host, args.port, args.feed_pages, args.page_size, args.show_more_every,
+                             args.page_latency, args.ad_latency, args.error_rate, args.seed)
+    print(f"🧪 Fake Divar on {server.base_url}, point the scrapers at it with:")
+    print(f"   export DIVAR_HOME_URL={server.base_url}")
+    with server:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
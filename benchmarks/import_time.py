@@ -0,0 +1,100 @@
+# benchmarks/import_time.py - WORKER COLD-START BENCHMARK
+"""Measure how long a fresh interpreter takes to import the web app and core modules.
+
+    python benchmarks/import_time.py --runs 5 --max-seconds 1.0 --output import_time.json
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules a gunicorn worker should not load until a pipeline step needs them
+HEAVY_MODULES = ['selenium', 'webdriver_manager', 'bs4', 'pandas', 'numpy', 'sklearn', 'joblib']
+
+TARGETS = ['App.app', 'core.pipeline', 'core.train_user_model']
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(repr((elapsed, heavy)))
+"""
+
+def parse_importtime(stderr, top=10):
+    """Top modules by self time from `python -X importtime` output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return [{'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cum_us / 1000}
+            for self_us, cum_us, name in rows[:top]]
+
+def measure(module, runs):
+    timings = []
+    heavy = []
+    hotspots = []
+    for run in range(runs):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=BASE_DIR, capture_output=True, text=True,
+            env=dict(os.environ, PYTHONPATH=BASE_DIR, PYTHONDONTWRITEBYTECODE='1')
+        )
+        wall = time.perf_counter() - started
+        if completed.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+        import_seconds, heavy = ast.literal_eval(completed.stdout.strip().splitlines()[-1])
+        timings.append({'import_seconds': import_seconds, 'process_seconds': wall})
+        if run == 0:
+            hotspots = parse_importtime(completed.stderr)
+    return {
+        'module': module,
+        'runs': runs,
+        'import_seconds_median': statistics.median(t['import_seconds'] for t in timings),
+        'process_seconds_median': statistics.median(t['process_seconds'] for t in timings),
+        'heavy_modules_loaded': heavy,
+        'hotspots': hotspots
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help='fail when importing App.app takes longer than this (median)')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = {
+        'python': sys.version.split()[0],
+        'results': [measure(module, args.runs) for module in TARGETS]
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+    app_result = report['results'][0]
+    failed = False
+    if app_result['heavy_modules_loaded']:
+        print(f"❌ App.app eagerly imports: {', '.join(app_result['heavy_modules_loaded'])}", file=sys.stderr)
+        failed = True
+    if args.max_seconds is not None and app_result['import_seconds_median'] > args.max_seconds:
+        print(f"❌ App.app import took {app_result['import_seconds_median']:.2f}s "
+              f"(limit {args.max_seconds:.2f}s)", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+# benchmarks/offline_pipeline.py - OFFLINE SCRAPE → TRAIN → PREDICT BENCHMARK
+"""Time the parsing, cleaning, training and prediction steps on recorded Divar pages, no network needed.
+
+    python benchmarks/offline_pipeline.py --repeat 3 --output offline.json
+    python benchmarks/offline_pipeline.py --baseline benchmarks/baselines/offline_pipeline.json
+    python benchmarks/offline_pipeline.py --write-baseline benchmarks/baselines/offline_pipeline.json
+
+Pages come from benchmarks/fixtures/ (trimmed copies of a Divar search
+page and ad pages). Larger inputs are made by repeating the recorded cards
+and rows with new tokens and varied values. With --baseline, any case that
+is more than --max-slowdown times slower than its baseline (and slower by
+at least --min-delta seconds) is reported and the exit code is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+FIXTURES_DIR = os.path.join(BASE_DIR, 'benchmarks', 'fixtures')
+AD_FIXTURES = ['ad_page.html', 'ad_page_price_in_text.html']
+
+SIZES = {
+    'extract_urls_robust': [24, 240, 960],     # Ad cards on the search page
+    'extract_ad_data': [10, 100],              # Ad pages parsed
+    'clean_row_data': [1000, 10000],           # Raw rows
+    'clean_and_preprocess_data': [200, 2000, 20000],
+    'train_user_model': [50, 200, 1000],       # Training rows
+    'predict_user_price': [50, 200, 1000]      # Rows the predicting model was trained on
+}
+
+USER_DATA = {'brand_model': 'پژو 206 تیپ 2', 'year_model': 1398, 'mileage': 120000,
+             'gearbox': 'دنده ای', 'fuel_type': 'بنزینی'}
+
+PERSIAN_DIGITS = str.maketrans('0123456789', '۰۱۲۳۴۵۶۷۸۹')
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+class FixtureDriver:
+    """Stands in for the Selenium driver: serves a recorded page and answers the link-collecting script"""
+
+    HREF = re.compile(r'<a\b[^>]*\bhref="([^"]*/v/[^"]*)"')
+
+    def __init__(self, page_source):
+        self.page_source = page_source
+
+    def execute_script(self, script, *args):
+        return [href for href in self.HREF.findall(self.page_source) if '/s/' not in href]
+
+def search_page(cards):
+    """The recorded search page with its ad cards repeated up to `cards` cards"""
+    page = read_fixture('search_page.html')
+    start = page.index('<main class="browse-post-list">') + len('<main class="browse-post-list">')
+    end = page.index('</main>')
+    recorded = page[start:end]
+    recorded_cards = recorded.count('<article')
+    copies = []
+    for copy_index in range(max(1, -(-cards // recorded_cards))):
+        # New tokens per copy, so every card is a different ad
+        copies.append(re.sub(r'/([A-Za-z0-9]{8})(["?])',
+                             lambda m: f'/{m.group(1)[:5]}{copy_index:03d}{m.group(2)}', recorded))
+    return page[:start] + ''.join(copies) + page[end:]
+
+def raw_rows(count, seed=7):
+    """Rows as extract_ad_data returns them (Persian digits, units), varied around the recorded ads"""
+    from bs4 import BeautifulSoup
+    from core.scrap_specific_ads import extract_ad_data
+
+    templates = [extract_ad_data(BeautifulSoup(read_fixture(name), 'html.parser'), name) for name in AD_FIXTURES]
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        row = list(templates[index % len(templates)])
+        year = rng.randint(1388, 1400)
+        mileage = rng.randint(0, 300) * 1000
+        price = (350 + (year - 1388) * 30 - mileage // 4000 + rng.randint(-20, 20)) * 1000000
+        row[1] = str(year).translate(PERSIAN_DIGITS)
+        row[2] = f'{mileage:,}'.translate(PERSIAN_DIGITS).replace(',', '٬')
+        row[6] = f'{price:,} تومان'.translate(PERSIAN_DIGITS).replace(',', '٬')
+        row[8] = f'https://divar.ir/v/peugeot-206/AaBb{index:06d}'
+        rows.append(row)
+    return rows
+
+def clean_rows(count):
+    from core.scrap_specific_ads import clean_row_data
+    return [clean_row_data(row) for row in raw_rows(count)]
+
+def timed(function, repeat):
+    """Median wall time of function() over repeat runs, its prints are discarded"""
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def run_cases(repeat, workdir):
+    from bs4 import BeautifulSoup
+    from core.save_urls import extract_urls_robust
+    from core.scrap_specific_ads import extract_ad_data, clean_row_data, save_ad_rows
+    from core.train_user_model import ads_dataframe, clean_and_preprocess_data, train_user_model, predict_user_price
+
+    results = []
+
+    def record(case, size, seconds, **extra):
+        results.append(dict({'case': case, 'size': size, 'seconds_median': round(seconds, 5)}, **extra))
+
+    for cards in SIZES['extract_urls_robust']:
+        driver = FixtureDriver(search_page(cards))
+        found = len(extract_urls_robust(driver))
+        record('extract_urls_robust', cards, timed(lambda: extract_urls_robust(driver), repeat), ads_found=found)
+
+    pages = [read_fixture(name) for name in AD_FIXTURES]
+    for count in SIZES['extract_ad_data']:
+        def parse_pages():
+            for index in range(count):
+                extract_ad_data(BeautifulSoup(pages[index % len(pages)], 'html.parser'), str(index))
+        record('extract_ad_data', count, timed(parse_pages, repeat))
+
+    for count in SIZES['clean_row_data']:
+        rows = raw_rows(count)
+        record('clean_row_data', count, timed(lambda: [clean_row_data(row) for row in rows], repeat))
+
+    for count in SIZES['clean_and_preprocess_data']:
+        df = ads_dataframe(clean_rows(count))
+        record('clean_and_preprocess_data', count, timed(lambda: clean_and_preprocess_data(df.copy()), repeat))
+
+    for count in SIZES['train_user_model']:
+        data_file = os.path.join(workdir, f'ads_{count}.csv')
+        model_file = os.path.join(workdir, f'model_{count}.joblib')
+        with contextlib.redirect_stdout(io.StringIO()):
+            save_ad_rows(clean_rows(count), data_file)
+        record('train_user_model', count, timed(lambda: train_user_model(data_file, model_file, USER_DATA), repeat))
+
+    for count in SIZES['predict_user_price']:
+        model_file = os.path.join(workdir, f'model_{count}.joblib')
+        with contextlib.redirect_stdout(io.StringIO()):
+            predicted = predict_user_price(model_file, USER_DATA)
+        record('predict_user_price', count, timed(lambda: predict_user_price(model_file, USER_DATA), repeat),
+               predicted_price=float(predicted) if predicted else None)
+
+    return results
+
+def case_key(result):
+    return f"{result['case']}:{result['size']}"
+
+def compare(results, baseline, max_slowdown, min_delta):
+    """Cases slower than baseline × max_slowdown by at least min_delta seconds"""
+    regressions = []
+    for result in results:
+        reference = baseline.get(case_key(result))
+        if reference is None:
+            continue
+        seconds = result['seconds_median']
+        if seconds > reference * max_slowdown and seconds - reference >= min_delta:
+            regressions.append({'case': case_key(result), 'seconds': seconds, 'baseline': reference,
+                                'slowdown': round(seconds / max(reference, 1e-9), 2)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--baseline', help='fail on cases slower than the seconds in this JSON file')
+    parser.add_argument('--write-baseline', help='save this run as the new baseline')
+    parser.add_argument('--max-slowdown', type=float, default=1.5)
+    parser.add_argument('--min-delta', type=float, default=0.005, help='ignore slowdowns below this many seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run_cases(args.repeat, workdir)
+
+    report = {'python': sys.version.split()[0], 'repeat': args.repeat, 'results': results}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['cases']
+        report['max_slowdown'] = args.max_slowdown
+        report['regressions'] = compare(results, baseline, args.max_slowdown, args.min_delta)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    if args.write_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.write_baseline)), exist_ok=True)
+        with open(args.write_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'python': report['python'], 'cases': {case_key(r): r['seconds_median'] for r in results}},
+                      f, indent=2)
+            f.write('\n')
+    print(text)
+
+    for regression in report.get('regressions', []):
+        print(f"❌ {regression['case']}: {regression['seconds']:.4f}s, baseline {regression['baseline']:.4f}s "
+              f"({regression['slowdown']}×)", file=sys.stderr)
+    sys.exit(1 if report.get('regressions') else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/synthetic_ads.py - SYNTHETIC AD DATASET GENERATOR
+"""Write realistic fake ads in the scraper's CSV schema, at any size.
+
+    python benchmarks/synthetic_ads.py --rows 100000 --output /tmp/ads_100k.csv
+
+Rows look like what save_ad_rows writes: Persian model/gearbox/fuel
+values, year and mileage that go together, prices that fall with age and
+mileage. A share of rows gets outliers (typo prices, impossible years or
+mileage) and missing fields, so the cleaning steps have work to do.
+"""
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.scrap_specific_ads import AD_COLUMNS
+
+# (brand and model, price of a new car in millions of toman)
+BRAND_MODELS = [
+    ('پژو 206 تیپ 2', 720), ('پژو 206 تیپ 5', 780), ('پژو 206 SD V8', 800), ('پژو 405 GLX', 650),
+    ('پژو پارس سال', 850), ('پراید 131 SE', 380), ('پراید 111 SE', 400), ('سمند LX EF7', 700),
+    ('دنا پلاس', 1050), ('تیبا 2 EX', 480), ('رانا پلاس', 690), ('کوییک R', 560),
+    ('شاهین G', 890), ('ساینا S', 450), ('هایما S7', 1600), ('تویوتا کمری', 3200)
+]
+COLORS = ['سفید', 'مشکی', 'نقره‌ای', 'خاکستری', 'آبی', 'قرمز', 'نوک‌مدادی']
+CITIES = ['تهران', 'کرج', 'مشهد', 'اصفهان', 'شیراز', 'تبریز']
+CURRENT_YEAR = 1402
+
+def generate_ads(count, seed=0, brand_models=None, outlier_rate=0.02, missing_rate=0.03):
+    """Yield count rows in AD_COLUMNS order"""
+    rng = random.Random(seed)
+    brand_models = brand_models or BRAND_MODELS
+    for index in range(count):
+        brand_model, new_price = rng.choice(brand_models)
+        age = min(int(rng.expovariate(1 / 6)), CURRENT_YEAR - 1380)
+        year = CURRENT_YEAR - age
+        mileage = max(0, int(rng.gauss(15000 * age + 5000, 8000 + 4000 * age)) // 1000 * 1000)
+        gearbox = 'اتوماتیک' if rng.random() < (0.6 if new_price > 1000 else 0.1) else 'دنده ای'
+        fuel_type = 'دوگانه سوز' if rng.random() < 0.15 else 'بنزینی'
+
+        price = new_price * 0.93 ** age * (1 - min(mileage, 400000) / 2000000)
+        price *= 1.12 if gearbox == 'اتوماتیک' else 1.0
+        price *= 0.95 if fuel_type == 'دوگانه سوز' else 1.0
+        price = int(price * math.exp(rng.gauss(0, 0.08))) * 1000000
+
+        row = [brand_model, year, mileage, rng.choice(COLORS), gearbox, fuel_type, price, rng.choice(CITIES),
+               f'https://divar.ir/v/synthetic/Syn{seed % 100:02d}{index:09d}']
+
+        if rng.random() < outlier_rate:
+            kind = rng.randrange(4)
+            if kind == 0:
+                row[6] = price * 10   # Extra zero typed
+            elif kind == 1:
+                row[6] = price // 1000  # Price in millions
+            elif kind == 2:
+                row[1] = rng.choice([1300, 2023])
+            else:
+                row[2] = rng.choice([999999, 1500000])
+        if rng.random() < missing_rate:
+            row[rng.choice([1, 2, 3, 4, 5, 6])] = ''
+        yield row
+
+def write_ads_csv(path, count, **options):
+    """Write count generated rows to path like save_ad_rows does, returns path"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(AD_COLUMNS)
+        writer.writerows(generate_ads(count, **options))
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--outlier-rate', type=float, default=0.02)
+    parser.add_argument('--missing-rate', type=float, default=0.03)
+    args = parser.parse_args()
+
+    write_ads_csv(args.output, args.rows, seed=args.seed, outlier_rate=args.outlier_rate,
+                  missing_rate=args.missing_rate)
+    print(f"✅ {args.rows:,} synthetic ads written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# core/ad_index.py - AD TOKEN CANONICALIZATION AND SEEN-ADS INDEX
+import hashlib
+import math
+import os
+import re
+import struct
+import threading
+from urllib.parse import urlparse
+from core.config import home_url, SEEN_ADS_FILE, SEEN_ADS_CAPACITY, SEEN_ADS_ERROR_RATE
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent saves from several processes may drop a few tokens
+    fcntl = None
+
+# /v/<title>/<token>, relative or on the Divar host, with any query string or fragment
+_AD_HREF = re.compile(
+    r'^(?:https?://(?:www\.)?' + re.escape(urlparse(home_url).netloc) + r')?'
+    r'/v/([^/?#\s]+)/([A-Za-z0-9_-]{6,})/?(?:[?#].*)?$'
+)
+
+def parse_ad_href(href):
+    """(token, canonical URL) for a Divar ad link, None for anything else"""
+    match = _AD_HREF.match(href.strip()) if href else None
+    if match is None:
+        return None
+    title, token = match.groups()
+    return token, f"{home_url}/v/{title}/{token}"
+
+def ad_token(href):
+    """Ad token of a Divar ad link, None when href is not an ad"""
+    parsed = parse_ad_href(href)
+    return parsed[0] if parsed else None
+
+def canonicalize_ad_urls(hrefs):
+    """{token: canonical URL} for the ad links among hrefs, the first link of each ad wins"""
+    ads = {}
+    for href in hrefs:
+        parsed = parse_ad_href(href)
+        if parsed is not None and parsed[0] not in ads:
+            ads[parsed[0]] = parsed[1]
+    return ads
+
+class SeenAds:
+    """Persistent Bloom filter of ad tokens that were already scraped
+
+    Membership can give rare false positives (an unseen ad reported as
+    seen) but never false negatives. Saving ORs the in-memory bits into the
+    file, so workers that save concurrently keep each other's tokens. Once
+    more than `capacity` tokens were added the filter starts over, which
+    keeps the false positive rate near `error_rate`.
+    """
+
+    MAGIC = b'SEEN1'
+    HEADER = struct.Struct('>5sIIQ')  # magic, bit count, hash count, tokens added
+
+    def __init__(self, path=SEEN_ADS_FILE, capacity=SEEN_ADS_CAPACITY, error_rate=SEEN_ADS_ERROR_RATE):
+        self.path = path
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._lock = threading.Lock()
+        self._bits, self.count = self._read()
+        self._dirty = False
+
+    def _positions(self, token):
+        digest = hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+        first, second = struct.unpack('>QQ', digest)
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, token):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(token))
+
+    def add(self, token):
+        with self._lock:
+            if self.count >= self.capacity:
+                self._bits, self.count = bytearray((self.size + 7) // 8), 0
+            for pos in self._positions(token):
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+            self._dirty = True
+
+    def add_many(self, tokens):
+        for token in tokens:
+            if token and token not in self:
+                self.add(token)
+
+    def _read(self):
+        empty = bytearray((self.size + 7) // 8)
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.read(self.HEADER.size)
+                bits = bytearray(f.read())
+        except OSError:
+            return empty, 0
+        if len(header) != self.HEADER.size:
+            return empty, 0
+        magic, size, hashes, count = self.HEADER.unpack(header)
+        if magic != self.MAGIC or size != self.size or hashes != self.hashes or len(bits) != len(empty):
+            return empty, 0  # Written with other settings, start over
+        return bits, count
+
+    def save(self):
+        """Merge the filter into its file, returns False on errors"""
+        with self._lock:
+            if not self._dirty:
+                return True
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                # One lock per filter file, next to it
+                with open(f"{self.path}.lock", 'a') as lock_file:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    disk_bits, disk_count = self._read()
+                    if self.count < self.capacity and disk_count < self.capacity:
+                        self._bits = bytearray(a | b for a, b in zip(self._bits, disk_bits))
+                        self.count = max(self.count, disk_count)
+                    tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(self.HEADER.pack(self.MAGIC, self.size, self.hashes, self.count))
+                        f.write(self._bits)
+                    os.replace(tmp_path, self.path)
+                self._dirty = False
+                return True
+            except Exception as e:
+                print(f"⚠️ خطا در ذخیره فهرست آگهی‌های دیده شده: {e}")
+                return False
+
+_seen_ads = None
+_seen_ads_lock = threading.Lock()
+
+def get_seen_ads():
+    """Process-wide SeenAds loaded from SEEN_ADS_FILE"""
+    global _seen_ads
+    with _seen_ads_lock:
+        if _seen_ads is None:
+            _seen_ads = SeenAds()
+        return _seen_ads
@@ -0,0 +1,201 @@
+# core/browser.py - BROWSER SLOT LIMITER AND DRIVER PROFILES
+import copy
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from core.config import (LOCKS_DIR, BROWSER_SLOTS, BROWSER_QUEUE_LIMIT, BROWSER_QUEUE_TIMEOUT, BROWSER_PROFILE,
+                         get_chrome_options)
+from core.metrics import ACTIVE_DRIVERS, BROWSER_QUEUE
+from core.cancellation import OperationCancelled
+
+try:
+    import fcntl
+except ImportError:  # Windows: slots are only enforced inside one process
+    fcntl = None
+
+class BrowserCapacityError(Exception):
+    """Raised when every browser slot is busy and the waiting queue is full"""
+
+    def __init__(self, message, retry_after, position=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.position = position
+
+class BrowserLimiter:
+    """Bound concurrent Chrome instances across all worker processes of one machine
+
+    Each slot is a lock file held with flock for as long as the browser runs,
+    so a crashed worker releases its slot automatically. Waiters of this
+    process are served in arrival order and told their position and ETA.
+    """
+
+    def __init__(self, slots=BROWSER_SLOTS, queue_limit=BROWSER_QUEUE_LIMIT,
+                 queue_timeout=BROWSER_QUEUE_TIMEOUT, lock_dir=LOCKS_DIR, poll_interval=0.5):
+        self.slots = slots
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self.lock_dir = lock_dir
+        self.poll_interval = poll_interval
+        self.avg_hold_seconds = 60.0
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._held = set()
+
+    def _try_lock(self):
+        """Grab any free slot, returns (index, handle) or None"""
+        for index in range(self.slots):
+            if index in self._held:
+                continue
+            if fcntl is None:
+                return index, None
+            os.makedirs(self.lock_dir, exist_ok=True)
+            handle = open(os.path.join(self.lock_dir, f'browser_slot_{index}.lock'), 'a')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return index, handle
+            except OSError:
+                handle.close()
+        return None
+
+    def eta(self, position):
+        """Seconds until a waiter at position is expected to get a slot"""
+        return int(math.ceil(position / max(self.slots, 1)) * self.avg_hold_seconds)
+
+    def acquire(self, on_wait=None, cancel_token=None):
+        """Wait for a free slot, raising BrowserCapacityError when the queue is full or too slow
+
+        A stopped cancel_token gives up the place in the queue with OperationCancelled.
+        """
+        ticket = object()
+        with self._cond:
+            if len(self._waiters) >= self.queue_limit:
+                position = len(self._waiters) + 1
+                raise BrowserCapacityError('ظرفیت مرورگر تکمیل است، لطفا بعدا تلاش کنید',
+                                           retry_after=self.eta(position), position=position)
+            self._waiters.append(ticket)
+            BROWSER_QUEUE.inc()
+            deadline = time.time() + self.queue_timeout
+            last_position = None
+            try:
+                while True:
+                    position = self._waiters.index(ticket) + 1
+                    if position == 1:
+                        slot = self._try_lock()
+                        if slot is not None:
+                            self._held.add(slot[0])
+                            ACTIVE_DRIVERS.inc()
+                            return slot + (time.time(),)
+                    if position != last_position and on_wait is not None:
+                        on_wait(position, self.eta(position))
+                    last_position = position
+                    if cancel_token is not None and cancel_token.stopped:
+                        raise OperationCancelled('browser_queue')
+                    if time.time() >= deadline:
+                        raise BrowserCapacityError('زمان انتظار برای مرورگر به پایان رسید',
+                                                   retry_after=self.eta(position), position=position)
+                    # Slots freed by other processes are only noticed by polling
+                    self._cond.wait(self.poll_interval)
+            finally:
+                self._waiters.remove(ticket)
+                BROWSER_QUEUE.dec()
+                self._cond.notify_all()
+
+    def release(self, slot):
+        index, handle, started_at = slot
+        with self._cond:
+            self._held.discard(index)
+            ACTIVE_DRIVERS.dec()
+            if handle is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+                handle.close()
+            held_for = time.time() - started_at
+            self.avg_hold_seconds = 0.8 * self.avg_hold_seconds + 0.2 * held_for
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, on_wait=None, cancel_token=None):
+        slot = self.acquire(on_wait, cancel_token)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def status(self):
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'active': len(self._held),
+                'queued': len(self._waiters),
+                'avg_hold_seconds': round(self.avg_hold_seconds, 1)
+            }
+
+browser_limiter = BrowserLimiter()
+
+BROWSER_PROFILES = ('full', 'lean')
+
+# Requests the lean profile never makes: the scrapers only read text nodes
+LEAN_BLOCKED_URLS = [
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3', '*.ogg',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*hotjar.com*',
+    '*sentry.io*', '*yektanet.com*', '*clarity.ms*', '*map.ir*', '*neshan.org*',
+    # Map tile hosts only: a bare '*tile*' would also match ad titles and API paths
+    '*://tile.*', '*://tiles.*', '*.tile.openstreetmap.org/*', '*.tiles.mapbox.com/*', '*://api.mapbox.com/*'
+]
+
+LEAN_ARGUMENTS = [
+    '--blink-settings=imagesEnabled=false',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--mute-audio',
+    '--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication'
+]
+
+LEAN_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.default_content_setting_values.notifications': 2,
+    'profile.default_content_setting_values.geolocation': 2,
+    'profile.default_content_setting_values.media_stream': 2
+}
+
+def browser_options(profile=BROWSER_PROFILE, base_options=None):
+    """Chrome options for profile, a copy of base_options (default: config.get_chrome_options())"""
+    if profile not in BROWSER_PROFILES:
+        raise ValueError(f"Unknown browser profile {profile!r}, expected one of {', '.join(BROWSER_PROFILES)}")
+    options = copy.deepcopy(base_options if base_options is not None else get_chrome_options())
+    if profile == 'lean':
+        # Return at DOMContentLoaded, callers wait for the elements they need anyway
+        options.page_load_strategy = 'eager'
+        for argument in LEAN_ARGUMENTS:
+            options.add_argument(argument)
+        options.add_experimental_option('prefs', LEAN_PREFS)
+    return options
+
+def create_driver(profile=BROWSER_PROFILE, base_options=None):
+    """Start Chrome with the given profile
+
+    The lean profile also blocks LEAN_BLOCKED_URLS through the DevTools
+    protocol, which covers what content settings cannot (fonts, media,
+    third-party scripts).
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service as ChromeService
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    driver = webdriver.Chrome(
+        service=ChromeService(ChromeDriverManager().install()),
+        options=browser_options(profile, base_options)
+    )
+    if profile == 'lean':
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': LEAN_BLOCKED_URLS})
+        except Exception as e:
+            print(f"⚠️ مسدود کردن منابع غیرضروری ممکن نشد: {e}")
+    return driver
@@ -0,0 +1,85 @@
+# core/cancellation.py - COOPERATIVE CANCELLATION AND DEADLINES
+import threading
+import time
+from core.config import CANCEL_POLL_INTERVAL
+
+class OperationCancelled(Exception):
+    """Raised when work is abandoned because its CancellationToken was cancelled"""
+
+class CancellationToken:
+    """Cancel flag with an optional deadline, polled by long running loops
+
+    Loops check `stopped` between units of work (a scroll, an ad page, a
+    training step) and wind down, keeping what they collected. `cancelled`
+    means the caller gave up, `expired` means the deadline passed and partial
+    results are still wanted. An optional check() callable, such as a state
+    store lookup, is polled at most every poll_interval seconds so a cancel
+    issued by another worker is noticed too.
+    """
+
+    def __init__(self, timeout=None, check=None, poll_interval=CANCEL_POLL_INTERVAL, parent=None):
+        self.parent = parent
+        self.check = check
+        self.poll_interval = poll_interval
+        self.deadline = time.time() + timeout if timeout else None
+        if parent is not None and parent.deadline is not None:
+            self.deadline = min(self.deadline or parent.deadline, parent.deadline)
+        self._event = threading.Event()
+        self._last_check = 0.0
+
+    def cancel(self):
+        self._event.set()
+
+    def child(self, timeout=None):
+        """Token for one stage: cancelled with this token, with its own (tighter) deadline"""
+        return CancellationToken(timeout, poll_interval=self.poll_interval, parent=self)
+
+    @property
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.parent is not None and self.parent.cancelled:
+            self._event.set()
+        elif self.check is not None and time.time() - self._last_check >= self.poll_interval:
+            self._last_check = time.time()
+            if self.check():
+                self._event.set()
+        return self._event.is_set()
+
+    @property
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    @property
+    def stopped(self):
+        return self.cancelled or self.expired
+
+    def reason(self):
+        """'cancelled', 'deadline' or None, for progress events and logs"""
+        if self.cancelled:
+            return 'cancelled'
+        if self.expired:
+            return 'deadline'
+        return None
+
+    def remaining(self):
+        """Seconds until the deadline, None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def sleep(self, seconds):
+        """Sleep like time.sleep but wake up early when stopped, returns False if stopped"""
+        wake_at = time.time() + seconds
+        while not self.stopped:
+            left = wake_at - time.time()
+            if left <= 0:
+                return True
+            if self.deadline is not None:
+                left = min(left, max(self.deadline - time.time(), 0.01))
+            self._event.wait(min(left, self.poll_interval))
+        return False
+
+def store_cancel_check(store, key):
+    """check() for a CancellationToken that fires once key is set in the state store"""
+    return lambda: store.get(key) is not None
@@ -1,6 +1,5 @@
 # core/config.py - FIXED SEARCH URL
 import os
-from selenium.webdriver.chrome.options import Options
 
 # Base directory
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -10,41 +9,180 @@ DATA_DIR = os.path.join(BASE_DIR, 'Data')
 USER_DATA_DIR = os.path.join(DATA_DIR, 'UserData')
 MODELS_DIR = os.path.join(DATA_DIR, 'Models')
 SEARCH_HISTORY_DIR = os.path.join(DATA_DIR, 'SearchHistory')
+LOCKS_DIR = os.path.join(DATA_DIR, 'Locks')
 
-# Create directories if they don't exist
-for directory in [DATA_DIR, USER_DATA_DIR, MODELS_DIR, SEARCH_HISTORY_DIR]:
-    os.makedirs(directory, exist_ok=True)
-
-# URLs
-home_url = 'https://divar.ir'
-search_url = 'https://divar.ir/s/iran/car'  # Changed to Tehran for more results
-
-# Enhanced Chrome options
-chrome_options = Options()
-chrome_options.add_argument("--headless=new")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--window-size=1920,1080")
-chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-chrome_options.add_experimental_option('useAutomationExtension', False)
-
-def get_search_url(brand_model, year_model=None, mileage=None, gearbox=None, fuel_type=None):
-    """Generate simple search URL using only brand model for more results"""
+def ensure_data_dirs():
+    """Create data directories if they don't exist"""
+    for directory in [DATA_DIR, USER_DATA_DIR, MODELS_DIR, SEARCH_HISTORY_DIR, LOCKS_DIR]:
+        os.makedirs(directory, exist_ok=True)
+
+# Shared pipeline state (sqlite for a single machine, redis for several nodes)
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'sqlite')
+STATE_DB_FILE = os.environ.get('STATE_DB_FILE', os.path.join(DATA_DIR, 'pipeline_state.sqlite'))
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+STATE_TTL = int(os.environ.get('STATE_TTL', 1800))  # Abandoned sessions expire after 30 minutes
+
+# Live progress (SSE): a stream ends after PROGRESS_STREAM_MAX_SECONDS and the browser reconnects from its last event
+PROGRESS_STREAM_MAX_SECONDS = int(os.environ.get('PROGRESS_STREAM_MAX_SECONDS', 60))
+PROGRESS_STREAMS_PER_WORKER = int(os.environ.get('PROGRESS_STREAMS_PER_WORKER', 4))  # Keep below gunicorn --threads
+
+# In-flight request coalescing
+SINGLEFLIGHT_LEASE_TTL = int(os.environ.get('SINGLEFLIGHT_LEASE_TTL', 900))  # Longest expected search/scrape/train
+SINGLEFLIGHT_RESULT_TTL = int(os.environ.get('SINGLEFLIGHT_RESULT_TTL', 120))
+
+# Prediction result cache
+PREDICTION_CACHE_TTL = int(os.environ.get('PREDICTION_CACHE_TTL', 6 * 3600))  # Answers are fresh for 6 hours
+PREDICTION_CACHE_STALE_TTL = int(os.environ.get('PREDICTION_CACHE_STALE_TTL', 24 * 3600))  # Then served stale while refreshing
+PREDICTION_CACHE_MILEAGE_BUCKET = int(os.environ.get('PREDICTION_CACHE_MILEAGE_BUCKET', 1000))  # km
+
+# Batch pricing API
+API_MAX_BATCH = int(os.environ.get('API_MAX_BATCH', 100))  # Cars per /api/v1/price request
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # Background scrape jobs per process
+JOB_TTL = int(os.environ.get('JOB_TTL', 24 * 3600))  # How long job results stay queryable
+JOB_LEASE_TTL = int(os.environ.get('JOB_LEASE_TTL', 60))  # A job not heartbeated this long lost its worker
+
+# Browser capacity (Chrome instances per machine, shared by all workers)
+BROWSER_SLOTS = int(os.environ.get('BROWSER_SLOTS', 2))
+BROWSER_QUEUE_LIMIT = int(os.environ.get('BROWSER_QUEUE_LIMIT', 20))  # Waiters per process before rejecting
+BROWSER_QUEUE_TIMEOUT = int(os.environ.get('BROWSER_QUEUE_TIMEOUT', 600))  # Longest wait for a slot, seconds
+# 'lean' skips images, fonts, media and trackers and returns at DOMContentLoaded, 'full' loads everything
+BROWSER_PROFILE = os.environ.get('BROWSER_PROFILE', 'lean')
+
+# Per-stage deadlines in seconds (0 disables), stages stop early and keep partial results
+STAGE_DEADLINES = {
+    'search': int(os.environ.get('SEARCH_DEADLINE', 300)),
+    'scrape': int(os.environ.get('SCRAPE_DEADLINE', 600)),
+    'train': int(os.environ.get('TRAIN_DEADLINE', 120))
+}
+CANCEL_POLL_INTERVAL = float(os.environ.get('CANCEL_POLL_INTERVAL', 1.0))  # Seconds between cancel flag lookups
+
+# Latency budget mode: scrape depth is picked from measured timings to fit a wall-clock budget
+WEB_LATENCY_BUDGET = int(os.environ.get('WEB_LATENCY_BUDGET', 0))  # Seconds per web prediction, 0 keeps fixed depth
+MIN_BUDGET_ADS = int(os.environ.get('MIN_BUDGET_ADS', 10))  # Fewer ads than this make a useless model
+MAX_BUDGET_ADS = int(os.environ.get('MAX_BUDGET_ADS', 200))
+LATENCY_MODEL_TTL = int(os.environ.get('LATENCY_MODEL_TTL', 7 * 24 * 3600))
+
+# Learning-curve early stopping: scraping ends once small models trained on the ads so far agree
+CONVERGENCE_TOLERANCE = float(os.environ.get('CONVERGENCE_TOLERANCE', 0.03))  # Relative change, 0 disables
+CONVERGENCE_ERROR_TOLERANCE = float(os.environ.get('CONVERGENCE_ERROR_TOLERANCE', 0.03))  # CV error change, absolute
+CONVERGENCE_MIN_ADS = int(os.environ.get('CONVERGENCE_MIN_ADS', 15))  # Never stop with fewer ads
+CONVERGENCE_EVERY = int(os.environ.get('CONVERGENCE_EVERY', 5))  # Retrain after this many new ads
+CONVERGENCE_PATIENCE = int(os.environ.get('CONVERGENCE_PATIENCE', 2))  # Stable rounds in a row before stopping
+
+# URLs (DIVAR_HOME_URL/DIVAR_SEARCH_URL point the scrapers at a stand-in, e.g. benchmarks/fake_divar_server.py)
+home_url = os.environ.get('DIVAR_HOME_URL', 'https://divar.ir').rstrip('/')
+search_url = os.environ.get('DIVAR_SEARCH_URL', f'{home_url}/s/iran/car')  # Changed to Tehran for more results
+
+# Search sharding: URL collection fans out over region slugs × sort orders, each in its own browser.
+# An empty sort uses the site's default order, e.g. SEARCH_REGIONS=tehran,mashhad,isfahan SEARCH_SORTS=,sort_date
+SEARCH_REGIONS = [r.strip() for r in os.environ.get('SEARCH_REGIONS', 'iran').split(',') if r.strip()] or ['iran']
+SEARCH_SORTS = [s.strip() for s in os.environ.get('SEARCH_SORTS', '').split(',')] or ['']
+SEARCH_SHARD_WORKERS = int(os.environ.get('SEARCH_SHARD_WORKERS', BROWSER_SLOTS))  # Shards scrolled at once
+
+# Seen-ads index: a Bloom filter of ad tokens already scraped, optionally skipped while scrolling
+SEEN_ADS_FILE = os.environ.get('SEEN_ADS_FILE', os.path.join(DATA_DIR, 'seen_ads.bloom'))
+SEEN_ADS_CAPACITY = int(os.environ.get('SEEN_ADS_CAPACITY', 200000))  # Tokens before the filter starts over
+SEEN_ADS_ERROR_RATE = float(os.environ.get('SEEN_ADS_ERROR_RATE', 0.001))  # False "seen" rate at capacity
+SKIP_SEEN_ADS = os.environ.get('SKIP_SEEN_ADS', '0') == '1'
+
+# Opt-in stage profiling (cProfile + tracemalloc), one report directory per run
+PROFILE_PIPELINE = os.environ.get('PROFILE_PIPELINE', '0') == '1'
+PROFILES_DIR = os.environ.get('PROFILES_DIR', os.path.join(DATA_DIR, 'Profiles'))
+PROFILE_TOP = int(os.environ.get('PROFILE_TOP', 25))  # Functions and allocation sites listed per stage
+
+# Global pricing model: one model over every scraped ad, brand_model target/frequency encoded
+GLOBAL_MODEL_FILE = os.environ.get('GLOBAL_MODEL_FILE', os.path.join(MODELS_DIR, 'global_model.pkl'))
+GLOBAL_MODEL_RETRAIN_INTERVAL = int(os.environ.get('GLOBAL_MODEL_RETRAIN_INTERVAL', 6 * 3600))  # Seconds, 0 disables
+GLOBAL_MODEL_MIN_BRAND_ADS = int(os.environ.get('GLOBAL_MODEL_MIN_BRAND_ADS', 20))  # Fewer ads still need a scrape
+GLOBAL_MODEL_SMOOTHING = float(os.environ.get('GLOBAL_MODEL_SMOOTHING', 10))  # Ads a brand needs to outweigh the prior
+GLOBAL_MODEL_CORPUS_NAME = 'global_corpus.csv'  # In USER_DATA_DIR: ads of evicted searches, kept for the global model
+
+# Model registry: SQLite index of trained per-spec models, so a new spec can reuse the closest one
+MODEL_REGISTRY_FILE = os.environ.get('MODEL_REGISTRY_FILE', os.path.join(DATA_DIR, 'model_registry.sqlite'))
+# How far outside a model's training data a spec may be: years, plus 20000 km of mileage counted as a year
+MODEL_REGISTRY_MAX_DISTANCE = float(os.environ.get('MODEL_REGISTRY_MAX_DISTANCE', 2))
+
+# Disk budget for Data/UserData and Data/Models: least recently used files go first, old ones expire
+STORAGE_BUDGET_MB = int(os.environ.get('STORAGE_BUDGET_MB', 2048))  # 0 disables the budget
+STORAGE_MAX_AGE_DAYS = float(os.environ.get('STORAGE_MAX_AGE_DAYS', 30))  # Unused this long, 0 keeps files forever
+STORAGE_PIN_USES = int(os.environ.get('STORAGE_PIN_USES', 20))  # Models answering this often are never evicted
+STORAGE_EVICT_INTERVAL = int(os.environ.get('STORAGE_EVICT_INTERVAL', 60))  # Seconds between scans after writes
+
+# Search history: SQLite (WAL) written in batches by a background thread
+HISTORY_DB_FILE = os.environ.get('HISTORY_DB_FILE', os.path.join(SEARCH_HISTORY_DIR, 'search_history.sqlite'))
+HISTORY_FLUSH_INTERVAL = float(os.environ.get('HISTORY_FLUSH_INTERVAL', 1.0))  # Longest a record waits, seconds
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 200))  # Records per transaction
+
+# Pre-warming: keep the most requested specs answered from fresh data (core.prewarm)
+PREWARM_INTERVAL = int(os.environ.get('PREWARM_INTERVAL', 0))  # Seconds between rounds, 0 disables
+PREWARM_TOP = int(os.environ.get('PREWARM_TOP', 20))  # Most requested specs kept warm
+PREWARM_WINDOW_DAYS = float(os.environ.get('PREWARM_WINDOW_DAYS', 7))  # Requests counted for the ranking
+PREWARM_MAX_SCRAPES = int(os.environ.get('PREWARM_MAX_SCRAPES', 3))  # Browser runs per round
+PREWARM_ROUND_SECONDS = int(os.environ.get('PREWARM_ROUND_SECONDS', 900))  # No new scrape after this long
+PREWARM_MAX_LOAD = float(os.environ.get('PREWARM_MAX_LOAD', 0.75))  # Load average per CPU above which a round waits
+PREWARM_MODEL_MAX_AGE = int(os.environ.get('PREWARM_MODEL_MAX_AGE', 24 * 3600))  # Older models are re-scraped
+PREWARM_DEPTH = int(os.environ.get('PREWARM_DEPTH', 50))  # Ads scraped per pre-warmed spec
+
+# Enhanced Chrome options, built on first use so importing config does not load selenium
+_chrome_options = None
+
+def get_chrome_options():
+    global _chrome_options
+    if _chrome_options is None:
+        from selenium.webdriver.chrome.options import Options
+        
+        options = Options()
+        options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--disable-blink-features=AutomationControlled")
+        options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        options.add_experimental_option('useAutomationExtension', False)
+        _chrome_options = options
+    return _chrome_options
+
+def __getattr__(name):
+    # Keeps `from core.config import chrome_options` working without an import-time selenium load
+    if name == 'chrome_options':
+        return get_chrome_options()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_search_url(brand_model, year_model=None, mileage=None, gearbox=None, fuel_type=None,
+                   region=None, sort=None):
+    """Generate simple search URL using only brand model for more results
+
+    region is a city/region slug (default: all of Iran), sort an optional sort order.
+    """
     import urllib.parse
     
     # Use only brand model for broader search - more results!
     base_params = {
         'q': brand_model
     }
+    if sort:
+        base_params['sort'] = sort
     
     # Remove other filters to get more results
     # We'll filter the data during processing instead
     
     # Build URL with parameters
     query_string = urllib.parse.urlencode(base_params, doseq=True)
-    return f"{search_url}?{query_string}"
+    base_url = f"{home_url}/s/{region}/car" if region else search_url
+    return f"{base_url}?{query_string}"
+
+# Arabic letters and non-latin digits that users type interchangeably with Persian ones
+_QUERY_NORMALIZATION = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', '\u200c': ' ',
+    **{d: str(i) for i, d in enumerate('۰۱۲۳۴۵۶۷۸۹')},
+    **{d: str(i) for i, d in enumerate('٠١٢٣٤٥٦٧٨٩')},
+})
+
+def normalize_search_query(text):
+    """Normalize a brand/model query so equivalent spellings share in-flight work"""
+    text = str(text or '').translate(_QUERY_NORMALIZATION)
+    return ' '.join(text.lower().split())
 
 def get_user_data_file(brand_model, year_model, mileage, gearbox, fuel_type):
     """Generate unique filename for user's specific search"""
@@ -65,5 +203,5 @@ def get_user_model_file(brand_model, year_model, mileage, gearbox, fuel_type):
     return os.path.join(MODELS_DIR, filename)
 
 def get_search_history_file():
-    """Get search history file path"""
+    """Legacy CSV search history, imported into HISTORY_DB_FILE by core.history_store"""
     return os.path.join(SEARCH_HISTORY_DIR, 'search_history.csv')
\ No newline at end of file
@@ -0,0 +1,90 @@
+# core/convergence.py - LEARNING-CURVE EARLY STOPPING FOR SCRAPING
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import KFold, cross_val_predict
+from core.config import (CONVERGENCE_TOLERANCE, CONVERGENCE_ERROR_TOLERANCE, CONVERGENCE_MIN_ADS,
+                         CONVERGENCE_EVERY, CONVERGENCE_PATIENCE)
+from core.progress import emit
+from core.train_user_model import (ads_dataframe, clean_and_preprocess_data,
+                                   preprocess_features_with_engineering, build_prediction_input)
+
+FEATURE_COLUMNS = ['year_model', 'mileage', 'gearbox', 'fuel_type']
+
+def quick_estimate(rows, user_data):
+    """(predicted price, relative CV error) of a small model on rows, None when too few are usable"""
+    df_clean, _ = clean_and_preprocess_data(ads_dataframe(rows))
+    if len(df_clean) < 5:
+        return None
+    X, preprocessors = preprocess_features_with_engineering(df_clean[FEATURE_COLUMNS], df_clean['price'])
+    if X is None or len(X) < 5:
+        return None
+    y = df_clean['price'].loc[X.index]
+
+    model = RandomForestRegressor(n_estimators=30, max_depth=8, random_state=42)
+    folds = KFold(n_splits=min(5, len(X)), shuffle=True, random_state=42)
+    cv_predictions = cross_val_predict(model, X, y, cv=folds)
+    cv_error = float(np.mean(np.abs(cv_predictions - y)) / np.mean(y))
+
+    model.fit(X, y)
+    model_data = {'model': model, 'preprocessors': preprocessors, 'feature_columns': FEATURE_COLUMNS}
+    prediction = float(model.predict(build_prediction_input(model_data, user_data))[0])
+    return prediction, cv_error
+
+class ConvergenceMonitor:
+    """Decide when scraping more ads stops changing the answer
+
+    Called with the rows scraped so far after every new row. Every `every`
+    rows past `min_ads` a small model is trained; once the prediction for
+    the user's car moves by less than `tolerance` (relative) and the
+    cross-validated error, itself a fraction of the mean price, by less
+    than `error_tolerance` (absolute, 0.03 = 3 percentage points) for
+    `patience` rounds in a row, it returns True and the scraper stops
+    fetching detail pages. The error is not compared relatively: at a few
+    percent, ordinary fold noise moves it by far more than 3% of itself.
+    """
+
+    def __init__(self, user_data, tolerance=CONVERGENCE_TOLERANCE, min_ads=CONVERGENCE_MIN_ADS,
+                 every=CONVERGENCE_EVERY, patience=CONVERGENCE_PATIENCE, progress=None,
+                 error_tolerance=CONVERGENCE_ERROR_TOLERANCE):
+        self.user_data = user_data
+        self.tolerance = tolerance
+        self.error_tolerance = error_tolerance
+        self.min_ads = min_ads
+        self.every = max(every, 1)
+        self.patience = patience
+        self.progress = progress
+        self.history = []
+        self.stable_rounds = 0
+        self.converged = False
+
+    def __call__(self, rows):
+        if self.converged:
+            return True
+        if len(rows) < self.min_ads or (len(rows) - self.min_ads) % self.every:
+            return False
+
+        try:
+            estimate = quick_estimate(rows, self.user_data)
+        except Exception as e:
+            print(f"⚠️ خطا در بررسی همگرایی: {e}")
+            return False
+        if estimate is None:
+            return False
+
+        prediction, cv_error = estimate
+        if self.history:
+            previous_prediction, previous_error = self.history[-1][1:]
+            prediction_change = abs(prediction - previous_prediction) / max(abs(previous_prediction), 1)
+            error_change = abs(cv_error - previous_error)
+            if prediction_change <= self.tolerance and error_change <= self.error_tolerance:
+                self.stable_rounds += 1
+            else:
+                self.stable_rounds = 0
+        self.history.append((len(rows), prediction, cv_error))
+        self.converged = self.stable_rounds >= self.patience
+
+        emit(self.progress, 'convergence', ads=len(rows), prediction=prediction, cv_error=round(cv_error, 4),
+             stable_rounds=self.stable_rounds, converged=self.converged)
+        if self.converged:
+            print(f"   📉 تخمین قیمت با {len(rows)} آگهی همگرا شد، استخراج متوقف می‌شود")
+        return self.converged
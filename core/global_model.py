@@ -0,0 +1,390 @@
+# core/global_model.py - ONE PRICING MODEL ACROSS ALL BRANDS
+"""Train one model on every scraped ad and answer any known brand instantly.
+
+    python -m core.global_model                 # retrain if new ads were scraped since the last run
+    python -m core.global_model --force         # retrain now
+    python -m core.global_model --every 21600   # keep retraining every 6 hours
+
+brand_model is a high-cardinality text column, so instead of one-hot
+columns it becomes two numbers: the smoothed mean log price of the brand
+(target encoding, out-of-fold while training so a row never sees its own
+price) and the brand's ad count (frequency encoding). The model predicts
+log price, which lets one forest cover a Pride and a Camry. The brand of
+an ad is the search query that found it (from the model registry entry
+with the CSV's spec hash), since Divar's "پژو 206 تیپ 2" is rarely what a
+user types; CSVs without a registered search fall back to the ad's own
+brand text. Brands with
+fewer than GLOBAL_MODEL_MIN_BRAND_ADS ads are not answered; those still
+go through the scrape → train pipeline, whose per-spec models refine the
+global answer where they exist.
+"""
+import argparse
+import glob
+import os
+import threading
+import time
+from core.config import (USER_DATA_DIR, GLOBAL_MODEL_FILE, GLOBAL_MODEL_RETRAIN_INTERVAL, GLOBAL_MODEL_CORPUS_NAME,
+                         GLOBAL_MODEL_MIN_BRAND_ADS, GLOBAL_MODEL_SMOOTHING, SINGLEFLIGHT_LEASE_TTL,
+                         normalize_search_query)
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent archiving from several processes may drop an evicted search
+    fcntl = None
+
+FEATURE_COLUMNS = ['year_model', 'mileage', 'gearbox', 'fuel_type']
+CORPUS_COLUMNS = ['brand_model', 'brand_key'] + FEATURE_COLUMNS + ['price', 'url']
+MIN_TRAINING_ADS = 20
+
+_loaded = {}  # model file -> (mtime, model data)
+_loaded_lock = threading.Lock()
+
+def brand_key(brand_model):
+    """Brand/model spelling the encodings are keyed by"""
+    return normalize_search_query(brand_model)
+
+def scraped_data_files(data_dir=USER_DATA_DIR):
+    """Per-search CSV files of data_dir, oldest first"""
+    return sorted(glob.glob(os.path.join(data_dir, '*.csv')), key=os.path.getmtime)
+
+def search_brand_keys(registry=None):
+    """{spec hash: brand key of the search query} of the registered per-spec models"""
+    from core.model_registry import get_model_registry
+    from core.storage import spec_hash
+
+    registry = registry or get_model_registry()
+    return {spec_hash(entry['model_file']): entry['brand_key'] for entry in registry.entries()}
+
+def load_scraped_ads(data_dir=USER_DATA_DIR, registry=None):
+    """Every ad in the CSV files of data_dir with its brand_key, an ad found by several searches counted once
+
+    The newest row of an ad wins.
+    """
+    import pandas as pd
+    from core.ad_index import ad_token
+    from core.storage import spec_hash
+    from core.train_user_model import CSV_DTYPES, TEXT_COLUMNS
+
+    queries = search_brand_keys(registry)
+    frames = []
+    for path in scraped_data_files(data_dir):
+        try:
+            frame = pd.read_csv(path, encoding='utf-8-sig', dtype=CSV_DTYPES)
+        except Exception as e:
+            print(f"⚠️ خطا در خواندن فایل داده {path}: {e}")
+            continue
+        if 'brand_key' not in frame.columns:  # The corpus of evicted searches has its own
+            query = queries.get(spec_hash(path))
+            frame['brand_key'] = query if query else frame['brand_model'].astype(str).map(brand_key)
+        frames.append(frame)
+    if not frames:
+        return None
+
+    df = pd.concat(frames, ignore_index=True)
+    if 'url' in df.columns:
+        tokens = df['url'].astype(str).map(lambda url: ad_token(url) or url)
+        df = df[~tokens.duplicated(keep='last')].reset_index(drop=True)
+    # Categories differ between files, concat falls back to plain strings
+    return df.astype({col: 'category' for col in TEXT_COLUMNS + ['brand_key'] if col in df.columns})
+
+def archive_scraped_ads(path, corpus_file=None, registry=None):
+    """Keep the ads of a per-search CSV that is about to be deleted in the global model's corpus
+
+    The corpus (GLOBAL_MODEL_CORPUS_NAME next to the CSV) holds only the
+    columns the global model trains on, every ad once, so evicting searches
+    for disk space does not shrink the global model's brands. Returns False
+    when the corpus could not be written and the CSV has to stay.
+    """
+    import pandas as pd
+    from core.ad_index import ad_token
+    from core.storage import spec_hash
+    from core.train_user_model import CSV_DTYPES
+
+    corpus_file = corpus_file or os.path.join(os.path.dirname(path), GLOBAL_MODEL_CORPUS_NAME)
+    try:
+        frame = pd.read_csv(path, encoding='utf-8-sig', dtype=CSV_DTYPES)
+    except Exception as e:
+        print(f"⚠️ خطا در خواندن فایل داده {path}: {e}")
+        return True  # The global model cannot read it either
+    if not set(CORPUS_COLUMNS) - {'brand_key'} <= set(frame.columns):
+        return True
+    query = search_brand_keys(registry).get(spec_hash(path))
+    frame['brand_key'] = query if query else frame['brand_model'].astype(str).map(brand_key)
+
+    try:
+        # Several workers may evict at once, one lock per corpus file, next to it
+        with open(f"{corpus_file}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            frames = [frame[CORPUS_COLUMNS].astype(object)]
+            if os.path.exists(corpus_file):
+                frames.insert(0, pd.read_csv(corpus_file, encoding='utf-8-sig', dtype=str))
+            corpus = pd.concat(frames, ignore_index=True)
+            tokens = corpus['url'].astype(str).map(lambda url: ad_token(url) or url)
+            corpus = corpus[~tokens.duplicated(keep='last')]
+            tmp_file = f"{corpus_file}.{os.getpid()}.tmp"
+            corpus.to_csv(tmp_file, index=False, encoding='utf-8-sig')
+            os.replace(tmp_file, corpus_file)
+        return True
+    except Exception as e:
+        print(f"❌ خطا در بایگانی آگهی‌های {path} برای مدل سراسری: {e}")
+        return False
+
+def brand_statistics(keys, log_prices):
+    """{brand key: [ad count, mean log price]}"""
+    grouped = log_prices.groupby(keys.values).agg(['count', 'mean'])
+    return {key: [int(row['count']), float(row['mean'])] for key, row in grouped.iterrows()}
+
+def brand_features(keys, stats, prior, smoothing):
+    """brand_target and brand_frequency columns for keys, unknown brands get the prior and a count of 0"""
+    import pandas as pd
+
+    counts = keys.map({key: count for key, (count, _) in stats.items()}).fillna(0).astype('float64')
+    means = keys.map({key: mean for key, (_, mean) in stats.items()}).fillna(prior).astype('float64')
+    return pd.DataFrame({
+        'brand_target': (counts * means + smoothing * prior) / (counts + smoothing),
+        'brand_frequency': counts
+    }, index=keys.index)
+
+def encoded_features(X, keys, y, smoothing, folds=5):
+    """X with brand columns for training, (features, brand stats, prior)
+
+    The target encoding of each row comes from the other folds, otherwise
+    the forest learns to trust brand_target more than it deserves.
+    """
+    from sklearn.model_selection import KFold
+
+    prior = float(y.mean())
+    stats = brand_statistics(keys, y)
+    encoded = brand_features(keys, stats, prior, smoothing)
+    if len(keys) >= folds:
+        for fit_rows, encode_rows in KFold(n_splits=folds, shuffle=True, random_state=42).split(keys):
+            fold_stats = brand_statistics(keys.iloc[fit_rows], y.iloc[fit_rows])
+            fold_prior = float(y.iloc[fit_rows].mean())
+            fold = brand_features(keys.iloc[encode_rows], fold_stats, fold_prior, smoothing)
+            encoded.iloc[encode_rows, 0] = fold['brand_target'].values
+    return X.join(encoded), stats, prior
+
+def train_global_model(df, smoothing=GLOBAL_MODEL_SMOOTHING):
+    """Train the global model on a DataFrame of scraped ads, returns the model data or None"""
+    import numpy as np
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import mean_absolute_error, r2_score
+    from core.train_user_model import (clean_and_preprocess_data, preprocess_features_with_engineering,
+                                       create_optimized_model)
+
+    print(f"🌐 آموزش مدل سراسری بر روی {len(df)} آگهی...")
+    df_clean, preprocessing_info = clean_and_preprocess_data(df)
+    df_clean = df_clean[df_clean['brand_model'].notna()]
+    if len(df_clean) < MIN_TRAINING_ADS:
+        print(f"❌ داده کافی برای مدل سراسری وجود ندارد (فقط {len(df_clean)} نمونه)")
+        return None
+
+    X, preprocessors = preprocess_features_with_engineering(df_clean[FEATURE_COLUMNS], df_clean['price'])
+    if X is None or len(X) < MIN_TRAINING_ADS:
+        print("❌ خطا در پیش‌پردازش داده‌های مدل سراسری")
+        return None
+    # car_age only restates year_model, and build_prediction_input computes it from another year
+    X = X[FEATURE_COLUMNS]
+    if 'brand_key' in df_clean.columns:
+        keys = df_clean['brand_key'].loc[X.index].astype(str)
+    else:
+        keys = df_clean['brand_model'].loc[X.index].astype(str).map(brand_key)
+    y = np.log(df_clean['price'].loc[X.index].astype('float64'))
+
+    # Held-out error first, then the model that is saved is fitted on every ad
+    X_train, X_test, keys_train, keys_test, y_train, y_test = train_test_split(
+        X, keys, y, test_size=0.2, random_state=42)
+    X_train, stats, prior = encoded_features(X_train, keys_train, y_train, smoothing)
+    model = create_optimized_model(len(X_train)).fit(X_train, y_train)
+    X_test = X_test.join(brand_features(keys_test, stats, prior, smoothing))
+    test_prices = np.exp(y_test)
+    test_predictions = np.exp(model.predict(X_test[X_train.columns]))
+    metrics = {
+        'test_mae': float(mean_absolute_error(test_prices, test_predictions)),
+        'test_r2': float(r2_score(test_prices, test_predictions)),
+        # Median, since the few typo prices that pass cleaning would dominate a mean
+        'test_median_ape': float(np.median(np.abs(test_predictions - test_prices) / test_prices)),
+        'samples': len(X),
+        'brands': int(keys.nunique())
+    }
+
+    X_all, stats, prior = encoded_features(X, keys, y, smoothing)
+    model = create_optimized_model(len(X_all)).fit(X_all, y)
+
+    print(f"✅ مدل سراسری آموزش داده شد: {metrics['samples']} آگهی، {metrics['brands']} مدل خودرو")
+    print(f"   R² Score: {metrics['test_r2']:.3f}")
+    print(f"   خطای مطلق میانگین: {metrics['test_mae']:,.0f} تومان (میانه خطا {metrics['test_median_ape']:.1%})")
+    return {
+        'model': model,
+        'preprocessors': preprocessors,
+        'feature_columns': FEATURE_COLUMNS,
+        'columns': list(X_all.columns),
+        'brand_stats': stats,
+        'prior': prior,
+        'smoothing': smoothing,
+        'metrics': metrics,
+        'preprocessing_info': preprocessing_info,
+        'trained_at': time.time()
+    }
+
+def save_global_model(model_data, model_file=GLOBAL_MODEL_FILE):
+    """Write the model atomically, so workers never load half a file; returns True on success"""
+    import joblib
+
+    try:
+        os.makedirs(os.path.dirname(model_file), exist_ok=True)
+        temp_file = f"{model_file}.{os.getpid()}.tmp"
+        joblib.dump(model_data, temp_file)
+        os.replace(temp_file, model_file)
+        print(f"💾 مدل سراسری ذخیره شد در: {model_file}")
+        return True
+    except Exception as e:
+        print(f"❌ خطا در ذخیره مدل سراسری: {e}")
+        return False
+
+def load_global_model(model_file=GLOBAL_MODEL_FILE):
+    """The saved model data, loaded once per process and again when the file is replaced; None without one"""
+    try:
+        mtime = os.path.getmtime(model_file)
+    except OSError:
+        return None
+    with _loaded_lock:
+        cached = _loaded.get(model_file)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            import joblib
+            from core.metrics import MODEL_LOADS
+
+            model_data = joblib.load(model_file)
+            MODEL_LOADS.inc()
+        except Exception as e:
+            print(f"❌ خطا در بارگذاری مدل سراسری: {e}")
+            return None
+        _loaded[model_file] = (mtime, model_data)
+        return model_data
+
+def predict_with_global_model(model_data, user_data, min_brand_ads=GLOBAL_MODEL_MIN_BRAND_ADS):
+    """{'predicted_price', 'samples'} for user_data, None when the brand has fewer than min_brand_ads ads"""
+    import numpy as np
+    import pandas as pd
+    from core.train_user_model import build_prediction_input
+
+    key = brand_key(user_data['brand_model'])
+    count = model_data['brand_stats'].get(key, (0, 0))[0]
+    if count < min_brand_ads:
+        return None
+
+    input_df = build_prediction_input(model_data, user_data)[FEATURE_COLUMNS]
+    input_df = input_df.join(brand_features(pd.Series([key], index=input_df.index), model_data['brand_stats'],
+                                            model_data['prior'], model_data['smoothing']))
+    log_price = model_data['model'].predict(input_df[model_data['columns']])[0]
+    return {'predicted_price': float(np.exp(log_price)), 'samples': int(count)}
+
+def predict_global(user_data, model_file=GLOBAL_MODEL_FILE, min_brand_ads=GLOBAL_MODEL_MIN_BRAND_ADS):
+    """Price user_data with the saved global model, None without a model or for brands it barely knows"""
+    if not os.path.exists(model_file):
+        return None
+    model_data = load_global_model(model_file)
+    if model_data is None:
+        return None
+    try:
+        return predict_with_global_model(model_data, user_data, min_brand_ads)
+    except Exception as e:
+        print(f"❌ خطا در پیش‌بینی با مدل سراسری: {e}")
+        return None
+
+def needs_retraining(data_dir=USER_DATA_DIR, model_file=GLOBAL_MODEL_FILE):
+    """True when ads were scraped after the saved model was trained"""
+    data_files = scraped_data_files(data_dir)
+    if not data_files:
+        return False
+    if not os.path.exists(model_file):
+        return True
+    return os.path.getmtime(data_files[-1]) > os.path.getmtime(model_file)
+
+def retrain_global_model(data_dir=USER_DATA_DIR, model_file=GLOBAL_MODEL_FILE, force=False, registry=None):
+    """Retrain and save the global model when there are new ads (always with force), returns the model data"""
+    if not force and not needs_retraining(data_dir, model_file):
+        print("ℹ️ آگهی جدیدی از آخرین آموزش مدل سراسری اضافه نشده است")
+        return None
+    df = load_scraped_ads(data_dir, registry)
+    if df is None:
+        print(f"❌ هیچ داده‌ای در {data_dir} پیدا نشد")
+        return None
+    model_data = train_global_model(df)
+    if model_data is None or not save_global_model(model_data, model_file):
+        return None
+    return model_data
+
+class GlobalModelTrainer:
+    """Retrain the global model in a daemon thread every `interval` seconds
+
+    The first check runs `startup_delay` seconds after start(), so workers
+    boot without loading the ML stack. A lease in the state store makes
+    sure only one worker trains at a time; the others pick the new file up
+    on their next prediction.
+    """
+
+    LEASE_KEY = 'global_model_training'
+
+    def __init__(self, store, interval=GLOBAL_MODEL_RETRAIN_INTERVAL, data_dir=USER_DATA_DIR,
+                 model_file=GLOBAL_MODEL_FILE, startup_delay=60, registry=None):
+        self.store = store
+        self.interval = interval
+        self.data_dir = data_dir
+        self.model_file = model_file
+        self.registry = registry
+        self.startup_delay = startup_delay
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the schedule, returns False when it is disabled (interval 0) or already running"""
+        if self.interval <= 0 or self._thread is not None:
+            return False
+        self._thread = threading.Thread(target=self._loop, daemon=True, name='global-model-trainer')
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stopped.set()
+
+    def _loop(self):
+        delay = self.startup_delay
+        while not self._stopped.wait(delay):
+            self.run_once()
+            delay = self.interval
+
+    def run_once(self, force=False):
+        """Retrain now unless another worker is already training, returns the new model data or None"""
+        if not self.store.add(self.LEASE_KEY, {'started_at': time.time(), 'pid': os.getpid()},
+                              ttl=SINGLEFLIGHT_LEASE_TTL):
+            return None
+        try:
+            return retrain_global_model(self.data_dir, self.model_file, force=force, registry=self.registry)
+        except Exception as e:
+            print(f"❌ خطا در آموزش دوره‌ای مدل سراسری: {e}")
+            return None
+        finally:
+            self.store.delete(self.LEASE_KEY)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=USER_DATA_DIR, help='directory of scraped ad CSV files')
+    parser.add_argument('--output', default=GLOBAL_MODEL_FILE, help='model file to write')
+    parser.add_argument('--force', action='store_true', help='retrain even if no new ads were scraped')
+    parser.add_argument('--every', type=int, default=0, help='keep retraining every N seconds')
+    args = parser.parse_args()
+
+    force = args.force
+    while True:
+        retrain_global_model(args.data_dir, args.output, force=force)
+        if not args.every:
+            break
+        force = False
+        time.sleep(args.every)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+# core/history_store.py - SEARCH HISTORY IN SQLITE WITH A BATCHED WRITER
+"""Search history of every answered prediction, shared by all workers.
+
+    python -m core.history_store popular --days 7
+    python -m core.history_store recent --days 1 --brand "پژو 206"
+    python -m core.history_store import Data/SearchHistory/search_history.csv
+
+record() only puts the entry on a queue; a background thread writes
+queued entries in one transaction every HISTORY_FLUSH_INTERVAL seconds
+or HISTORY_BATCH_SIZE entries, so requests never wait on the disk. The
+database runs in WAL mode, so gunicorn workers append side by side while
+analytics read, and timestamp and brand indexes keep time-window and
+"most requested" queries off a full scan. The old search_history.csv is
+imported once on first use and renamed to search_history.csv.imported.
+"""
+import argparse
+import atexit
+import csv
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from core.config import (HISTORY_DB_FILE, HISTORY_FLUSH_INTERVAL, HISTORY_BATCH_SIZE, get_search_history_file,
+                         normalize_search_query)
+
+try:
+    import fcntl
+except ImportError:  # Windows: workers starting together may import the legacy CSV twice
+    fcntl = None
+
+COLUMNS = ['timestamp', 'brand_model', 'brand_key', 'year_model', 'mileage', 'gearbox', 'fuel_type',
+           'predicted_price', 'training_samples', 'source']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def history_row(user_data, predicted_price, samples_count, source=None, timestamp=None):
+    """Values in COLUMNS order for one answered prediction"""
+    return (
+        time.time() if timestamp is None else timestamp,
+        user_data['brand_model'],
+        normalize_search_query(user_data['brand_model']),
+        int(float(user_data['year_model'])),
+        int(float(user_data['mileage'])),
+        user_data['gearbox'],
+        user_data['fuel_type'],
+        float(predicted_price) if predicted_price is not None else None,
+        int(float(samples_count or 0)),
+        source
+    )
+
+class SearchHistoryStore:
+    """Append-only search history with a background batch writer and analytics queries"""
+
+    def __init__(self, db_file=HISTORY_DB_FILE, flush_interval=HISTORY_FLUSH_INTERVAL,
+                 batch_size=HISTORY_BATCH_SIZE):
+        self.db_file = db_file
+        self.flush_interval = flush_interval
+        self.batch_size = max(batch_size, 1)
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_file) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS searches ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL NOT NULL, "
+                "brand_model TEXT NOT NULL, brand_key TEXT NOT NULL, year_model INTEGER, mileage INTEGER, "
+                "gearbox TEXT, fuel_type TEXT, predicted_price REAL, training_samples INTEGER, source TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_searches_timestamp ON searches (timestamp)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_searches_brand ON searches (brand_key, timestamp)")
+            self._local.conn = conn
+        return conn
+
+    def record(self, user_data, predicted_price, samples_count, source=None):
+        """Queue one answered prediction, written by the background thread"""
+        self._queue.put(history_row(user_data, predicted_price, samples_count, source))
+        self._start_writer()
+
+    def _start_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True, name='history-writer')
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self.write_rows(batch)
+            except Exception as e:
+                print(f"❌ خطا در ذخیره تاریخچه جستجو ({len(batch)} مورد): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def write_rows(self, rows):
+        """Insert rows (COLUMNS order) in one transaction"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                f"INSERT INTO searches ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows
+            )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def flush(self):
+        """Block until every queued record is written"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def most_requested(self, limit=10, since=None, until=None):
+        """Most requested brand/models in a time window (epoch seconds), with their average predicted price"""
+        where, params = self._window(since, until)
+        rows = self._connect().execute(
+            "SELECT brand_key, MAX(brand_model) AS brand_model, COUNT(*) AS requests, "
+            "AVG(predicted_price) AS avg_price, MAX(timestamp) AS last_requested "
+            f"FROM searches {where} GROUP BY brand_key ORDER BY requests DESC, last_requested DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def most_requested_specs(self, limit=10, since=None, until=None):
+        """Most requested full specs in a time window, as user_data dicts with a 'requests' count"""
+        where, params = self._window(since, until)
+        rows = self._connect().execute(
+            "SELECT MAX(brand_model) AS brand_model, year_model, mileage, gearbox, fuel_type, "
+            "COUNT(*) AS requests, MAX(timestamp) AS last_requested "
+            f"FROM searches {where} GROUP BY brand_key, year_model, mileage, gearbox, fuel_type "
+            "ORDER BY requests DESC, last_requested DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def searches(self, since=None, until=None, brand_model=None, limit=100):
+        """Searches in a time window, newest first, optionally of one brand/model"""
+        where, params = self._window(since, until, brand_model)
+        rows = self._connect().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM searches {where} ORDER BY timestamp DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return [dict(row, timestamp=datetime.fromtimestamp(row['timestamp']).strftime(TIMESTAMP_FORMAT))
+                for row in rows]
+
+    def count(self, since=None, until=None, brand_model=None):
+        where, params = self._window(since, until, brand_model)
+        return self._connect().execute(f"SELECT COUNT(*) FROM searches {where}", params).fetchone()[0]
+
+    def _window(self, since, until, brand_model=None):
+        conditions, params = [], []
+        if brand_model is not None:
+            conditions.append("brand_key = ?")
+            params.append(normalize_search_query(brand_model))
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def import_csv(self, csv_file=None):
+        """Import a search_history.csv written by the old pandas appends, returns (imported, skipped)
+
+        Rows garbled by interleaved appends are skipped. The file is renamed
+        to <name>.imported afterwards, so it is never imported twice. Workers
+        starting together take turns on a lock file next to it, and the ones
+        that come after the import find the file gone and return (0, 0).
+        """
+        csv_file = csv_file or get_search_history_file()
+        with open(f"{csv_file}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.exists(csv_file):
+                return 0, 0
+            rows, skipped = [], 0
+            with open(csv_file, newline='', encoding='utf-8-sig') as f:
+                for record in csv.DictReader(f):
+                    try:
+                        timestamp = datetime.strptime(record['timestamp'], TIMESTAMP_FORMAT).timestamp()
+                        rows.append(history_row(record, record['predicted_price'] or None,
+                                                record['training_samples'], source='csv_import', timestamp=timestamp))
+                    except (KeyError, TypeError, ValueError):
+                        skipped += 1
+            if rows:
+                self.write_rows(rows)
+            os.replace(csv_file, f"{csv_file}.imported")
+        print(f"📥 {len(rows)} جستجو از {csv_file} وارد شد ({skipped} ردیف خراب نادیده گرفته شد)")
+        return len(rows), skipped
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+def get_history_store():
+    """Process wide store on HISTORY_DB_FILE; imports the legacy CSV once and flushes at exit"""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            store = SearchHistoryStore()
+            if os.path.exists(get_search_history_file()):
+                try:
+                    store.import_csv()
+                except Exception as e:
+                    print(f"⚠️ خطا در انتقال تاریخچه جستجوی قدیمی: {e}")
+            atexit.register(store.flush)
+            _history_store = store
+    return _history_store
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['popular', 'recent', 'import'])
+    parser.add_argument('csv_file', nargs='?', help='CSV file to import (default: the legacy search_history.csv)')
+    parser.add_argument('--days', type=float, default=7, help='time window, 0 for all time')
+    parser.add_argument('--brand', help='only this brand/model (recent)')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    store = SearchHistoryStore()
+    if args.command == 'import':
+        store.import_csv(args.csv_file)
+        return
+    since = time.time() - args.days * 24 * 3600 if args.days else None
+    if args.command == 'popular':
+        for row in store.most_requested(args.limit, since=since):
+            print(f"{row['requests']:>6}  {row['brand_model']}  (میانگین {row['avg_price'] or 0:,.0f} تومان)")
+        return
+    for row in store.searches(since=since, brand_model=args.brand, limit=args.limit):
+        print(f"{row['timestamp']}  {row['brand_model']} {row['year_model']} {row['mileage']:,}km  "
+              f"{row['predicted_price'] or 0:,.0f}  ({row['source'] or '-'})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# core/jobs.py - BACKGROUND PRICING JOBS
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from core.config import JOB_WORKERS, JOB_TTL, JOB_LEASE_TTL
+from core.result_cache import spec_cache_key
+from core.metrics import QUEUED_JOBS
+
+class JobQueue:
+    """Run slow pricing work in background threads, tracking status in the state store
+
+    Jobs run in this process's thread pool, so each pending job holds a lease
+    that a heartbeat thread renews every lease_ttl / 3 seconds. A queued or
+    running job whose lease expired lost its worker (crash or restart): it
+    is reported as failed and the next submit for its spec queues it again.
+    """
+
+    def __init__(self, store, run, workers=JOB_WORKERS, ttl=JOB_TTL, lease_ttl=JOB_LEASE_TTL):
+        self.store = store
+        self.run = run  # run(user_data, **options) -> JSON serializable result or None
+        self.ttl = ttl
+        self.lease_ttl = lease_ttl
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pricing-job')
+        self._owned = set()
+        self._lock = threading.Lock()
+        self._heartbeat = None
+
+    def submit(self, user_data, options=None):
+        """Queue a job for user_data, reusing a pending job for the same spec and options"""
+        options = options or {}
+        spec_key = self._spec_key(user_data, options)
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'status': 'queued',
+            'user_data': user_data,
+            'options': options,
+            'created_at': time.time()
+        }
+        # The record exists before the spec points at it, so a concurrent submit never finds a bare id
+        self._renew(job_id)
+        self.store.set(f"job:{job_id}", job, ttl=self.ttl)
+        while not self.store.add(spec_key, {'job_id': job_id}, ttl=self.ttl):
+            existing = self.store.get(spec_key)
+            if existing is None:
+                continue  # Released meanwhile, try again
+            current = self.get(existing['job_id'])
+            if current and current['status'] in ('queued', 'running'):
+                self.store.delete(f"job:{job_id}")
+                self.store.delete(self._lease_key(job_id))
+                return current
+            # Its job is finished or lost: take the spec over unless another submit just did
+            if self.store.update(spec_key, {'job_id': job_id}, ttl=self.ttl, expect=existing) is not None:
+                break
+
+        with self._lock:
+            self._owned.add(job_id)
+        self._start_heartbeat()
+        QUEUED_JOBS.labels(status='queued').inc()
+        self.executor.submit(self._execute, job_id, spec_key, user_data, options)
+        return job
+
+    def get(self, job_id):
+        """Job status, with jobs whose worker is gone marked failed"""
+        job = self.store.get(f"job:{job_id}")
+        if job and job['status'] in ('queued', 'running') and self.store.get(self._lease_key(job_id)) is None:
+            # Only while the status is unchanged, the worker may have just finished it
+            job = self.store.update(f"job:{job_id}", {
+                'status': 'failed',
+                'error': 'پردازشگر این کار متوقف شد، دوباره ارسال کنید',
+                'finished_at': time.time()
+            }, ttl=self.ttl, expect={'status': job['status']}) or self.store.get(f"job:{job_id}")
+        return job
+
+    def _spec_key(self, user_data, options):
+        # Jobs with other budget/depth/profile options are not interchangeable
+        key = f"job_for_spec:{spec_cache_key(user_data)}"
+        if options:
+            key += ':' + ','.join(f"{name}={options[name]}" for name in sorted(options))
+        return key
+
+    def _lease_key(self, job_id):
+        return f"job_lease:{job_id}"
+
+    def _renew(self, job_id):
+        self.store.set(self._lease_key(job_id), {'pid': os.getpid()}, ttl=self.lease_ttl)
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True, name='job-heartbeat')
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.lease_ttl / 3)
+            with self._lock:
+                owned = list(self._owned)
+            for job_id in owned:
+                try:
+                    self._renew(job_id)
+                except Exception as e:
+                    print(f"⚠️ خطا در تمدید کار {job_id}: {e}")
+
+    def _execute(self, job_id, spec_key, user_data, options):
+        started = self.store.update(f"job:{job_id}", {'status': 'running', 'started_at': time.time()},
+                                    ttl=self.ttl, expect={'status': 'queued'})
+        QUEUED_JOBS.labels(status='queued').dec()
+        if started is None:
+            # Reported failed while it waited for a thread, its spec may belong to a newer job
+            self._release(job_id, spec_key)
+            return
+        QUEUED_JOBS.labels(status='running').inc()
+        try:
+            result = self.run(dict(user_data), **options)
+            if result:
+                changes = {'status': 'done', 'result': result}
+            else:
+                changes = {'status': 'failed', 'error': 'پیش‌بینی قیمت با شکست مواجه شد'}
+        except Exception as e:
+            print(f"❌ خطا در اجرای کار {job_id}: {e}")
+            changes = {'status': 'failed', 'error': str(e)}
+        QUEUED_JOBS.labels(status='running').dec()
+        changes['finished_at'] = time.time()
+        if self.store.update(f"job:{job_id}", changes, ttl=self.ttl, expect={'status': 'running'}) is None:
+            print(f"⚠️ کار {job_id} پیش از پایان ناموفق اعلام شده بود، نتیجه آن ذخیره نشد")
+        self._release(job_id, spec_key)
+
+    def _release(self, job_id, spec_key):
+        with self._lock:
+            self._owned.discard(job_id)
+        self.store.delete(self._lease_key(job_id))
+        # A newer job may own the spec by now
+        self.store.delete_if(spec_key, {'job_id': job_id})
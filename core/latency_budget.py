@@ -0,0 +1,109 @@
+# core/latency_budget.py - PICK SCRAPE DEPTH FROM A WALL-CLOCK BUDGET
+import math
+import time
+from core.config import MIN_BUDGET_ADS, MAX_BUDGET_ADS, LATENCY_MODEL_TTL
+from core.progress import ConsoleProgress
+
+class LatencyModel:
+    """Running estimates of what one scroll, one ad page and one training run cost
+
+    Estimates are exponentially weighted averages kept in the state store, so
+    every worker and CLI run learns from the others. Until a value has been
+    measured the defaults below are used.
+    """
+
+    KEY = 'latency_model'
+    DEFAULTS = {
+        'browser_start': 8.0,   # Seconds from stage start until the browser is ready
+        'scroll': 4.0,          # Seconds per scroll of the search feed
+        'urls_per_scroll': 6.0, # New ad URLs found per scroll
+        'ad': 3.0,              # Seconds to fetch and parse one ad page
+        'train': 5.0            # Seconds to clean data and train a model
+    }
+
+    def __init__(self, store, alpha=0.3, ttl=LATENCY_MODEL_TTL):
+        self.store = store
+        self.alpha = alpha
+        self.ttl = ttl
+
+    def estimates(self):
+        measured = self.store.get(self.KEY) or {}
+        return {name: measured.get(name, default) for name, default in self.DEFAULTS.items()}
+
+    def observe(self, **samples):
+        """Fold measured values into the running averages"""
+        measured = self.store.get(self.KEY) or {}
+        for name, value in samples.items():
+            previous = measured.get(name)
+            measured[name] = value if previous is None else (1 - self.alpha) * previous + self.alpha * value
+        measured['updated_at'] = time.time()
+        self.store.set(self.KEY, measured, ttl=self.ttl)
+
+    def plan(self, budget, min_ads=MIN_BUDGET_ADS, max_ads=MAX_BUDGET_ADS):
+        """Scrape depth and stage deadlines expected to finish within budget seconds"""
+        est = self.estimates()
+        urls_per_scroll = max(est['urls_per_scroll'], 0.5)
+        # Two browser sessions (search and scrape) plus training are paid once per run
+        fixed_cost = 2 * est['browser_start'] + est['train']
+        cost_per_ad = est['scroll'] / urls_per_scroll + est['ad']
+
+        ads = int((budget - fixed_cost) / cost_per_ad)
+        ads = max(min_ads, min(max_ads, ads))
+        scrolls = max(1, math.ceil(ads / urls_per_scroll))
+
+        # Split the budget between stages in proportion to their expected cost,
+        # deadlines then hold the run to the budget even when estimates are off
+        expected = {
+            'search': est['browser_start'] + scrolls * est['scroll'],
+            'scrape': est['browser_start'] + ads * est['ad'],
+            'train': est['train']
+        }
+        scale = budget / sum(expected.values())
+        return {
+            'budget': budget,
+            'max_ads': ads,
+            'max_scrolls': scrolls,
+            'deadlines': {stage: max(1.0, round(seconds * scale, 1)) for stage, seconds in expected.items()},
+            'expected_seconds': round(sum(expected.values()), 1)
+        }
+
+    def tracker(self, progress=None):
+        """Progress callback that measures stage costs from pipeline events and forwards them"""
+        return LatencyTracker(self, progress)
+
+class LatencyTracker:
+    """Turn pipeline progress events into LatencyModel observations"""
+
+    def __init__(self, model, progress=None, clock=time.time):
+        self.model = model
+        self.clock = clock
+        # Same default as the stage functions, so the CLI keeps its progress bar
+        self.progress = progress if progress is not None else ConsoleProgress()
+        self._started = {}
+
+    def __call__(self, event, data):
+        now = self.clock()
+        try:
+            self._measure(event, data, now)
+        except Exception as e:
+            print(f"⚠️ خطا در ثبت زمان‌بندی مراحل: {e}")
+        self.progress(event, data)
+
+    def _measure(self, event, data, now):
+        if event == 'stage_started':
+            self._started[data['stage']] = now
+        elif event in ('search_started', 'scrape_started'):
+            stage = 'search' if event == 'search_started' else 'scrape'
+            if stage in self._started:
+                self.model.observe(browser_start=now - self._started[stage])
+            self._started[event] = now
+        elif event == 'search_done' and data.get('scrolls') and 'search_started' in self._started:
+            scrolls = data['scrolls']
+            self.model.observe(scroll=(now - self._started['search_started']) / scrolls,
+                               urls_per_scroll=data['urls_found'] / scrolls)
+        elif event == 'scrape_done' and 'scrape_started' in self._started:
+            ads = data['parsed'] + data['failed']
+            if ads:
+                self.model.observe(ad=(now - self._started['scrape_started']) / ads)
+        elif event == 'stage_done' and data['stage'] == 'train' and data.get('ok'):
+            self.model.observe(train=data['seconds'])
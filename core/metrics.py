@@ -0,0 +1,187 @@
+# core/metrics.py - IN-PROCESS METRICS (PROMETHEUS TEXT FORMAT)
+import threading
+import time
+from contextlib import ContextDecorator
+
+class _Timer(ContextDecorator):
+    """Observe the duration of a block or function call into a histogram"""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self._local = threading.local()
+
+    def __enter__(self):
+        self._local.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._local.start)
+        return False
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key)) + (extra or [])
+        if not pairs:
+            return ''
+        escaped = [(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                   for name, value in pairs]
+        return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(self._render_child(key, child))
+        return lines
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{self._format_labels(key)} {child.value:g}"]
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+    def time(self):
+        return _Timer(self)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets) + (float('inf'),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, key, child):
+        lines = []
+        cumulative = 0
+        with child._lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else f'{bound:g}'
+            lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{self._format_labels(key)} {total:g}")
+        lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """Text exposition format served by /metrics"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+# Shared pipeline metrics, used by the CLI and the web app alike
+STAGE_SECONDS = Histogram('car_price_stage_seconds', 'Duration of pipeline stages in seconds', ['stage'])
+ADS_SCRAPED = Counter('car_price_ads_scraped_total', 'Ad pages scraped into valid rows')
+ADS_FAILED = Counter('car_price_ads_failed_total', 'Ad pages that failed to load or parse')
+CACHE_LOOKUPS = Counter('car_price_cache_lookups_total', 'Prediction cache lookups by result', ['result'])
+CACHE_ANSWER_AGE = Histogram('car_price_cache_answer_age_seconds', 'Age of answers served from the prediction cache',
+                             buckets=(60, 300, 900, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 24 * 3600))
+MODEL_LOADS = Counter('car_price_model_loads_total', 'Trained models loaded from disk')
+ACTIVE_DRIVERS = Gauge('car_price_active_drivers', 'Chrome instances running in this process')
+BROWSER_QUEUE = Gauge('car_price_browser_queue', 'Requests waiting for a browser slot in this process')
+QUEUED_JOBS = Gauge('car_price_queued_jobs', 'Pricing jobs waiting or running in this process', ['status'])
+STORAGE_BYTES = Gauge('car_price_storage_bytes', 'Bytes used by scraped data and models at the last scan', ['directory'])
+STORAGE_EVICTED_BYTES = Counter('car_price_storage_evicted_bytes_total', 'Bytes reclaimed by storage eviction',
+                                ['reason'])
+PREWARM_SPECS = Counter('car_price_prewarm_specs_total', 'Popular specs handled by the pre-warmer by outcome',
+                        ['result'])
+
+def stage_summary():
+    """{stage: (count, total_seconds)} for printing a timing breakdown"""
+    with STAGE_SECONDS._lock:
+        children = list(STAGE_SECONDS._children.items())
+    return {key[0]: (child.count, child.sum) for key, child in children}
@@ -0,0 +1,240 @@
+# core/model_registry.py - INDEX OF TRAINED MODELS AND NEAREST-SPEC LOOKUP
+"""SQLite index of the per-spec models in Data/Models/.
+
+    python -m core.model_registry sync            # index model files trained before the registry existed
+    python -m core.model_registry list --brand "پژو 206"
+    python -m core.model_registry pin Data/Models/user_model_1a2b3c4d.pkl   # never evicted, see core.storage
+
+Every saved model is registered with its spec, the year and mileage
+window and categories of its training data, sample count, metrics, file
+size, training time and last use. A search only collects ads by brand,
+so a model trained for one spec also prices other years and mileages of
+the same brand; nearest() finds the model whose training data is closest
+to a new spec, so it is answered without another scrape.
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from core.config import MODELS_DIR, MODEL_REGISTRY_FILE, MODEL_REGISTRY_MAX_DISTANCE, normalize_search_query
+
+MILEAGE_PER_YEAR = 20000  # km of mileage difference weighted like one model year
+
+COLUMNS = ['model_file', 'brand_key', 'brand_model', 'year_model', 'mileage', 'gearbox', 'fuel_type',
+           'samples', 'test_mae', 'test_r2', 'year_min', 'year_max', 'mileage_min', 'mileage_max',
+           'gearboxes', 'fuel_types', 'size_bytes', 'trained_at', 'last_used_at', 'uses']
+
+def model_entry(model_file, model_data):
+    """Registry row for a trained model's data"""
+    user_data = model_data['user_data']
+    metrics = model_data.get('metrics', {})
+    stats = model_data.get('feature_stats', {})
+    preprocessors = model_data.get('preprocessors', {})
+
+    def known(column):
+        encoder = preprocessors.get(f'{column}_encoder')
+        classes = encoder.classes_ if encoder is not None else [user_data[column]]
+        return json.dumps(sorted({normalize_search_query(value) for value in classes}), ensure_ascii=False)
+
+    year = int(user_data['year_model'])
+    mileage = int(user_data['mileage'])
+    now = time.time()
+    return {
+        'model_file': os.path.abspath(model_file),
+        'brand_key': normalize_search_query(user_data['brand_model']),
+        'brand_model': user_data['brand_model'],
+        'year_model': year,
+        'mileage': mileage,
+        'gearbox': user_data['gearbox'],
+        'fuel_type': user_data['fuel_type'],
+        'samples': int(metrics.get('samples', 0)),
+        'test_mae': float(metrics.get('test_mae', 0)),
+        'test_r2': float(metrics.get('test_r2', 0)),
+        'year_min': int(stats.get('year_model', {}).get('min', year)),
+        'year_max': int(stats.get('year_model', {}).get('max', year)),
+        'mileage_min': int(stats.get('mileage', {}).get('min', mileage)),
+        'mileage_max': int(stats.get('mileage', {}).get('max', mileage)),
+        'gearboxes': known('gearbox'),
+        'fuel_types': known('fuel_type'),
+        'size_bytes': os.path.getsize(model_file) if os.path.exists(model_file) else 0,
+        'trained_at': now,
+        'last_used_at': now,
+        'uses': 0
+    }
+
+def spec_distance(entry, user_data):
+    """How far user_data lies outside the training data of a registered model, 0 when fully inside"""
+    year = int(user_data['year_model'])
+    mileage = int(user_data['mileage'])
+    distance = max(0, entry['year_min'] - year, year - entry['year_max'])
+    distance += max(0, entry['mileage_min'] - mileage, mileage - entry['mileage_max']) / MILEAGE_PER_YEAR
+    # A category the model never saw is encoded as an arbitrary other one
+    if normalize_search_query(user_data['gearbox']) not in json.loads(entry['gearboxes']):
+        distance += 1
+    if normalize_search_query(user_data['fuel_type']) not in json.loads(entry['fuel_types']):
+        distance += 1
+    return distance
+
+class ModelRegistry:
+    """SQLite index of trained models, shared by every worker process on the machine"""
+
+    def __init__(self, db_file=MODEL_REGISTRY_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_file) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS models ("
+                "model_file TEXT PRIMARY KEY, brand_key TEXT NOT NULL, brand_model TEXT NOT NULL, "
+                "year_model INTEGER, mileage INTEGER, gearbox TEXT, fuel_type TEXT, "
+                "samples INTEGER, test_mae REAL, test_r2 REAL, "
+                "year_min INTEGER, year_max INTEGER, mileage_min INTEGER, mileage_max INTEGER, "
+                "gearboxes TEXT, fuel_types TEXT, size_bytes INTEGER, "
+                "trained_at REAL, last_used_at REAL, uses INTEGER NOT NULL DEFAULT 0, "
+                "pinned INTEGER NOT NULL DEFAULT 0)"
+            )
+            if 'pinned' not in {row['name'] for row in conn.execute("PRAGMA table_info(models)")}:
+                # Registries created before pins existed
+                conn.execute("ALTER TABLE models ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_models_brand ON models (brand_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_models_last_used ON models (last_used_at)")
+            self._local.conn = conn
+        return conn
+
+    def register(self, model_file, model_data):
+        """Index a saved model, returns its entry
+
+        A retrained model replaces the entry of the same file but keeps its
+        use count and pin.
+        """
+        entry = model_entry(model_file, model_data)
+        updates = ', '.join(f"{column} = excluded.{column}" for column in COLUMNS
+                            if column not in ('model_file', 'uses'))
+        self._connect().execute(
+            f"INSERT INTO models ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+            f"ON CONFLICT (model_file) DO UPDATE SET {updates}",
+            [entry[column] for column in COLUMNS]
+        )
+        return entry
+
+    def touch(self, model_file):
+        """Record that a model answered a prediction"""
+        self._connect().execute(
+            "UPDATE models SET last_used_at = ?, uses = uses + 1 WHERE model_file = ?",
+            (time.time(), os.path.abspath(model_file))
+        )
+
+    def pin(self, model_file, pinned=True):
+        """Protect a model (and its training data) from storage eviction, or release it"""
+        self._connect().execute("UPDATE models SET pinned = ? WHERE model_file = ?",
+                                (int(pinned), os.path.abspath(model_file)))
+
+    def get(self, model_file):
+        row = self._connect().execute("SELECT * FROM models WHERE model_file = ?",
+                                      (os.path.abspath(model_file),)).fetchone()
+        return dict(row) if row else None
+
+    def remove(self, model_file):
+        self._connect().execute("DELETE FROM models WHERE model_file = ?", (os.path.abspath(model_file),))
+
+    def entries(self, brand_model=None):
+        """Registered models, most recently used first, optionally of one brand only"""
+        if brand_model is None:
+            rows = self._connect().execute("SELECT * FROM models ORDER BY last_used_at DESC").fetchall()
+        else:
+            rows = self._connect().execute(
+                "SELECT * FROM models WHERE brand_key = ? ORDER BY last_used_at DESC",
+                (normalize_search_query(brand_model),)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def nearest(self, user_data, max_distance=MODEL_REGISTRY_MAX_DISTANCE):
+        """Entry of the best existing model for user_data with its 'distance', None when none is close enough
+
+        Only models of the same brand are considered. The smallest distance
+        wins, then the most samples, then the most recent training. Entries
+        whose file is gone are dropped on the way.
+        """
+        candidates = []
+        for entry in self.entries(user_data['brand_model']):
+            if not os.path.exists(entry['model_file']):
+                self.remove(entry['model_file'])
+                continue
+            entry['distance'] = round(spec_distance(entry, user_data), 3)
+            if entry['distance'] <= max_distance:
+                candidates.append(entry)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda entry: (entry['distance'], -entry['samples'], -entry['trained_at']))
+
+    def sync(self, models_dir=MODELS_DIR):
+        """Register model files that are not indexed yet and drop entries of deleted files, returns (added, removed)"""
+        import joblib
+
+        registered = {entry['model_file'] for entry in self.entries()}
+        added = removed = 0
+        for model_file in glob.glob(os.path.join(models_dir, '*.pkl')):
+            if os.path.abspath(model_file) in registered:
+                continue
+            try:
+                model_data = joblib.load(model_file)
+            except Exception as e:
+                print(f"⚠️ خطا در خواندن مدل {model_file}: {e}")
+                continue
+            # The global model is not a per-spec model
+            if isinstance(model_data, dict) and 'user_data' in model_data:
+                entry = self.register(model_file, model_data)
+                self._connect().execute("UPDATE models SET trained_at = ?, last_used_at = ? WHERE model_file = ?",
+                                        (os.path.getmtime(model_file), os.path.getmtime(model_file),
+                                         entry['model_file']))
+                added += 1
+        for model_file in registered:
+            if not os.path.exists(model_file):
+                self.remove(model_file)
+                removed += 1
+        return added, removed
+
+_registry = None
+
+def get_model_registry():
+    """Process wide registry on MODEL_REGISTRY_FILE"""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['sync', 'list', 'pin', 'unpin'])
+    parser.add_argument('model_file', nargs='?', help='model file to pin or unpin')
+    parser.add_argument('--brand', help='list the models of this brand/model only')
+    args = parser.parse_args()
+
+    registry = get_model_registry()
+    if args.command in ('pin', 'unpin'):
+        if not args.model_file:
+            parser.error(f"{args.command} needs a model file")
+        registry.pin(args.model_file, args.command == 'pin')
+        return
+    if args.command == 'sync':
+        added, removed = registry.sync()
+        print(f"✅ {added} مدل ثبت شد، {removed} مدل حذف‌شده از فهرست خارج شد")
+        return
+    for entry in registry.entries(args.brand):
+        print(f"{entry['brand_model']} {entry['year_model']} {entry['mileage']:,}km | "
+              f"{entry['samples']} samples R² {entry['test_r2']:.2f} | {entry['size_bytes'] / 1024:.0f} KB | "
+              f"used {entry['uses']}x{' 📌' if entry['pinned'] else ''}, last {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used_at']))} | "
+              f"{os.path.basename(entry['model_file'])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+# core/pipeline.py - SEARCH → SCRAPE → TRAIN → PREDICT
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from core.config import (get_user_data_file, get_user_model_file, STAGE_DEADLINES,
+                         CONVERGENCE_TOLERANCE, SKIP_SEEN_ADS, PROFILE_PIPELINE, GLOBAL_MODEL_FILE)
+from core.cancellation import CancellationToken, OperationCancelled
+from core.progress import emit
+from core.latency_budget import LatencyModel
+from core.state_store import get_state_store
+
+# One writer thread: CSV and model files are saved off the critical path
+_persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipeline-persist')
+
+class PipelineCancelled(OperationCancelled):
+    """Raised when a cancelled pipeline is asked to run its next stage"""
+
+class PredictionPipeline:
+    """Search → scrape → train → predict for one car, shared by the CLI and the web app
+
+    Stages hand their results to each other in memory (URLs, scraped rows,
+    trained model) while the CSV and model files are written in the background.
+    Hooks run around every stage and timings are kept per stage. Each stage
+    gets a child of cancel_token with its own deadline: cancel() makes the
+    running stage wind down and stops the pipeline, a missed deadline makes
+    the stage return what it has so far.
+
+    With a budget in seconds, scrape depth and deadlines come from the
+    latency model's measured timings instead of max_ads/max_scrolls. A
+    latency model also learns from every stage this pipeline runs. With a
+    convergence_tolerance, scraping stops as soon as small models trained on
+    the ads so far agree on the price (see core.convergence). Scraped ads are
+    recorded in the seen-ads index; with skip_seen the search ignores them.
+    Saved models are indexed in the model registry, and every write lets
+    the storage manager evict old files in the background.
+    """
+
+    STAGES = ('search', 'scrape', 'train', 'predict')
+
+    def __init__(self, user_data, max_ads=50, max_scrolls=60, progress=None,
+                 cancel_token=None, deadlines=None, budget=None, latency_model=None,
+                 convergence_tolerance=CONVERGENCE_TOLERANCE, skip_seen=SKIP_SEEN_ADS, seen_ads=None,
+                 registry=None, storage=None):
+        self.user_data = user_data
+        self.max_ads = max_ads
+        self.max_scrolls = max_scrolls
+        self.deadlines = dict(STAGE_DEADLINES, **(deadlines or {}))
+        self.plan = None
+        if budget:
+            self.plan = latency_model.plan(budget)
+            self.max_ads = self.plan['max_ads']
+            self.max_scrolls = self.plan['max_scrolls']
+            self.deadlines.update(self.plan['deadlines'])
+        self.progress = latency_model.tracker(progress) if latency_model is not None else progress
+        self.cancel_token = cancel_token or CancellationToken()
+        self.convergence_tolerance = convergence_tolerance
+        self.convergence = None
+        self.skip_seen = skip_seen
+        self.seen_ads = seen_ads
+        self.registry = registry
+        self.storage = storage
+        self.stage_token = self.cancel_token
+        spec = (user_data['brand_model'], user_data['year_model'], user_data['mileage'],
+                user_data['gearbox'], user_data['fuel_type'])
+        self.data_file = get_user_data_file(*spec)
+        self.model_file = get_user_model_file(*spec)
+
+        self.urls = None
+        self.rows = None
+        self.model_data = None
+        self.predicted_price = None
+        self.timings = {}
+        self.deadline_hits = []
+        self._hooks = {'before_stage': [], 'after_stage': [], 'stage_failed': []}
+        self._pending_writes = []
+
+    def add_hook(self, event, hook):
+        """Register hook(pipeline, stage) for 'before_stage', hook(pipeline, stage, result) for 'after_stage'
+        or hook(pipeline, stage, error) for 'stage_failed' (the stage raised, the error is re-raised)"""
+        self._hooks[event].append(hook)
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.cancelled
+
+    @property
+    def samples(self):
+        if self.model_data:
+            return int(self.model_data['metrics']['samples'])
+        return len(self.rows or [])
+
+    def state(self):
+        """JSON serializable snapshot, so another worker can continue the pipeline"""
+        return {
+            'urls': self.urls,
+            'rows': self.rows,
+            'samples': self.samples,
+            'predicted_price': self.predicted_price,
+            'data_file': self.data_file,
+            'model_file': self.model_file,
+            'timings': self.timings
+        }
+
+    def restore(self, state):
+        """Continue from a state() snapshot saved by an earlier step"""
+        self.urls = state.get('urls')
+        self.rows = state.get('rows')
+        self.predicted_price = state.get('predicted_price')
+        self.timings.update(state.get('timings') or {})
+        return self
+
+    def run_stage(self, stage):
+        """Run one stage with its hooks and timing, returns the stage result"""
+        self.check_cancelled(stage)
+        for hook in self._hooks['before_stage']:
+            hook(self, stage)
+        self.stage_token = self.cancel_token.child(self.deadlines.get(stage))
+        emit(self.progress, 'stage_started', stage=stage)
+        started = time.perf_counter()
+        try:
+            result = getattr(self, stage)()
+        except Exception as e:
+            for hook in self._hooks['stage_failed']:
+                hook(self, stage, e)
+            raise
+        self.timings[stage] = round(time.perf_counter() - started, 3)
+        emit(self.progress, 'stage_done', stage=stage, seconds=self.timings[stage], ok=bool(result))
+        if self.stage_token.expired and not self.cancelled:
+            self.deadline_hits.append(stage)
+        for hook in self._hooks['after_stage']:
+            hook(self, stage, result)
+        return result
+
+    def search(self):
+        # Browser and ML stacks are imported on first use to keep worker startup fast
+        from core.save_urls import save_specific_urls
+
+        self.urls = save_specific_urls(
+            brand_model=self.user_data['brand_model'],
+            year_model=self.user_data['year_model'],
+            mileage=self.user_data['mileage'],
+            gearbox=self.user_data['gearbox'],
+            fuel_type=self.user_data['fuel_type'],
+            max_ads=self.max_ads,
+            max_scrolls=self.max_scrolls,
+            progress=self.progress,
+            cancel_token=self.stage_token,
+            skip_seen=self.skip_seen,
+            seen_ads=self.seen_ads
+        )
+        return self.urls
+
+    def scrape(self):
+        from core.scrap_specific_ads import scrape_ad_rows
+
+        # Searches can overshoot by part of a scroll, only max_ads pages are fetched
+        urls = (self.urls or [])[:self.max_ads]
+        if self.convergence_tolerance:
+            from core.convergence import ConvergenceMonitor
+            self.convergence = ConvergenceMonitor(self.user_data, tolerance=self.convergence_tolerance,
+                                                  progress=self.progress)
+        self.rows = scrape_ad_rows(urls, progress=self.progress, cancel_token=self.stage_token,
+                                   stop_when=self.convergence)
+        if self.rows:
+            self._persist(self._save_rows, list(self.rows))
+            self._persist(self._mark_seen, [row[-1] for row in self.rows])
+        return self.rows
+
+    def _save_rows(self, rows):
+        from core.scrap_specific_ads import save_ad_rows
+
+        save_ad_rows(rows, self.data_file)
+        self._after_write()
+
+    def _mark_seen(self, urls):
+        from core.ad_index import ad_token, get_seen_ads
+
+        if self.seen_ads is None:
+            self.seen_ads = get_seen_ads()
+        self.seen_ads.add_many(ad_token(url) for url in urls)
+        self.seen_ads.save()
+
+    def train(self):
+        from core.train_user_model import ads_dataframe, train_model_on_dataframe
+
+        self.model_data = train_model_on_dataframe(ads_dataframe(self.rows or []), self.model_file,
+                                                   self.user_data, progress=self.progress, save=False,
+                                                   cancel_token=self.stage_token)
+        if self.model_data:
+            self._persist(self._save_model, self.model_data)
+        return self.model_data
+
+    def _save_model(self, model_data):
+        from core.train_user_model import save_model
+        from core.model_registry import get_model_registry
+
+        if save_model(model_data, self.model_file):
+            if self.registry is None:
+                self.registry = get_model_registry()
+            self.registry.register(self.model_file, model_data)
+        self._after_write()
+
+    def _after_write(self):
+        if self.storage is None:
+            from core.storage import get_storage_manager
+            self.storage = get_storage_manager()
+        self.storage.evict_in_background()
+
+    def predict(self):
+        from core.train_user_model import predict_with_model, predict_user_price
+
+        if self.model_data is not None:
+            predicted_price = predict_with_model(self.model_data, self.user_data)
+        else:
+            self.wait_persisted()
+            predicted_price = predict_user_price(self.model_file, self.user_data)
+        self.predicted_price = float(predicted_price) if predicted_price else None
+        return self.predicted_price
+
+    def _persist(self, write, *args):
+        self._pending_writes.append(_persist_executor.submit(write, *args))
+
+    def wait_persisted(self, timeout=None):
+        """Block until this pipeline's background file writes are done"""
+        pending, self._pending_writes = self._pending_writes, []
+        for future in pending:
+            future.result(timeout)
+
+    def check_cancelled(self, stage):
+        """Raise PipelineCancelled once the pipeline was cancelled"""
+        if self.cancelled:
+            raise PipelineCancelled(stage)
+
+    def run(self):
+        """Run every stage, returns the result dict or None when a stage fails or is cancelled"""
+        try:
+            # Step 2: Search for similar ads
+            print("\n📍 مرحله 2: جستجوی آگهی‌های مشابه در دیوار")
+            print("⏳ در حال جستجو... این مرحله ممکن است چند دقیقه طول بکشد")
+
+            urls = self.run_stage('search')
+            self.check_cancelled('search')
+            if not urls:
+                print("❌ هیچ آگهی مشابهی پیدا نشد. لطفا مشخصات را بررسی کنید.")
+                return None
+
+            # Step 3: Scrape ad details
+            print(f"\n📍 مرحله 3: استخراج اطلاعات از {len(self.urls)} آگهی")
+            print("⏳ در حال استخراج اطلاعات...")
+
+            ads_count = len(self.run_stage('scrape'))
+            self.check_cancelled('scrape')
+            if ads_count < 5:
+                print(f"❌ داده کافی جمع‌آوری نشد (فقط {ads_count} آگهی معتبر).")
+                print("💡 پیشنهاد: مشخصات خودرو را عمومی‌تر وارد کنید")
+                return None
+
+            # Step 4: Train ML model
+            print(f"\n📍 مرحله 4: آموزش مدل هوش مصنوعی")
+            print("⏳ در حال آموزش مدل...")
+
+            model_data = self.run_stage('train')
+            self.check_cancelled('train')
+            if not model_data:
+                print("❌ آموزش مدل با شکست مواجه شد.")
+                return None
+
+            # Step 5: Predict price
+            print("\n📍 مرحله 5: پیش‌بینی قیمت")
+
+            if not self.run_stage('predict'):
+                print("❌ پیش‌بینی قیمت با شکست مواجه شد.")
+                return None
+        except PipelineCancelled as e:
+            print(f"⏹️  اجرای خط لوله در مرحله {e} لغو شد")
+            return None
+
+        return {
+            'predicted_price': self.predicted_price,
+            'samples': self.samples,
+            'data_file': self.data_file,
+            'model_file': self.model_file,
+            'timings': self.timings,
+            'deadline_hits': self.deadline_hits,
+            'plan': self.plan
+        }
+
+def run_prediction_pipeline(user_data, max_ads=50, max_scrolls=60, progress=None, cancel_token=None,
+                            budget=None, profile=PROFILE_PIPELINE):
+    """Collect fresh ads, train a model and predict the price for user_data
+
+    budget (seconds) picks the scrape depth from measured timings instead of max_ads/max_scrolls.
+    With profile, every stage is profiled and the report directory is returned as 'profile_dir'.
+    """
+    pipeline = PredictionPipeline(user_data, max_ads=max_ads, max_scrolls=max_scrolls, progress=progress,
+                                  cancel_token=cancel_token, budget=budget,
+                                  latency_model=LatencyModel(get_state_store()))
+    profiler = None
+    if profile:
+        from core.profiling import StageProfiler
+        profiler = StageProfiler().attach(pipeline)
+    if pipeline.plan:
+        print(f"⏱️  بودجه زمانی {budget} ثانیه: {pipeline.max_ads} آگهی، {pipeline.max_scrolls} اسکرول")
+    result = pipeline.run()
+    # Callers expect the data and model files on disk once this returns
+    pipeline.wait_persisted()
+    if profiler is not None:
+        print(f"🔬 گزارش پروفایل: {profiler.run_dir}")
+        if result:
+            result['profile_dir'] = profiler.run_dir
+    return result
+
+def quick_prediction(user_data, cache=None, registry=None, global_model_file=GLOBAL_MODEL_FILE):
+    """Answer from the result cache, an existing model or the global model, None when a scrape is needed
+
+    The spec's own model is tried first, then the registered model of the
+    same brand whose training data is closest to the spec.
+    """
+    if cache is not None:
+        cached, cache_state = cache.get(user_data)
+        if cached:
+            return {
+                'predicted_price': cached['predicted_price'],
+                'samples': cached['samples'],
+                'source': 'cache',
+                'cache_state': cache_state,
+                'answer_age': round(cached['age'])
+            }
+
+    # Models trained on this brand's ads refine the global answer
+    from core.model_registry import get_model_registry
+
+    registry = registry or get_model_registry()
+    result = None
+    found = find_trained_model(user_data, registry)
+    if found is not None:
+        from core.train_user_model import predict_user_price
+
+        model_file = found.pop('model_file')
+        predicted_price = predict_user_price(model_file, user_data)
+        if predicted_price:
+            registry.touch(model_file)
+            result = dict(found, predicted_price=float(predicted_price))
+    if result is None:
+        from core.global_model import predict_global
+
+        result = predict_global(user_data, model_file=global_model_file)
+        if result is None:
+            return None
+        result['source'] = 'global_model'
+
+    if cache is not None:
+        cache.put(user_data, result['predicted_price'], result['samples'])
+    return result
+
+def find_trained_model(user_data, registry):
+    """{'model_file', 'samples', 'source'} of the spec's own model ('model') or the nearest one ('similar_model')"""
+    model_file = get_user_model_file(user_data['brand_model'], user_data['year_model'], user_data['mileage'],
+                                      user_data['gearbox'], user_data['fuel_type'])
+    if os.path.exists(model_file):
+        entry = registry.get(model_file) or {}
+        return {'model_file': model_file, 'samples': entry.get('samples', 0), 'source': 'model'}
+    entry = registry.nearest(user_data)
+    if entry is None:
+        return None
+    return {'model_file': entry['model_file'], 'samples': entry['samples'], 'source': 'similar_model',
+            'distance': entry['distance']}
+
+def save_search_history(user_data, predicted_price, samples_count, source=None):
+    """Save user search history (queued, written in batches by core.history_store)"""
+    try:
+        from core.history_store import get_history_store
+
+        get_history_store().record(user_data, predicted_price, samples_count, source)
+    except Exception as e:
+        print(f"Error saving search history: {e}")
@@ -0,0 +1,260 @@
+# core/prewarm.py - POPULARITY-DRIVEN PRE-WARMING OF SEARCHES, DATA AND MODELS
+"""Keep the most requested car specs answered from fresh data.
+
+    python -m core.prewarm --dry-run    # rank the popular specs and show what a round would do
+    python -m core.prewarm              # run one round now (--every N to loop)
+
+Specs are ranked by how often the search history saw them in the last
+PREWARM_WINDOW_DAYS. Each round walks the PREWARM_TOP most requested ones:
+  - a cached answer younger than half its TTL is already warm,
+  - a model of the spec younger than PREWARM_MODEL_MAX_AGE re-prices the
+    spec into the prediction cache without a browser,
+  - anything else is searched, scraped and retrained in the background.
+Scrapes stay within a budget: at most PREWARM_MAX_SCRAPES per round, none
+after PREWARM_ROUND_SECONDS, none while users wait for a browser slot or
+the load average per CPU is above PREWARM_MAX_LOAD. Specs left over are
+picked up by the next round. Pre-warmed answers are not written to the
+search history, so they never count as requests.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from core.config import (PREWARM_INTERVAL, PREWARM_TOP, PREWARM_WINDOW_DAYS, PREWARM_MAX_SCRAPES,
+                         PREWARM_ROUND_SECONDS, PREWARM_MAX_LOAD, PREWARM_MODEL_MAX_AGE, PREWARM_DEPTH,
+                         SINGLEFLIGHT_LEASE_TTL, get_user_model_file)
+from core.metrics import PREWARM_SPECS
+from core.result_cache import spec_cache_key
+
+SPEC_FIELDS = ('brand_model', 'year_model', 'mileage', 'gearbox', 'fuel_type')
+
+def load_per_cpu():
+    """1 minute load average divided by the CPU count, 0 where the platform has none"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+class Prewarmer:
+    """Refresh the most requested specs in a daemon thread every `interval` seconds
+
+    One worker runs a round at a time (lease in the state store), and a
+    spec is never refreshed twice at once: its scrape takes the same lease
+    as the prediction cache's stale refresh.
+    """
+
+    LEASE_KEY = 'prewarm_round'
+
+    def __init__(self, store, cache, history=None, registry=None, run=None, interval=PREWARM_INTERVAL,
+                 top=PREWARM_TOP, window_days=PREWARM_WINDOW_DAYS, max_scrapes=PREWARM_MAX_SCRAPES,
+                 round_seconds=PREWARM_ROUND_SECONDS, max_load=PREWARM_MAX_LOAD,
+                 model_max_age=PREWARM_MODEL_MAX_AGE, depth=PREWARM_DEPTH, browser=None, startup_delay=120):
+        self.store = store
+        self.cache = cache
+        self.history = history
+        self.registry = registry
+        self.run = run or self._scrape
+        self.interval = interval
+        self.top = top
+        self.window = window_days * 24 * 3600
+        self.max_scrapes = max_scrapes
+        self.round_seconds = round_seconds
+        self.max_load = max_load
+        self.model_max_age = model_max_age
+        self.depth = depth
+        self.browser = browser
+        self.startup_delay = startup_delay
+        self.last_round = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _history(self):
+        if self.history is None:
+            from core.history_store import get_history_store
+            self.history = get_history_store()
+        return self.history
+
+    def _registry(self):
+        if self.registry is None:
+            from core.model_registry import get_model_registry
+            self.registry = get_model_registry()
+        return self.registry
+
+    def _browser(self):
+        if self.browser is None:
+            from core.browser import browser_limiter
+            self.browser = browser_limiter
+        return self.browser
+
+    def _scrape(self, user_data):
+        from core.pipeline import run_prediction_pipeline
+        return run_prediction_pipeline(user_data, max_ads=self.depth, max_scrolls=40)
+
+    def start(self):
+        """Start the schedule, returns False when it is disabled (interval 0) or already running"""
+        if self.interval <= 0 or self._thread is not None:
+            return False
+        self._thread = threading.Thread(target=self._loop, daemon=True, name='prewarmer')
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stopped.set()
+
+    def _loop(self):
+        delay = self.startup_delay
+        while not self._stopped.wait(delay):
+            self.run_once()
+            delay = self.interval
+
+    def rank(self):
+        """The `top` most requested specs of the window, same cache key merged, as user_data with 'requests'"""
+        since = time.time() - self.window if self.window else None
+        specs = {}
+        for row in self._history().most_requested_specs(self.top * 5, since=since):
+            key = spec_cache_key(row)
+            if key in specs:
+                specs[key]['requests'] += row['requests']
+            else:
+                specs[key] = dict({field: row[field] for field in SPEC_FIELDS}, requests=row['requests'])
+        return sorted(specs.values(), key=lambda spec: -spec['requests'])[:self.top]
+
+    def plan(self, user_data):
+        """'warm', 'model' (re-price from the spec's model) or 'scrape'"""
+        cached = self.cache.peek(user_data)
+        if cached is not None and cached['age'] < self.cache.ttl / 2:
+            return 'warm'
+        model_file = get_user_model_file(user_data['brand_model'], user_data['year_model'], user_data['mileage'],
+                                          user_data['gearbox'], user_data['fuel_type'])
+        try:
+            if time.time() - os.path.getmtime(model_file) < self.model_max_age:
+                return 'model'
+        except OSError:
+            pass
+        return 'scrape'
+
+    def over_budget(self, scrapes, started):
+        """Why no further scrape may start this round, None while the budget allows one"""
+        if scrapes >= self.max_scrapes:
+            return 'scrapes'
+        if time.time() - started >= self.round_seconds:
+            return 'time'
+        if self.max_load and load_per_cpu() > self.max_load:
+            return 'load'
+        status = self._browser().status()
+        # Users come first: never take a browser someone is waiting for
+        if status['queued'] or status['active'] >= status['slots']:
+            return 'browser'
+        return None
+
+    def run_once(self, dry_run=False):
+        """Run one round unless another worker is, returns its report or None"""
+        if not self.store.add(self.LEASE_KEY, {'started_at': time.time(), 'pid': os.getpid()},
+                              ttl=self.round_seconds + SINGLEFLIGHT_LEASE_TTL):
+            return None
+        try:
+            report = self.warm(dry_run)
+        except Exception as e:
+            print(f"❌ خطا در گرم‌سازی خودروهای پرجستجو: {e}")
+            return None
+        finally:
+            self.store.delete(self.LEASE_KEY)
+        if not dry_run:
+            self.last_round = report
+        return report
+
+    def warm(self, dry_run=False):
+        """Walk the ranking once, returns {'specs': [...], <outcome>: count, 'deferred_by'}"""
+        started = time.time()
+        report = {'started_at': started, 'specs': [], 'warm': 0, 'model': 0, 'scrape': 0,
+                  'deferred': 0, 'busy': 0, 'failed': 0, 'deferred_by': None}
+        scrapes = 0
+        for spec in self.rank():
+            user_data = {field: spec[field] for field in SPEC_FIELDS}
+            action = self.plan(user_data)
+            if action == 'scrape':
+                reason = self.over_budget(scrapes, started)
+                if reason is None:
+                    scrapes += 1
+                else:
+                    action = 'deferred'
+                    report['deferred_by'] = report['deferred_by'] or reason
+            if not dry_run and action in ('model', 'scrape'):
+                action = self._refresh(user_data, action)
+            report[action] += 1
+            report['specs'].append(dict(spec, action=action))
+            if not dry_run:
+                PREWARM_SPECS.labels(result=action).inc()
+        report['seconds'] = round(time.time() - started, 1)
+        if not dry_run and (report['model'] or report['scrape']):
+            print(f"🔥 گرم‌سازی: {report['scrape']} جستجوی تازه، {report['model']} پیش‌بینی از مدل موجود، "
+                  f"{report['deferred']} به دور بعد موکول شد")
+        return report
+
+    def _refresh(self, user_data, action):
+        """Put a fresh answer for user_data into the cache, returns the outcome"""
+        try:
+            if action == 'model':
+                from core.train_user_model import predict_user_price
+
+                model_file = get_user_model_file(user_data['brand_model'], user_data['year_model'],
+                                                  user_data['mileage'], user_data['gearbox'], user_data['fuel_type'])
+                predicted_price = predict_user_price(model_file, user_data)
+                if not predicted_price:
+                    return 'failed'
+                entry = self._registry().get(model_file) or {}
+                self.cache.put(user_data, predicted_price, entry.get('samples', 0))
+                return 'model'
+
+            lease_key = f"prediction_refresh:{spec_cache_key(user_data)}"
+            if not self.store.add(lease_key, {'started_at': time.time()}, ttl=SINGLEFLIGHT_LEASE_TTL):
+                return 'busy'
+            try:
+                result = self.run(dict(user_data))
+            finally:
+                self.store.delete(lease_key)
+            if not result:
+                return 'failed'
+            self.cache.put(user_data, result['predicted_price'], result['samples'])
+            return 'scrape'
+        except Exception as e:
+            print(f"⚠️ خطا در گرم‌سازی {user_data['brand_model']}: {e}")
+            return 'failed'
+
+    def stats(self):
+        """Settings and the report of this process's last round"""
+        return {
+            'interval': self.interval,
+            'top': self.top,
+            'max_scrapes': self.max_scrapes,
+            'round_seconds': self.round_seconds,
+            'running': self._thread is not None and not self._stopped.is_set(),
+            'last_round': self.last_round
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='only rank the specs and show what would be done')
+    parser.add_argument('--top', type=int, default=PREWARM_TOP, help='most requested specs to keep warm')
+    parser.add_argument('--max-scrapes', type=int, default=PREWARM_MAX_SCRAPES, help='browser runs per round')
+    parser.add_argument('--every', type=int, default=0, help='keep running a round every N seconds')
+    args = parser.parse_args()
+
+    from core.result_cache import PredictionCache
+    from core.state_store import get_state_store
+
+    store = get_state_store()
+    prewarmer = Prewarmer(store, PredictionCache(store), top=args.top, max_scrapes=args.max_scrapes)
+    while True:
+        report = prewarmer.run_once(dry_run=args.dry_run)
+        if report is None:
+            print("⏳ دور گرم‌سازی دیگری در حال اجراست")
+        else:
+            print(json.dumps(report, indent=2, ensure_ascii=False))
+        if not args.every or args.dry_run:
+            break
+        time.sleep(args.every)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# core/profiling.py - OPT-IN PER-STAGE PROFILING
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from core.config import PROFILES_DIR, PROFILE_TOP
+
+# tracemalloc is process wide: it runs while any profiled stage does
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        _tracing_users += 1
+        tracemalloc.reset_peak()
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0:
+            tracemalloc.stop()
+
+def new_run_id():
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+class StageProfiler:
+    """Profile every stage of a PredictionPipeline with cProfile and tracemalloc
+
+    attach() registers stage hooks, so pipelines that are not profiled pay
+    nothing. Each stage writes <stage>.prof (pstats format) to
+    PROFILES_DIR/<run_id>/ and adds its timing, top functions and allocation
+    hotspots to report.json and summary.txt there. Several requests of one
+    web session can share a run_id and fill one report. Only the thread
+    running the stage is profiled; parallel search shards show up as time
+    spent waiting for them.
+    """
+
+    def __init__(self, run_id=None, output_dir=PROFILES_DIR, top=PROFILE_TOP):
+        self.run_id = run_id or new_run_id()
+        self.run_dir = os.path.join(output_dir, self.run_id)
+        self.top = top
+        self._active = None
+
+    def attach(self, pipeline):
+        pipeline.add_hook('before_stage', self.before_stage)
+        pipeline.add_hook('after_stage', self.after_stage)
+        pipeline.add_hook('stage_failed', self.stage_failed)
+        return self
+
+    def before_stage(self, pipeline, stage):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Another stage of this process is being profiled right now
+            profile = None
+        _start_tracing()
+        self._active = {'stage': stage, 'profile': profile, 'started': time.perf_counter(),
+                        'memory_before': tracemalloc.get_traced_memory()[0]}
+
+    def after_stage(self, pipeline, stage, result):
+        self._finish(pipeline, ok=bool(result))
+
+    def stage_failed(self, pipeline, stage, error):
+        self._finish(pipeline, ok=False, error=repr(error))
+
+    def _finish(self, pipeline, ok, error=None):
+        active, self._active = self._active, None
+        if active is None:
+            return
+        seconds = time.perf_counter() - active['started']
+        profile = active['profile']
+        if profile is not None:
+            profile.disable()
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            _stop_tracing()
+
+        stage = active['stage']
+        try:
+            os.makedirs(self.run_dir, exist_ok=True)
+            entry = {
+                'seconds': round(seconds, 4),
+                'ok': ok,
+                'peak_mb': round(peak / 2 ** 20, 2),
+                'retained_mb': round((current - active['memory_before']) / 2 ** 20, 2),
+                'allocation_hotspots': self._hotspots(snapshot)
+            }
+            if error:
+                entry['error'] = error
+            if profile is not None:
+                profile.dump_stats(os.path.join(self.run_dir, f'{stage}.prof'))
+                entry['top_functions'] = self._top_functions(profile)
+            self._write_report(pipeline, stage, entry)
+        except Exception as e:
+            print(f"⚠️ خطا در ذخیره گزارش پروفایل مرحله {stage}: {e}")
+
+    def _top_functions(self, profile):
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        rows = []
+        for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+            rows.append({'function': f"{os.path.basename(filename)}:{line}({name})", 'calls': calls,
+                         'own_seconds': round(own, 4), 'cumulative_seconds': round(cumulative, 4)})
+        rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+        return rows[:self.top]
+
+    def _hotspots(self, snapshot):
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')
+        ])
+        return [{'location': f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:self.top]]
+
+    def _write_report(self, pipeline, stage, entry):
+        report_file = os.path.join(self.run_dir, 'report.json')
+        report = {'run_id': self.run_id, 'user_data': pipeline.user_data, 'stages': {}}
+        if os.path.exists(report_file):
+            with open(report_file, encoding='utf-8') as f:
+                report = json.load(f)
+        report['stages'][stage] = entry
+        total = sum(stage_entry['seconds'] for stage_entry in report['stages'].values())
+        report['total_seconds'] = round(total, 4)
+        report['breakdown'] = {name: round(stage_entry['seconds'] / total, 3) if total else 0
+                               for name, stage_entry in report['stages'].items()}
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        with open(os.path.join(self.run_dir, 'summary.txt'), 'w', encoding='utf-8') as f:
+            f.write(format_summary(report))
+
+def format_summary(report):
+    """Plain-text version of a profile report"""
+    lines = [f"Run {report['run_id']}: {report['total_seconds']:.2f}s", '']
+    for stage, entry in report['stages'].items():
+        lines.append(f"{stage:<8} {entry['seconds']:>9.2f}s {report['breakdown'][stage]:>6.1%} "
+                     f"peak {entry['peak_mb']:.1f} MB")
+    for stage, entry in report['stages'].items():
+        lines += ['', f"== {stage} =="]
+        for row in entry.get('top_functions', [])[:15]:
+            lines.append(f"{row['cumulative_seconds']:>9.3f}s {row['own_seconds']:>9.3f}s "
+                         f"{row['calls']:>8} {row['function']}")
+        lines.append('-- allocations --')
+        for row in entry['allocation_hotspots'][:10]:
+            lines.append(f"{row['size_kb']:>10.1f} KB {row['count']:>8} {row['location']}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,46 @@
+# core/progress.py - PIPELINE PROGRESS EVENTS
+import time
+
+def emit(progress, event, **data):
+    """Send a progress event to the callback without ever breaking the pipeline"""
+    if progress is None:
+        return
+    try:
+        progress(event, data)
+    except Exception as e:
+        print(f"⚠️ خطا در ارسال رویداد پیشرفت {event}: {e}")
+
+class ConsoleProgress:
+    """Draw the terminal progress bar from pipeline events"""
+
+    def __init__(self):
+        self.bar = None
+
+    def __call__(self, event, data):
+        import progressbar
+
+        if event in ('search_started', 'scrape_started'):
+            maxval = data['max_scrolls'] if event == 'search_started' else data['total']
+            self.bar = progressbar.ProgressBar(maxval=max(maxval, 1),
+                                               widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage()])
+            self.bar.start()
+        elif self.bar is None:
+            return
+        elif event == 'scroll':
+            self.bar.update(min(data['scroll'], self.bar.maxval))
+        elif event in ('ad_parsed', 'ad_failed'):
+            self.bar.update(min(data['index'], self.bar.maxval))
+        elif event in ('search_done', 'scrape_done'):
+            self.bar.finish()
+            self.bar = None
+
+class StoreProgressPublisher:
+    """Append progress events to the shared state store for streaming to the browser"""
+
+    def __init__(self, store, key, ttl=None):
+        self.store = store
+        self.key = key
+        self.ttl = ttl
+
+    def __call__(self, event, data):
+        self.store.push_event(self.key, {'event': event, 'data': data, 'time': time.time()}, ttl=self.ttl)
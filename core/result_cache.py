@@ -0,0 +1,114 @@
+# core/result_cache.py - PREDICTION RESULT CACHE (STALE-WHILE-REVALIDATE)
+import threading
+import time
+from core.config import (PREDICTION_CACHE_TTL, PREDICTION_CACHE_STALE_TTL,
+                         PREDICTION_CACHE_MILEAGE_BUCKET, SINGLEFLIGHT_LEASE_TTL,
+                         normalize_search_query)
+from core.metrics import CACHE_LOOKUPS, CACHE_ANSWER_AGE
+
+_LOOKUP_RESULTS = {'fresh_hits': 'fresh', 'stale_hits': 'stale', 'misses': 'miss'}
+
+def spec_cache_key(user_data, mileage_bucket=PREDICTION_CACHE_MILEAGE_BUCKET):
+    """Normalized cache key for a car specification"""
+    mileage = int(user_data['mileage'])
+    if mileage_bucket:
+        mileage = int(round(mileage / mileage_bucket)) * mileage_bucket
+    return '|'.join([
+        normalize_search_query(user_data['brand_model']),
+        str(int(user_data['year_model'])),
+        str(mileage),
+        normalize_search_query(user_data['gearbox']),
+        normalize_search_query(user_data['fuel_type']),
+    ])
+
+class PredictionCache:
+    """Cache predicted prices by spec, serving stale answers while a refresh runs"""
+
+    def __init__(self, store, refresh=None, ttl=PREDICTION_CACHE_TTL,
+                 stale_ttl=PREDICTION_CACHE_STALE_TTL):
+        self.store = store
+        self.refresh = refresh  # refresh(user_data) -> {'predicted_price', 'samples'} or None
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._stats = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0,
+                       'refreshes': 0, 'answer_age_total': 0.0, 'answer_age_max': 0.0}
+
+    def get(self, user_data, background_refresh=True):
+        """Return (entry, state) with state one of 'fresh', 'stale' or 'miss'"""
+        key = spec_cache_key(user_data)
+        entry = self.store.get(f"prediction:{key}")
+        if entry is None:
+            self._record('misses')
+            return None, 'miss'
+
+        age = time.time() - entry['created_at']
+        entry['age'] = age
+        if age <= self.ttl:
+            self._record('fresh_hits', age)
+            return entry, 'fresh'
+
+        self._record('stale_hits', age)
+        if background_refresh:
+            self.refresh_in_background(user_data)
+        return entry, 'stale'
+
+    def peek(self, user_data):
+        """Cached entry with its 'age', or None; not counted as a lookup and never refreshes"""
+        entry = self.store.get(f"prediction:{spec_cache_key(user_data)}")
+        if entry is not None:
+            entry['age'] = time.time() - entry['created_at']
+        return entry
+
+    def put(self, user_data, predicted_price, samples):
+        entry = {
+            'predicted_price': float(predicted_price),
+            'samples': int(samples),
+            'created_at': time.time()
+        }
+        key = spec_cache_key(user_data)
+        self.store.set(f"prediction:{key}", entry, ttl=self.ttl + self.stale_ttl)
+        return entry
+
+    def refresh_in_background(self, user_data):
+        """Re-scrape and retrain in a daemon thread, once per spec across all workers"""
+        if self.refresh is None:
+            return False
+        lease_key = f"prediction_refresh:{spec_cache_key(user_data)}"
+        if not self.store.add(lease_key, {'started_at': time.time()}, ttl=SINGLEFLIGHT_LEASE_TTL):
+            return False
+
+        def run():
+            try:
+                result = self.refresh(dict(user_data))
+                if result:
+                    self.put(user_data, result['predicted_price'], result['samples'])
+                    self._record('refreshes')
+            except Exception as e:
+                print(f"❌ خطا در به‌روزرسانی پیش‌بینی ذخیره شده: {e}")
+            finally:
+                self.store.delete(lease_key)
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def _record(self, counter, age=None):
+        if counter in _LOOKUP_RESULTS:
+            CACHE_LOOKUPS.labels(result=_LOOKUP_RESULTS[counter]).inc()
+        if age is not None:
+            CACHE_ANSWER_AGE.observe(age)
+        with self._lock:
+            self._stats[counter] += 1
+            if age is not None:
+                self._stats['answer_age_total'] += age
+                self._stats['answer_age_max'] = max(self._stats['answer_age_max'], age)
+
+    def stats(self):
+        """Hit ratio and answer age of this process since start"""
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats['fresh_hits'] + stats['stale_hits']
+        lookups = hits + stats['misses']
+        stats['hit_ratio'] = hits / lookups if lookups else 0.0
+        stats['answer_age_avg'] = stats.pop('answer_age_total') / hits if hits else 0.0
+        return stats
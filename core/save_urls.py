@@ -1,33 +1,140 @@
 # save_urls.py - ROBUST VERSION FOR DYNAMIC CLASSES
+import math
+import threading
 import time
 import random
 import re
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-import progressbar
-from core.config import home_url, chrome_options, get_search_url
+from concurrent.futures import ThreadPoolExecutor
+from core.config import get_search_url, SEARCH_REGIONS, SEARCH_SORTS, SEARCH_SHARD_WORKERS, SKIP_SEEN_ADS
+from core.ad_index import canonicalize_ad_urls, get_seen_ads
+from core.progress import emit, ConsoleProgress
+from core.browser import browser_limiter, BrowserCapacityError, create_driver
+from core.metrics import STAGE_SECONDS
+from core.cancellation import CancellationToken, OperationCancelled
 
 def save_specific_urls(brand_model, year_model=None, mileage=None, gearbox=None, fuel_type=None, 
-                      max_ads=100, max_scrolls=50, scroll_pause_time=2.0):
-    """Scrape URLs for specific car specifications with robust dynamic class handling"""
+                      max_ads=100, max_scrolls=50, scroll_pause_time=2.0, progress=None, cancel_token=None,
+                      regions=None, sorts=None, shard_workers=SEARCH_SHARD_WORKERS, skip_seen=SKIP_SEEN_ADS,
+                      seen_ads=None):
+    """Scrape URLs for specific car specifications with robust dynamic class handling
+
+    With several regions/sort orders the search is split into shards that
+    scroll in parallel (each in its own browser slot, with its own scroll
+    budget); their URLs are merged and deduplicated by ad token. Scrolling
+    stops early when cancel_token is cancelled or past its deadline, the
+    URLs collected up to then are returned. With skip_seen, ads already in
+    the seen-ads index (core.ad_index) are ignored and do not count as new.
+    """
+    if progress is None:
+        progress = ConsoleProgress()
+    if cancel_token is None:
+        cancel_token = CancellationToken()
+    
+    shards = search_shards(regions or SEARCH_REGIONS, sorts or SEARCH_SORTS)
+    shard_scrolls = max_scrolls if len(shards) == 1 else max(3, math.ceil(max_scrolls / len(shards)))
     
-    search_url = get_search_url(brand_model, year_model, mileage, gearbox, fuel_type)
     print(f"🔍 جستجو برای: {brand_model}")
     if year_model:
         print(f"📅 سال: {year_model}")
     if mileage:
         print(f"🛣️  کارکرد: {mileage:,} کیلومتر")
-    print(f"🌐 لینک جستجو: {search_url}")
+    for region, sort in shards:
+        print(f"🌐 لینک جستجو: {get_search_url(brand_model, region=region, sort=sort)}")
     print(f"📊 هدف: جمع آوری حداکثر {max_ads} آگهی")
     
-    urls_collected = set()
+    collected = {}  # ad token -> URL, merged over all shards
+    if skip_seen and seen_ads is None:
+        seen_ads = get_seen_ads()
+    lock = threading.Lock()
+    state = {'started': False, 'scrolls': 0, 'skipped': set()}
+    # Shards share one child token so reaching the target stops the others
+    shards_token = cancel_token.child()
+    
+    def on_ready():
+        with lock:
+            first = not state['started']
+            state['started'] = True
+        if first:
+            print('🔗 در حال جمع آوری لینک آگهی ها...')
+            emit(progress, 'search_started', search_url=get_search_url(brand_model), max_ads=max_ads,
+                 max_scrolls=shard_scrolls * len(shards), shards=len(shards))
+    
+    def on_scroll(ads):
+        with lock:
+            before = len(collected)
+            for token, url in ads.items():
+                if token in collected:
+                    continue
+                if skip_seen and token in seen_ads:
+                    state['skipped'].add(token)
+                    continue
+                collected[token] = url
+            state['scrolls'] += 1
+            found, scrolls = len(collected), state['scrolls']
+        emit(progress, 'scroll', scroll=scrolls, max_scrolls=shard_scrolls * len(shards),
+             urls_found=found, new_urls=found - before)
+        if found >= max_ads:
+            shards_token.cancel()
+        return found - before
+    
+    def run_shard(shard):
+        region, sort = shard
+        return collect_shard_urls(get_search_url(brand_model, year_model, mileage, gearbox, fuel_type,
+                                                 region=region, sort=sort),
+                                  max_ads, shard_scrolls, scroll_pause_time, shards_token, on_ready, on_scroll,
+                                  on_wait=lambda position, eta: emit(progress, 'browser_queued',
+                                                                     position=position, eta=eta))
+    
+    started = time.time()
+    try:
+        if len(shards) == 1:
+            errors = [run_shard(shards[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, min(shard_workers, len(shards))),
+                                    thread_name_prefix='search-shard') as executor:
+                errors = list(executor.map(run_shard, shards))
+    finally:
+        STAGE_SECONDS.labels(stage='url_collection').observe(time.time() - started)
+    
+    # BrowserCapacityError of a lone shard still reaches the caller as before
+    failures = [error for error in errors if error is not None]
+    if len(failures) == len(shards) and not collected:
+        if isinstance(failures[0], BrowserCapacityError):
+            raise failures[0]
+        emit(progress, 'search_done', urls_found=0, scrolls=state['scrolls'], error=str(failures[0]))
+        return []
+    
+    if cancel_token.stopped:
+        print(f"   ⏱️  توقف جستجو ({cancel_token.reason()}) با {len(collected)} آگهی")
+    print(f"✅ جمع آوری لینک ها کامل شد: {len(collected)} آگهی از {state['scrolls']} اسکرول")
+    if state['skipped']:
+        print(f"   ⏭️  {len(state['skipped'])} آگهی قبلا استخراج شده بود و کنار گذاشته شد")
+    
+    # URLs are canonical already, one per ad token
+    final_urls = list(collected.values())
+    emit(progress, 'search_done', urls_found=len(final_urls), scrolls=state['scrolls'],
+         stopped=cancel_token.reason())
+    
+    return final_urls
+
+def search_shards(regions, sorts):
+    """Every (region, sort) combination to search, in a stable order"""
+    return [(region, sort) for region in regions for sort in sorts]
+
+def collect_shard_urls(search_url, max_ads, max_scrolls, scroll_pause_time, cancel_token,
+                       on_ready, on_scroll, on_wait=None):
+    """Scroll one search feed in its own browser, returns the error that ended it or None
+
+    on_scroll(ads) receives the {token: URL} ads seen after every scroll and
+    returns how many of them were new across all shards.
+    """
+    # Selenium is only loaded when a search actually runs
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    
+    urls_found = 0
     consecutive_empty_scrolls = 0
     max_consecutive_empty = 3
     scroll_count = 0
@@ -40,11 +147,18 @@ def save_specific_urls(brand_model, year_model=None, mileage=None, gearbox=None,
     enhanced_options.add_experimental_option('useAutomationExtension', False)
     enhanced_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
     
+    # Wait for a free browser slot
     try:
-        driver = webdriver.Chrome(
-            service=ChromeService(ChromeDriverManager().install()),
-            options=enhanced_options
-        )
+        slot = browser_limiter.acquire(on_wait=on_wait, cancel_token=cancel_token)
+    except OperationCancelled:
+        print("⏹️  جستجو پیش از دریافت مرورگر متوقف شد")
+        return None
+    except BrowserCapacityError as e:
+        return e
+    driver = None
+    
+    try:
+        driver = create_driver(base_options=enhanced_options)
         
         # Mask automation
         driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
@@ -56,22 +170,17 @@ def save_specific_urls(brand_model, year_model=None, mileage=None, gearbox=None,
         WebDriverWait(driver, 20).until(
             EC.presence_of_element_located((By.TAG_NAME, "body"))
         )
-        time.sleep(3)
+        cancel_token.sleep(3)
 
         screen_height = driver.execute_script("return window.screen.height;")
-        scroll_count = 0
-        
-        bar = progressbar.ProgressBar(maxval=max_scrolls,
-                                    widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage()])
-        print('🔗 در حال جمع آوری لینک آگهی ها...')
-        bar.start()
+        on_ready()
 
-        while (len(urls_collected) < max_ads and 
+        while (urls_found < max_ads and 
                scroll_count < max_scrolls and 
-               consecutive_empty_scrolls < max_consecutive_empty):
+               consecutive_empty_scrolls < max_consecutive_empty and
+               not cancel_token.stopped):
             
             scroll_count += 1
-            bar.update(scroll_count)
             
             # Enhanced scrolling
             scroll_variation = random.randint(-100, 100)
@@ -80,10 +189,10 @@ def save_specific_urls(brand_model, year_model=None, mileage=None, gearbox=None,
             
             # Variable pause time
             current_pause = scroll_pause_time + random.uniform(0.5, 1.5)
-            time.sleep(current_pause)
+            cancel_token.sleep(current_pause)
             
             # Enhanced "show more" button detection
-            if scroll_count % 3 == 0:
+            if scroll_count % 3 == 0 and not cancel_token.stopped:
                 show_more_selectors = [
                     "//button[contains(., 'آگهی‌های بیشتر')]",
                     "//button[contains(., 'نمایش بیشتر')]",
@@ -98,20 +207,19 @@ def save_specific_urls(brand_model, year_model=None, mileage=None, gearbox=None,
                             if button.is_displayed() and button.is_enabled():
                                 driver.execute_script("arguments[0].click();", button)
                                 print(f"   🔄 کلیک روی دکمه 'آگهی‌های بیشتر'")
-                                time.sleep(3)
+                                cancel_token.sleep(3)
                                 break
                     except:
                         pass
             
             # Extract URLs with multiple strategies
-            current_urls = extract_urls_robust(driver)
-            current_count = len(urls_collected)
-            urls_collected.update(current_urls)
-            new_urls = len(urls_collected) - current_count
+            current_ads = extract_urls_robust(driver)
+            new_urls = on_scroll(current_ads)
+            urls_found += new_urls
             
             # Progress reporting
             if new_urls > 0:
-                print(f"   ✅ {new_urls} آگهی جدید پیدا شد (مجموع: {len(urls_collected)})")
+                print(f"   ✅ {new_urls} آگهی جدید پیدا شد (مجموع: {urls_found})")
                 consecutive_empty_scrolls = 0
             else:
                 consecutive_empty_scrolls += 1
@@ -123,35 +231,36 @@ def save_specific_urls(brand_model, year_model=None, mileage=None, gearbox=None,
                     print("   🔄 تلاش با اسکرول جایگزین...")
                     random_scroll = random.randint(0, screen_height * 3)
                     driver.execute_script(f"window.scrollTo(0, {random_scroll});")
-                    time.sleep(2)
+                    cancel_token.sleep(2)
             
             # Early stopping conditions
-            if len(urls_collected) >= max_ads:
+            if urls_found >= max_ads:
                 print("   🎯 به حداکثر تعداد آگهی مورد نظر رسیدیم")
                 break
                 
             if consecutive_empty_scrolls >= max_consecutive_empty:
                 print("   ⏹️  توقف به دلیل عدم پیدا کردن آگهی جدید")
                 break
-
-        bar.finish()
-        driver.quit()
+        
+        return None
 
     except Exception as e:
         print(f"❌ خطا در جمع آوری لینک‌ها: {e}")
-        return []
-
-    print(f"✅ جمع آوری لینک ها کامل شد: {len(urls_collected)} آگهی از {scroll_count} اسکرول")
-    
-    # Filter and clean URLs
-    final_urls = clean_and_filter_urls(list(urls_collected))
-    print(f"🧹 پس از پاکسازی: {len(final_urls)} آگهی معتبر")
-    
-    return final_urls
+        return e
+    finally:
+        # Always close Chrome, even when the search failed or was cancelled
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        browser_limiter.release(slot)
 
 def extract_urls_robust(driver):
-    """Extract URLs using multiple robust strategies"""
-    urls = set()
+    """Extract ad URLs using multiple robust strategies, returns {ad token: canonical URL}"""
+    from bs4 import BeautifulSoup
+    
+    hrefs = []
     
     try:
         # Strategy 1: JavaScript extraction (most reliable)
@@ -194,10 +303,7 @@ def extract_urls_robust(driver):
             return Array.from(urls);
         """)
         
-        for href in script_urls:
-            if is_valid_ad_url(href):
-                full_url = urljoin(home_url, href)
-                urls.add(full_url)
+        hrefs.extend(script_urls)
         
         # Strategy 2: BeautifulSoup with flexible selectors
         soup = BeautifulSoup(driver.page_source, 'html.parser')
@@ -220,78 +326,24 @@ def extract_urls_robust(driver):
                 containers = soup.select(selector)
                 for container in containers:
                     links = container.find_all('a', href=True)
-                    for link in links:
-                        href = link['href']
-                        if is_valid_ad_url(href):
-                            full_url = urljoin(home_url, href) # type: ignore
-                            urls.add(full_url)
+                    hrefs.extend(link['href'] for link in links)
             except:
                 continue
         
         # Strategy 3: Direct href pattern matching
         all_links = soup.find_all('a', href=True)
-        for link in all_links:
-            href = link['href']
-            if is_valid_ad_url(href):
-                full_url = urljoin(home_url, href) # type: ignore
-                urls.add(full_url)
+        hrefs.extend(link['href'] for link in all_links)
                 
     except Exception as e:
         print(f"   ⚠️ خطا در استخراج لینک‌ها: {e}")
     
-    return urls
-
-def is_valid_ad_url(href):
-    """Check if URL is a valid ad URL"""
-    if not href:
-        return False
-    
-    # Must contain vehicle path
-    if '/v/' not in href and '/vehicle/' not in href:
-        return False
-    
-    # Should not be search or category pages
-    if '/s/' in href or '/c/' in href:
-        return False
-    
-    # Should not be external links
-    if href.startswith('http') and 'divar.ir' not in href:
-        return False
-    
-    # Should not be too short (likely invalid)
-    if len(href) < 10:
-        return False
-    
-    # Should not contain specific patterns that indicate non-ad pages
-    invalid_patterns = ['/login', '/signup', '/search', '/filter']
-    if any(pattern in href for pattern in invalid_patterns):
-        return False
-    
-    return True
-
-def clean_and_filter_urls(urls):
-    """Clean and filter URL list"""
-    cleaned_urls = set()
-    
-    for url in urls:
-        try:
-            # Parse URL to get clean version
-            parsed = urlparse(url)
-            clean_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
-            
-            # Basic validation
-            if (len(clean_url) > 30 and 
-                'divar.ir' in clean_url and 
-                '/v/' in clean_url):
-                cleaned_urls.add(clean_url)
-                
-        except:
-            continue
-    
-    return list(cleaned_urls)
+    # One compiled pattern validates, canonicalizes and deduplicates by ad token
+    return canonicalize_ad_urls(hrefs)
 
 def check_page_has_content(driver):
     """Check if page has content or shows no results"""
+    from selenium.webdriver.common.by import By
+    
     try:
         # Check for "no results" messages in Persian
         no_result_texts = [
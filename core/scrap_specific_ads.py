@@ -1,16 +1,12 @@
 # scrap_specific_ads.py - FIXED FOR ACTUAL DIVAR STRUCTURE
-import time
+import os
 import csv
 import re
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
-import progressbar
-from core.config import home_url, chrome_options
+from core.config import home_url
+from core.progress import emit, ConsoleProgress
+from core.browser import browser_limiter, create_driver
+from core.metrics import STAGE_SECONDS, ADS_SCRAPED, ADS_FAILED
+from core.cancellation import CancellationToken, OperationCancelled
 
 def extract_ad_data(soup, link):
     """Extract data from Divar ad page based on actual HTML structure"""
@@ -123,12 +119,49 @@ def extract_ad_data(soup, link):
         link
     ]
 
-def scrap_specific_ads(urls, data_file):
-    """Scrape details from specific ad URLs"""
+AD_COLUMNS = ['brand_model', 'year_model', 'mileage', 'color', 'gearbox', 'fuel_type', 'price', 'city', 'url']
+
+def scrap_specific_ads(urls, data_file, progress=None):
+    """Scrape details from specific ad URLs and save them to data_file"""
+    rows = scrape_ad_rows(urls, progress=progress)
+    if not rows:
+        print("❌ هیچ اطلاعات معتبری استخراج نشد")
+        return 0
+    
+    save_ad_rows(rows, data_file)
+    return len(rows)
+
+def save_ad_rows(rows, data_file):
+    """Write cleaned ad rows to a CSV file"""
+    os.makedirs(os.path.dirname(data_file), exist_ok=True)
+    with open(data_file, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(AD_COLUMNS)
+        writer.writerows(rows)
+    
+    print(f"✅ اطلاعات {len(rows)} آگهی ذخیره شد در: {data_file}")
+
+def scrape_ad_rows(urls, progress=None, cancel_token=None, stop_when=None):
+    """Scrape details from specific ad URLs, returns the cleaned rows in memory
+
+    Stops before the next ad once cancel_token is cancelled or past its
+    deadline, or once stop_when(rows) returns True after a new row,
+    returning the rows scraped so far.
+    """
+    # Selenium and BeautifulSoup are only loaded when a scrape actually runs
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from bs4 import BeautifulSoup
+    
+    if progress is None:
+        progress = ConsoleProgress()
+    if cancel_token is None:
+        cancel_token = CancellationToken()
     
     if not urls:
         print("❌ هیچ لینکی برای اسکرپ وجود ندارد")
-        return 0
+        return []
 
     print(f"📄 تعداد لینک‌های قابل اسکرپ: {len(urls)}")
 
@@ -136,31 +169,44 @@ def scrap_specific_ads(urls, data_file):
     failed_links = []
     successful_count = 0
 
-    # Initialize driver
+    # Wait for a free browser slot, BrowserCapacityError propagates to the caller
     try:
-        driver = webdriver.Chrome(
-            service=ChromeService(ChromeDriverManager().install()),
-            options=chrome_options
+        slot = browser_limiter.acquire(
+            on_wait=lambda position, eta: emit(progress, 'browser_queued', position=position, eta=eta),
+            cancel_token=cancel_token
         )
+    except OperationCancelled:
+        print("⏹️  استخراج پیش از دریافت مرورگر متوقف شد")
+        emit(progress, 'scrape_done', parsed=0, failed=0, stopped=cancel_token.reason())
+        return []
+    driver = None
+    
+    # Initialize driver
+    try:
+        driver = create_driver()
         
-        bar = progressbar.ProgressBar(maxval=len(urls),
-                                    widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage()])
         print("🧾 در حال استخراج اطلاعات آگهی‌ها...")
-        bar.start()
+        emit(progress, 'scrape_started', total=len(urls))
 
         for idx, url in enumerate(urls):
-            bar.update(idx + 1)
+            if cancel_token.stopped:
+                print(f"   ⏱️  توقف استخراج ({cancel_token.reason()}) پس از {idx} آگهی از {len(urls)}")
+                break
+            
             try:
-                driver.get(url)
+                with STAGE_SECONDS.labels(stage='ad_fetch').time():
+                    driver.get(url)
+                    
+                    # Wait for page to load
+                    WebDriverWait(driver, 8).until(
+                        EC.presence_of_element_located((By.TAG_NAME, "body"))
+                    )
+                    cancel_token.sleep(1)
+                    page_source = driver.page_source
                 
-                # Wait for page to load
-                WebDriverWait(driver, 8).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-                time.sleep(1)
-                
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-                row_data = extract_ad_data(soup, url)
+                with STAGE_SECONDS.labels(stage='ad_parse').time():
+                    soup = BeautifulSoup(page_source, 'html.parser')
+                    row_data = extract_ad_data(soup, url)
                 
                 # Validate extracted data - less strict validation
                 if is_data_partially_valid(row_data):
@@ -179,30 +225,35 @@ def scrap_specific_ads(urls, data_file):
             except Exception as e:
                 print(f"❌ خطا در استخراج آگهی {idx+1}: {str(e)[:80]}...")
                 failed_links.append(url)
-                continue
-
-        bar.finish()
-        driver.quit()
+            
+            ad_failed = failed_links[-1:] == [url]
+            (ADS_FAILED if ad_failed else ADS_SCRAPED).inc()
+            emit(progress, 'ad_failed' if ad_failed else 'ad_parsed',
+                 index=idx + 1, total=len(urls), parsed=successful_count, failed=len(failed_links))
+            
+            if not ad_failed and stop_when is not None and stop_when(all_data):
+                print(f"   ⏹️  توقف استخراج پس از {idx + 1} آگهی از {len(urls)}")
+                break
         
     except Exception as e:
         print(f"❌ خطا در راه‌اندازی درایور: {e}")
-        return 0
-
-    # Save successful data
-    if all_data:
-        with open(data_file, 'w', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f)
-            writer.writerow(['brand_model','year_model','mileage','color','gearbox','fuel_type','price','city','url'])
-            writer.writerows(all_data)
-
-        print(f"✅ اطلاعات {successful_count} آگهی ذخیره شد در: {data_file}")
-        if failed_links:
-            print(f"⚠️  {len(failed_links)} آگهی با خطا مواجه شد")
-        
-        return successful_count
-    else:
-        print("❌ هیچ اطلاعات معتبری استخراج نشد")
-        return 0
+        emit(progress, 'scrape_done', parsed=0, failed=len(urls), error=str(e))
+        return []
+    finally:
+        # Always close Chrome, even when scraping failed or was cancelled
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        browser_limiter.release(slot)
+    
+    emit(progress, 'scrape_done', parsed=successful_count, failed=len(failed_links), stopped=cancel_token.reason())
+    
+    if failed_links:
+        print(f"⚠️  {len(failed_links)} آگهی با خطا مواجه شد")
+    
+    return all_data
 
 def is_data_partially_valid(row_data):
     """More lenient validation - only require price"""
@@ -0,0 +1,151 @@
+# core/singleflight.py - IN-FLIGHT REQUEST COALESCING
+import threading
+import time
+import uuid
+from core.config import SINGLEFLIGHT_LEASE_TTL, SINGLEFLIGHT_RESULT_TTL
+
+class Unshared(Exception):
+    """Raised by fn to hand its result to its own caller only
+
+    Use it for results cut short by the caller's cancel token or deadline:
+    waiting duplicates are not given them and run the call themselves. With
+    an error, the caller gets that error raised instead of a result.
+    """
+
+    def __init__(self, result=None, error=None):
+        super().__init__('result not shared')
+        self.result = result
+        self.error = error
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Run one call per key at a time, concurrent duplicates share the leader's result
+
+    Threads of one process wait on the leader directly. With a state store,
+    workers in other processes see the leader's lease and poll for its result,
+    so results must be JSON serializable. The leader renews its lease every
+    lease_ttl / 3 seconds while fn runs. The last result per key is also
+    kept for `recent_ttl` seconds, so a waiter that sees the lease vanish
+    picks up the result published meanwhile instead of running fn again.
+    """
+
+    def __init__(self, store=None, lease_ttl=SINGLEFLIGHT_LEASE_TTL,
+                 result_ttl=SINGLEFLIGHT_RESULT_TTL, poll_interval=0.5, recent_ttl=10):
+        self.store = store
+        self.lease_ttl = lease_ttl
+        self.result_ttl = result_ttl
+        self.recent_ttl = recent_ttl
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return fn() for key, running it at most once across concurrent callers"""
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+            call.done.wait()
+            if isinstance(call.error, Unshared):
+                continue  # The leader's result was cut short, run it ourselves
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn)
+        except Unshared as e:
+            call.error = e
+            if e.error is not None:
+                raise e.error
+            return e.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _do_shared(self, key, fn):
+        if self.store is None:
+            return fn()
+
+        lease_key = f"inflight:{key}"
+        started = time.time()
+        while True:
+            flight_id = uuid.uuid4().hex
+            if self.store.add(lease_key, {'flight_id': flight_id}, ttl=self.lease_ttl):
+                return self._lead(lease_key, flight_id, fn)
+
+            lease = self.store.get(lease_key)
+            outcome = None
+            if lease is not None:
+                outcome = self._wait_for(lease_key, lease['flight_id'])
+            if outcome is None:
+                # The leader finished between our add() and get(), or vanished: only
+                # take over when no result was published since this call started
+                recent = self.store.get(f"{lease_key}:last")
+                if recent is not None and recent['published_at'] >= started:
+                    outcome = recent
+            if outcome is not None:
+                if 'error' in outcome:
+                    raise RuntimeError(outcome['error'])
+                return outcome['result']
+
+    def _lead(self, lease_key, flight_id, fn):
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(lease_key, flight_id, stop), daemon=True,
+                         name='singleflight-heartbeat').start()
+        try:
+            result = fn()
+        except Unshared:
+            raise
+        except Exception as e:
+            self._publish(lease_key, flight_id, {'error': str(e)})
+            raise
+        else:
+            self._publish(lease_key, flight_id, {'result': result})
+            return result
+        finally:
+            stop.set()
+            # A lease that lapsed may belong to another leader by now
+            self.store.delete_if(lease_key, {'flight_id': flight_id})
+
+    def _heartbeat(self, lease_key, flight_id, stop):
+        """Renew the lease while fn runs, so slow calls (browser queue, long scrapes) keep it"""
+        while not stop.wait(self.lease_ttl / 3):
+            try:
+                if self.store.update(lease_key, {}, ttl=self.lease_ttl, expect={'flight_id': flight_id}) is None:
+                    return  # Lost the lease, another worker leads now
+            except Exception as e:
+                print(f"⚠️ خطا در تمدید اجرای مشترک {lease_key}: {e}")
+
+    def _publish(self, lease_key, flight_id, outcome):
+        outcome['published_at'] = time.time()
+        self.store.set(f"{lease_key}:{flight_id}", outcome, ttl=self.result_ttl)
+        self.store.set(f"{lease_key}:last", outcome, ttl=self.recent_ttl)
+
+    def _wait_for(self, lease_key, flight_id):
+        result_key = f"{lease_key}:{flight_id}"
+        deadline = time.time() + self.lease_ttl
+        while time.time() < deadline:
+            outcome = self.store.get(result_key)
+            if outcome is not None:
+                return outcome
+            lease = self.store.get(lease_key)
+            if lease is None or lease['flight_id'] != flight_id:
+                # Result is written before the lease is released
+                return self.store.get(result_key)
+            time.sleep(self.poll_interval)
+        return None
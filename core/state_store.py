@@ -0,0 +1,352 @@
+# core/state_store.py - SHARED PIPELINE STATE
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from core.config import STATE_BACKEND, STATE_DB_FILE, REDIS_URL, STATE_TTL
+
+class StateStore(ABC):
+    """Key/value store for pipeline state shared between workers and nodes"""
+
+    @abstractmethod
+    def get(self, key):
+        """Stored value, None when missing or expired"""
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        """Store value under key, expiring after ttl seconds (default_ttl when None)"""
+
+    @abstractmethod
+    def add(self, key, value, ttl=None):
+        """Set key only if it does not exist yet, returns True when stored"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove key and its event log"""
+
+    @abstractmethod
+    def update(self, key, changes, ttl=None, expect=None):
+        """Atomically merge changes into an existing entry and refresh its expiry
+
+        With expect, the entry's fields must hold those values, e.g.
+        expect={'status': 'running'} guards a status transition between
+        workers. Returns the merged value, None when the entry is missing or
+        does not match.
+        """
+
+    @abstractmethod
+    def delete_if(self, key, expect):
+        """Atomically remove key only while its fields hold the expect values, returns True when removed"""
+
+    @abstractmethod
+    def push_event(self, key, event, ttl=None):
+        """Append an event to the ordered event log stored under key"""
+
+    @abstractmethod
+    def read_events(self, key, cursor=0):
+        """Return (events, cursor) for events appended after cursor"""
+
+    def purge_expired(self):
+        """Remove abandoned entries, returns number of removed keys"""
+        return 0
+
+def matches(value, expect):
+    """True when value is an entry whose fields hold every expected value"""
+    return value is not None and all(value.get(field) == wanted for field, wanted in (expect or {}).items())
+
+class SQLiteStateStore(StateStore):
+    """File backed store, shared by every worker process on the same machine"""
+
+    def __init__(self, db_file=STATE_DB_FILE, default_ttl=STATE_TTL, purge_every=100):
+        self.db_file = db_file
+        self.default_ttl = default_ttl
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self):
+        # The database file is opened on first use, not when the store is created
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_file) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_state_expires ON state (expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, "
+                "payload TEXT NOT NULL, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_key ON events (key, id)")
+            self._local.conn = conn
+        return conn
+
+    def _expires_at(self, ttl):
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), self._expires_at(ttl))
+        )
+        self._after_write()
+
+    def add(self, key, value, ttl=None):
+        # Expired rows still occupy the key, so they may be taken over
+        cursor = self._connect().execute(
+            "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE state.expires_at IS NOT NULL AND state.expires_at <= ?",
+            (key, json.dumps(value, ensure_ascii=False), self._expires_at(ttl), time.time())
+        )
+        self._after_write()
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM state WHERE key = ?", (key,))
+        self._connect().execute("DELETE FROM events WHERE key = ?", (key,))
+
+    @contextmanager
+    def _immediate(self):
+        # The write lock is taken before the read, so no other worker writes in between
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def update(self, key, changes, ttl=None, expect=None):
+        with self._immediate() as conn:
+            value = self.get(key)
+            if not matches(value, expect):
+                return None
+            value.update(changes)
+            conn.execute(
+                "UPDATE state SET value = ?, expires_at = ? WHERE key = ?",
+                (json.dumps(value, ensure_ascii=False), self._expires_at(ttl), key)
+            )
+            return value
+
+    def delete_if(self, key, expect):
+        with self._immediate():
+            if not matches(self.get(key), expect):
+                return False
+            self.delete(key)
+            return True
+
+    def push_event(self, key, event, ttl=None):
+        self._connect().execute(
+            "INSERT INTO events (key, payload, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(event, ensure_ascii=False), self._expires_at(ttl))
+        )
+        self._after_write()
+
+    def read_events(self, key, cursor=0):
+        rows = self._connect().execute(
+            "SELECT id, payload FROM events WHERE key = ? AND id > ? ORDER BY id",
+            (key, cursor)
+        ).fetchall()
+        if not rows:
+            return [], cursor
+        return [json.loads(payload) for _, payload in rows], rows[-1][0]
+
+    def purge_expired(self):
+        now = time.time()
+        conn = self._connect()
+        removed = conn.execute(
+            "DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount
+        conn.execute("DELETE FROM events WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        return removed
+
+    def _after_write(self):
+        # Expired rows are invisible to get(), purge them from time to time
+        self._writes += 1
+        if self.purge_every and self._writes % self.purge_every == 0:
+            self.purge_expired()
+
+class RedisStateStore(StateStore):
+    """Store speaking the Redis protocol (RESP), works with Redis or any compatible server"""
+
+    def __init__(self, url=REDIS_URL, default_ttl=STATE_TTL, timeout=5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip('/') or 0)
+        self.default_ttl = default_ttl
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self._local.sock = sock
+            self._local.reader = sock.makefile('rb')
+            if self.password:
+                self._send('AUTH', self.password)
+            if self.db:
+                self._send('SELECT', self.db)
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def _send(self, *args):
+        payload = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            payload.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        self._local.sock.sendall(b''.join(payload))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b'+':
+            return body.decode()
+        if kind == b'-':
+            raise RuntimeError(body.decode())
+        if kind == b':':
+            return int(body)
+        if kind == b'$':
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(body)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected Redis reply: {line!r}")
+
+    def command(self, *args):
+        """Run a single command, reconnecting once on a broken connection"""
+        for attempt in range(2):
+            try:
+                self._connect()
+                return self._send(*args)
+            except (ConnectionError, OSError):
+                self._close()
+                if attempt:
+                    raise
+
+    def get(self, key):
+        data = self.command('GET', key)
+        return json.loads(data) if data is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.command(*self._set_args(key, value, ttl))
+
+    def add(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        args = ['SET', key, json.dumps(value, ensure_ascii=False), 'NX']
+        if ttl:
+            args += ['EX', int(ttl)]
+        return self.command(*args) is not None
+
+    def delete(self, key):
+        self.command('DEL', key)
+
+    def _check_and_set(self, key, apply, retries=10):
+        """Optimistic WATCH/MULTI/EXEC: apply(current) returns the queued commands, or None to give up
+
+        Returns (applied, current) where current is the value apply() saw.
+        EXEC fails when another client wrote key after WATCH, then it retries.
+        """
+        for _ in range(retries):
+            try:
+                self._connect()
+                self._send('WATCH', key)
+                data = self._send('GET', key)
+                current = json.loads(data) if data is not None else None
+                commands = apply(current)
+                if commands is None:
+                    self._send('UNWATCH')
+                    return False, current
+                self._send('MULTI')
+                for args in commands:
+                    self._send(*args)
+                if self._send('EXEC') is not None:
+                    return True, current
+            except (ConnectionError, OSError):
+                self._close()
+                raise
+        raise RuntimeError(f"Redis key {key} kept changing, update gave up")
+
+    def _set_args(self, key, value, ttl):
+        ttl = self.default_ttl if ttl is None else ttl
+        args = ['SET', key, json.dumps(value, ensure_ascii=False)]
+        if ttl:
+            args += ['EX', int(ttl)]
+        return args
+
+    def update(self, key, changes, ttl=None, expect=None):
+        def apply(current):
+            if not matches(current, expect):
+                return None
+            return [self._set_args(key, dict(current, **changes), ttl)]
+
+        applied, current = self._check_and_set(key, apply)
+        return dict(current, **changes) if applied else None
+
+    def delete_if(self, key, expect):
+        applied, _ = self._check_and_set(key, lambda current: [['DEL', key]] if matches(current, expect) else None)
+        return applied
+
+    def push_event(self, key, event, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.command('RPUSH', key, json.dumps(event, ensure_ascii=False))
+        if ttl:
+            self.command('EXPIRE', key, int(ttl))
+
+    def read_events(self, key, cursor=0):
+        items = self.command('LRANGE', key, cursor, -1) or []
+        return [json.loads(item) for item in items], cursor + len(items)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_state_store():
+    """Return the configured state store, created once per process"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if STATE_BACKEND == 'redis':
+                    _store = RedisStateStore()
+                else:
+                    _store = SQLiteStateStore()
+    return _store
@@ -0,0 +1,219 @@
+# core/storage.py - DISK BUDGET FOR SCRAPED DATA AND MODELS
+"""Keep Data/UserData and Data/Models within a disk budget.
+
+    python -m core.storage              # evict now and print what was reclaimed
+    python -m core.storage --dry-run    # only list what would go
+
+Every search leaves an ad CSV and a model file behind. Those files
+(user_data_<hash>.csv and user_model_<hash>.pkl) are the only ones managed;
+anything else in the two directories is never touched. Files unused for
+STORAGE_MAX_AGE_DAYS are removed, and while the two directories hold more
+than STORAGE_BUDGET_MB the least recently used files go first. A model's
+last use comes from the model registry; an ad CSV counts as used whenever
+the model trained from it (same spec hash) is. Before an ad CSV goes, its
+ads are added to the global model's compact corpus (core.global_model),
+so the global model keeps its brands. Pinned models, models that answered
+at least STORAGE_PIN_USES predictions, their CSVs and the global model
+are never removed. Pipelines trigger a scan in the background after
+they write, at most once every STORAGE_EVICT_INTERVAL seconds.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from core.config import (USER_DATA_DIR, MODELS_DIR, GLOBAL_MODEL_FILE, GLOBAL_MODEL_CORPUS_NAME, STORAGE_BUDGET_MB,
+                         STORAGE_MAX_AGE_DAYS, STORAGE_PIN_USES, STORAGE_EVICT_INTERVAL)
+from core.metrics import STORAGE_BYTES, STORAGE_EVICTED_BYTES
+
+def spec_hash(path):
+    """Spec hash shared by user_data_<hash>.csv and user_model_<hash>.pkl, None for other files"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    for prefix in ('user_data_', 'user_model_'):
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return None
+
+class StorageManager:
+    """LRU and age based eviction of scraped data and model files under a byte budget"""
+
+    def __init__(self, data_dir=USER_DATA_DIR, models_dir=MODELS_DIR, budget_mb=STORAGE_BUDGET_MB,
+                 max_age_days=STORAGE_MAX_AGE_DAYS, pin_uses=STORAGE_PIN_USES, interval=STORAGE_EVICT_INTERVAL,
+                 registry=None, protected=(GLOBAL_MODEL_FILE,), corpus_file=None):
+        self.directories = [data_dir, models_dir]
+        self.corpus_file = corpus_file or os.path.join(data_dir, GLOBAL_MODEL_CORPUS_NAME)
+        self.budget = int(budget_mb * 2 ** 20)
+        self.max_age = max_age_days * 24 * 3600
+        self.pin_uses = pin_uses
+        self.interval = interval
+        self.registry = registry
+        self.protected = {os.path.abspath(path) for path in protected}
+        self._lock = threading.Lock()
+        self._running = False
+        self._last_run = 0.0
+        self._stats = {'runs': 0, 'evicted_files': 0, 'expired_files': 0, 'reclaimed_bytes': 0,
+                       'last_run': None, 'last_scan': None}
+
+    def _registry(self):
+        if self.registry is None:
+            from core.model_registry import get_model_registry
+            self.registry = get_model_registry()
+        return self.registry
+
+    def scan(self):
+        """Search CSVs and models as [{'path', 'directory', 'size', 'last_access', 'pinned'}]"""
+        files = []
+        for directory in self.directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        # Only search CSVs and models are managed: dotfiles such as .gitkeep,
+                        # the global model and half-written *.tmp saves are left alone
+                        if (not entry.is_file() or entry.name.startswith('.') or entry.name.endswith('.tmp')
+                                or spec_hash(entry.name) is None):
+                            continue
+                        stat = entry.stat()
+                        files.append({'path': os.path.abspath(entry.path), 'directory': directory,
+                                      'size': stat.st_size, 'last_access': stat.st_mtime, 'pinned': False})
+            except FileNotFoundError:
+                continue
+
+        models = {entry['model_file']: entry for entry in self._registry().entries()}
+        last_use, pinned = {}, set()
+        for info in files:
+            model = models.get(info['path'])
+            if model is not None:
+                info['last_access'] = max(info['last_access'], model['last_used_at'] or 0)
+                info['pinned'] = bool(model['pinned']) or bool(self.pin_uses and model['uses'] >= self.pin_uses)
+            info['pinned'] = info['pinned'] or info['path'] in self.protected
+            key = spec_hash(info['path'])
+            last_use[key] = max(last_use.get(key, 0), info['last_access'])
+            if info['pinned']:
+                pinned.add(key)
+        # A search's CSV and model share their last use and pin
+        for info in files:
+            key = spec_hash(info['path'])
+            info['last_access'] = last_use[key]
+            info['pinned'] = info['pinned'] or key in pinned
+        return files
+
+    def evict(self, dry_run=False):
+        """Remove expired files, then least recently used ones until the budget fits; returns a report"""
+        now = time.time()
+        files = self.scan()
+        total = sum(info['size'] for info in files)
+        report = {'files': len(files), 'bytes_before': total, 'budget_bytes': self.budget,
+                  'pinned_bytes': sum(info['size'] for info in files if info['pinned']),
+                  'evicted': [], 'evicted_files': 0, 'expired_files': 0, 'reclaimed_bytes': 0}
+
+        # A search's CSV and model are evicted together
+        groups = {}
+        for info in files:
+            if not info['pinned']:
+                groups.setdefault(spec_hash(info['path']), []).append(info)
+        for group in sorted(groups.values(), key=lambda group: group[0]['last_access']):
+            idle = now - group[0]['last_access']
+            if self.max_age and idle > self.max_age:
+                reason = 'age'
+            elif self.budget and total > self.budget:
+                reason = 'budget'
+            else:
+                break  # Oldest first: nothing later is expired and the budget fits
+            if not dry_run and not self._archive(group):
+                continue
+            for info in group:
+                if not dry_run and not self._remove(info['path']):
+                    continue
+                total -= info['size']
+                report['evicted'].append({'path': info['path'], 'size': info['size'], 'reason': reason,
+                                          'idle_seconds': round(idle)})
+                report['evicted_files'] += 1
+                report['expired_files'] += reason == 'age'
+                report['reclaimed_bytes'] += info['size']
+                if not dry_run:
+                    STORAGE_EVICTED_BYTES.labels(reason=reason).inc(info['size'])
+        report['bytes_after'] = total
+
+        if not dry_run:
+            evicted = {info['path'] for info in report['evicted']}
+            for directory in self.directories:
+                STORAGE_BYTES.labels(directory=os.path.basename(directory)).set(sum(
+                    info['size'] for info in files if info['directory'] == directory and info['path'] not in evicted))
+            with self._lock:
+                self._stats['runs'] += 1
+                for counter in ('evicted_files', 'expired_files', 'reclaimed_bytes'):
+                    self._stats[counter] += report[counter]
+                self._stats['last_run'] = now
+                self._stats['last_scan'] = {name: report[name] for name in
+                                            ('files', 'bytes_before', 'bytes_after', 'pinned_bytes')}
+            if report['evicted_files']:
+                print(f"🧹 {report['evicted_files']} فایل قدیمی حذف شد "
+                      f"({report['reclaimed_bytes'] / 2 ** 20:.1f} MB آزاد شد)")
+        return report
+
+    def _archive(self, group):
+        """Hand the ads of the group's CSV to the global model's corpus, False when they could not be kept"""
+        from core.global_model import archive_scraped_ads
+
+        return all(archive_scraped_ads(info['path'], self.corpus_file, self._registry())
+                   for info in group if info['path'].endswith('.csv'))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False  # Another worker evicted it first
+        except OSError as e:
+            print(f"⚠️ خطا در حذف فایل {path}: {e}")
+            return False
+        if path.endswith('.pkl'):
+            self._registry().remove(path)
+        return True
+
+    def evict_in_background(self):
+        """Run evict() in a daemon thread unless one is running or ran less than `interval` seconds ago"""
+        with self._lock:
+            if self._running or time.time() - self._last_run < self.interval:
+                return False
+            self._running = True
+
+        def run():
+            try:
+                self.evict()
+            except Exception as e:
+                print(f"❌ خطا در پاکسازی فضای ذخیره‌سازی: {e}")
+            finally:
+                with self._lock:
+                    self._running = False
+                    self._last_run = time.time()
+
+        threading.Thread(target=run, daemon=True, name='storage-eviction').start()
+        return True
+
+    def stats(self):
+        """Eviction totals of this process and the result of its last scan"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['budget_bytes'] = self.budget
+        stats['max_age_days'] = self.max_age / (24 * 3600)
+        return stats
+
+_storage_manager = None
+
+def get_storage_manager():
+    """Process wide manager of USER_DATA_DIR and MODELS_DIR"""
+    global _storage_manager
+    if _storage_manager is None:
+        _storage_manager = StorageManager()
+    return _storage_manager
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='list what would be evicted without deleting')
+    args = parser.parse_args()
+
+    report = get_storage_manager().evict(dry_run=args.dry_run)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -9,24 +9,46 @@ from sklearn.metrics import mean_absolute_error, r2_score, mean_squared_error
 from sklearn.impute import SimpleImputer
 import os
 import warnings
+from core.progress import emit
+from core.metrics import STAGE_SECONDS, MODEL_LOADS
 warnings.filterwarnings('ignore')
 
-def train_user_model(data_file, model_file, user_data):
+# Repeated text values are stored once per category instead of once per row
+TEXT_COLUMNS = ['brand_model', 'color', 'gearbox', 'fuel_type', 'city']
+CSV_DTYPES = {col: 'category' for col in TEXT_COLUMNS}
+
+def train_user_model(data_file, model_file, user_data, progress=None):
     """Train ML model on user-specific collected data with enhanced preprocessing"""
     
-    print("🤖 در حال آموزش مدل ML...")
-    
     # Check if data file exists and has content
     if not os.path.exists(data_file):
         print(f"❌ فایل داده وجود ندارد: {data_file}")
         return None
     
     try:
-        df = pd.read_csv(data_file, encoding='utf-8-sig')
+        df = pd.read_csv(data_file, encoding='utf-8-sig', dtype=CSV_DTYPES)
     except Exception as e:
         print(f"❌ خطا در خواندن فایل داده: {e}")
         return None
     
+    return train_model_on_dataframe(df, model_file, user_data, progress=progress)
+
+def ads_dataframe(rows):
+    """Build a training DataFrame from scraped rows, matching what reading the CSV gives"""
+    from core.scrap_specific_ads import AD_COLUMNS
+    df = pd.DataFrame(rows, columns=AD_COLUMNS).replace('', np.nan)
+    return df.astype({col: 'category' for col in TEXT_COLUMNS})
+
+@STAGE_SECONDS.labels(stage='train').time()
+def train_model_on_dataframe(df, model_file, user_data, progress=None, save=True, cancel_token=None):
+    """Train ML model on an in-memory DataFrame, saving it to model_file unless save is False
+
+    Returns None once cancel_token is cancelled; past its deadline the
+    smallest model configuration is trained instead.
+    """
+    
+    print("🤖 در حال آموزش مدل ML...")
+    
     if len(df) < 5:
         print(f"❌ داده کافی برای آموزش وجود ندارد (فقط {len(df)} نمونه)")
         return None
@@ -42,6 +64,8 @@ def train_user_model(data_file, model_file, user_data):
         return None
     
     print(f"📈 پس از پاکسازی: {len(df_clean)} نمونه معتبر")
+    print(f"🧮 حافظه داده: {preprocessing_info['memory_before_mb']} MB → {preprocessing_info['memory_after_mb']} MB")
+    emit(progress, 'training_started', samples=len(df_clean))
     print(f"💰 محدوده قیمت: {df_clean['price'].min():,} تا {df_clean['price'].max():,} تومان")
     
     # Prepare features and target
@@ -54,7 +78,7 @@ def train_user_model(data_file, model_file, user_data):
         print(f"❌ ستون‌های ضروری وجود ندارد: {missing_cols}")
         return None
     
-    X = df_clean[feature_columns].copy()
+    X = df_clean[feature_columns]
     y = df_clean[target_column]
     
     # Enhanced preprocessing with feature engineering
@@ -63,6 +87,8 @@ def train_user_model(data_file, model_file, user_data):
     if X_processed is None or len(X_processed) == 0:
         print("❌ خطا در پیش‌پردازش داده‌ها")
         return None
+    # Preprocessing drops cars outside the age range, the target has to follow
+    y = y.loc[X_processed.index]
     
     # Split data with stratification for small datasets
     if len(X_processed) >= 10:
@@ -77,15 +103,27 @@ def train_user_model(data_file, model_file, user_data):
         X_test, y_test = None, None
         print("📊 استفاده از تمام داده برای آموزش (نمونه‌ها کم هستند)")
     
+    if cancel_token is not None and cancel_token.cancelled:
+        print("⏹️  آموزش مدل لغو شد")
+        return None
+    
     # Train model with optimized parameters based on dataset size
+    model_size = len(X_train)
+    if cancel_token is not None and cancel_token.expired:
+        print("⏱️  مهلت آموزش تمام شده، آموزش مدل ساده‌تر")
+        model_size = 0
     try:
-        model = create_optimized_model(len(X_train))
+        model = create_optimized_model(model_size)
         print("🔧 آموزش مدل با پارامترهای بهینه...")
         model.fit(X_train, y_train)
     except Exception as e:
         print(f"❌ خطا در آموزش مدل: {e}")
         return None
     
+    if cancel_token is not None and cancel_token.cancelled:
+        print("⏹️  آموزش مدل لغو شد")
+        return None
+    
     # Evaluate model with comprehensive metrics
     metrics = evaluate_model(model, X_train, X_test, y_train, y_test, df_clean)
     
@@ -93,6 +131,9 @@ def train_user_model(data_file, model_file, user_data):
         print("❌ ارزیابی مدل با شکست مواجه شد")
         return None
     
+    emit(progress, 'training_done', samples=int(metrics['samples']),
+         metrics={name: float(metrics[name]) for name in ('test_r2', 'test_mae', 'test_rmse')})
+    
     # Feature importance analysis
     feature_importance = analyze_feature_importance(model, X_processed.columns, X_test, y_test)
     
@@ -112,119 +153,142 @@ def train_user_model(data_file, model_file, user_data):
         }
     }
     
+    if save and not save_model(model_data, model_file):
+        return None
+    return model_data
+
+def save_model(model_data, model_file):
+    """Persist a trained model, returns True on success"""
     try:
+        os.makedirs(os.path.dirname(model_file), exist_ok=True)
         joblib.dump(model_data, model_file)
         print(f"💾 مدل ذخیره شد در: {model_file}")
-        return model_data
+        return True
     except Exception as e:
         print(f"❌ خطا در ذخیره مدل: {e}")
-        return None
+        return False
 
 def clean_and_preprocess_data(df):
-    """Enhanced data cleaning with better outlier detection"""
-    df_clean = df.copy()
-    preprocessing_info = {}
+    """Enhanced data cleaning with better outlier detection
+
+    Every filter is evaluated on the input and applied as one combined mask,
+    so only the kept rows are copied once. Numeric columns come out as
+    compact integers where possible and text columns as categoricals.
+    """
+    preprocessing_info = {'memory_before_mb': frame_memory_mb(df)}
+    # Plain numpy arrays: on a few hundred ads, pandas' per-operation overhead dominates
+    keep = np.ones(len(df), dtype=bool)
+    
+    def remove(name, valid):
+        nonlocal keep
+        removed = int(np.count_nonzero(keep & ~valid))
+        if removed or not name.endswith('_null_removed'):
+            preprocessing_info[name] = removed
+        keep &= valid
+    
+    # Rows with missing critical data
+    if 'price' in df.columns:
+        remove('missing_price_removed', df['price'].notna().to_numpy())
     
     # Convert numeric columns with better error handling
-    numeric_columns = ['price', 'mileage', 'year_model']
-    for col in numeric_columns:
-        if col in df_clean.columns:
-            original_count = len(df_clean)
-            df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
-            null_count = df_clean[col].isnull().sum()
-            if null_count > 0:
-                df_clean = df_clean.dropna(subset=[col])
-                preprocessing_info[f'{col}_null_removed'] = null_count
-    
-    # Remove rows with missing critical data
-    original_count = len(df_clean)
-    df_clean = df_clean.dropna(subset=['price'])
-    preprocessing_info['missing_price_removed'] = original_count - len(df_clean)
+    numeric = {}
+    for col in ['price', 'mileage', 'year_model']:
+        if col in df.columns:
+            numeric[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64')
+            remove(f'{col}_null_removed', ~np.isnan(numeric[col]))
     
     # Enhanced outlier detection for price
-    if 'price' in df_clean.columns and len(df_clean) > 0:
-        Q1 = df_clean['price'].quantile(0.05)  # Use 5th percentile for lower bound
-        Q3 = df_clean['price'].quantile(0.95)  # Use 95th percentile for upper bound
+    if 'price' in numeric and keep.any():
+        kept_prices = numeric['price'][keep]
+        Q1, Q3 = np.quantile(kept_prices, [0.05, 0.95])  # 5th and 95th percentiles as bounds
         IQR = Q3 - Q1
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
-        
-        original_count = len(df_clean)
-        df_clean = df_clean[(df_clean['price'] >= lower_bound) & (df_clean['price'] <= upper_bound)]
-        preprocessing_info['price_outliers_removed'] = original_count - len(df_clean)
+        remove('price_outliers_removed', (numeric['price'] >= Q1 - 1.5 * IQR) & (numeric['price'] <= Q3 + 1.5 * IQR))
     
     # Realistic ranges for Iranian car market
-    if 'mileage' in df_clean.columns:
-        original_count = len(df_clean)
-        df_clean = df_clean[(df_clean['mileage'] >= 0) & (df_clean['mileage'] <= 300000)]
-        preprocessing_info['mileage_outliers_removed'] = original_count - len(df_clean)
+    if 'mileage' in numeric:
+        remove('mileage_outliers_removed', (numeric['mileage'] >= 0) & (numeric['mileage'] <= 300000))
+    if 'year_model' in numeric:
+        remove('year_outliers_removed', (numeric['year_model'] >= 1380) & (numeric['year_model'] <= 1410))
     
-    if 'year_model' in df_clean.columns:
-        original_count = len(df_clean)
-        df_clean = df_clean[(df_clean['year_model'] >= 1380) & (df_clean['year_model'] <= 1410)]
-        preprocessing_info['year_outliers_removed'] = original_count - len(df_clean)
+    df_clean = pd.DataFrame({
+        col: compact_numeric(numeric[col][keep], 'float64' if col == 'price' else 'float32')
+        if col in numeric else df[col].array[keep]
+        for col in df.columns
+    }, index=df.index[keep])
     
     # Enhanced categorical data cleaning
     categorical_columns = ['gearbox', 'fuel_type']
     for col in categorical_columns:
         if col in df_clean.columns:
+            values = df_clean[col]
             # Fill missing values with mode
-            if df_clean[col].notna().any():
-                mode_val = df_clean[col].mode()
-                if len(mode_val) > 0:
-                    df_clean[col] = df_clean[col].fillna(mode_val[0])
-                else:
-                    df_clean[col] = df_clean[col].fillna('نامشخص')
+            if values.notna().any():
+                mode_val = values.mode()
+                values = values.fillna(mode_val[0] if len(mode_val) > 0 else 'نامشخص')
             else:
-                df_clean[col] = 'نامشخص'
+                values = pd.Series('نامشخص', index=values.index)
             
             # Clean categorical values
-            df_clean[col] = df_clean[col].astype(str).str.strip()
+            df_clean[col] = values.astype(str).str.strip().astype('category')
+    for col in TEXT_COLUMNS:
+        if col in df_clean.columns and not isinstance(df_clean[col].dtype, pd.CategoricalDtype):
+            df_clean[col] = df_clean[col].astype('category')
     
     preprocessing_info['final_samples'] = len(df_clean)
+    preprocessing_info['memory_after_mb'] = frame_memory_mb(df_clean)
     return df_clean, preprocessing_info
 
+def compact_numeric(values, float_dtype='float32'):
+    """Smallest integer dtype when every value is whole, float_dtype otherwise (numpy array in, array out)"""
+    if len(values) and (values % 1 == 0).all():
+        return pd.to_numeric(values.astype('int64'), downcast='integer')
+    return values.astype(float_dtype)
+
+def frame_memory_mb(df):
+    return round(df.memory_usage(deep=True).sum() / 2 ** 20, 3)
+
 def preprocess_features_with_engineering(X, y):
     """Enhanced feature preprocessing with engineering"""
     try:
-        X_processed = X.copy()
+        # Every column is rebuilt from X, so X itself is never copied or changed
+        columns = {col: X[col] for col in X.columns}
         preprocessors = {}
         
         # Handle numeric columns with imputation
         numeric_columns = ['year_model', 'mileage']
         for col in numeric_columns:
-            if col in X_processed.columns:
-                X_processed[col] = pd.to_numeric(X_processed[col], errors='coerce')
+            if col in columns:
+                values = pd.to_numeric(X[col], errors='coerce').to_frame()
                 # Use median imputation
                 imputer = SimpleImputer(strategy='median')
-                X_processed[col] = imputer.fit_transform(X_processed[[col]]).ravel()
+                columns[col] = imputer.fit_transform(values).ravel()
                 preprocessors[f'{col}_imputer'] = imputer
         
         # Enhanced categorical encoding
         categorical_columns = ['gearbox', 'fuel_type']
         for col in categorical_columns:
-            if col in X_processed.columns:
+            if col in columns:
                 # Clean and standardize categorical values
-                X_processed[col] = X_processed[col].fillna('نامشخص').astype(str)
+                values = X[col].astype(object).fillna('نامشخص').astype(str)
                 
                 # Handle rare categories by grouping
-                value_counts = X_processed[col].value_counts()
+                value_counts = values.value_counts()
                 rare_categories = value_counts[value_counts < 2].index
                 if len(rare_categories) > 0:
-                    X_processed[col] = X_processed[col].replace(rare_categories, 'سایر')
+                    values = values.replace(rare_categories, 'سایر')
                 
                 # Use label encoding for tree-based models
                 le = LabelEncoder()
-                X_processed[col] = le.fit_transform(X_processed[col])
+                columns[col] = le.fit_transform(values)
                 preprocessors[f'{col}_encoder'] = le
+        X_processed = pd.DataFrame(columns, index=X.index)
         
         # Feature engineering: Create age feature if we have year_model
         if 'year_model' in X_processed.columns:
             current_year = 1402  # Persian year
             X_processed['car_age'] = current_year - X_processed['year_model']
             # Remove cars that are too old or future models
-            X_processed = X_processed[X_processed['car_age'] >= 0]
-            X_processed = X_processed[X_processed['car_age'] <= 30]
+            X_processed = X_processed[X_processed['car_age'].between(0, 30)]
         
         return X_processed, preprocessors
         
@@ -363,56 +427,21 @@ def predict_user_price(model_file, user_data):
             return None
             
         model_data = joblib.load(model_file)
-        model = model_data['model']
-        preprocessors = model_data['preprocessors']
-        feature_columns = model_data['feature_columns']
-        
-        # Prepare user data for prediction
-        input_data = {
-            'year_model': user_data['year_model'],
-            'mileage': user_data['mileage'],
-            'gearbox': user_data['gearbox'],
-            'fuel_type': user_data['fuel_type']
-        }
-        
-        input_df = pd.DataFrame([input_data])
-        
-        # Preprocess input data same as training
-        for col in ['year_model', 'mileage']:
-            if col in input_df.columns:
-                input_df[col] = pd.to_numeric(input_df[col], errors='coerce')
-        
-        # Apply the same preprocessing
-        for col in ['gearbox', 'fuel_type']:
-            if col in input_df.columns and f'{col}_encoder' in preprocessors:
-                encoder = preprocessors[f'{col}_encoder']
-                input_val = str(input_df[col].iloc[0])
-                try:
-                    if input_val in encoder.classes_:
-                        encoded_val = encoder.transform([input_val])[0]
-                    else:
-                        # Use most common value as fallback
-                        encoded_val = encoder.transform([encoder.classes_[0]])[0]
-                    input_df[col] = encoded_val
-                except:
-                    input_df[col] = 0
-        
-        # Add engineered features
-        if 'year_model' in input_df.columns:
-            current_year = 1404
-            input_df['car_age'] = current_year - input_df['year_model']
-        
-        # Ensure all columns are present and in correct order
-        for col in feature_columns + (['car_age'] if 'car_age' in model_data.get('feature_stats', {}) else []):
-            if col not in input_df.columns:
-                input_df[col] = 0
-        
-        # Use actual feature names from the model
-        actual_features = [col for col in input_df.columns if col in feature_columns or col == 'car_age']
-        input_df = input_df[actual_features]
+        MODEL_LOADS.inc()
+    except Exception as e:
+        print(f"❌ خطا در بارگذاری مدل: {e}")
+        return None
+    
+    return predict_with_model(model_data, user_data)
+
+@STAGE_SECONDS.labels(stage='predict').time()
+def predict_with_model(model_data, user_data):
+    """Predict price for user's car with an already loaded model"""
+    try:
+        input_df = build_prediction_input(model_data, user_data)
         
         # Predict
-        prediction = model.predict(input_df)[0]
+        prediction = model_data['model'].predict(input_df)[0]
         print(f"🔮 قیمت پیش‌بینی شده: {prediction:,.0f} تومان")
         
         # Add confidence interval based on model performance
@@ -425,4 +454,54 @@ def predict_user_price(model_file, user_data):
         
     except Exception as e:
         print(f"❌ خطا در پیش‌بینی: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def build_prediction_input(model_data, user_data):
+    """One-row feature DataFrame for user_data, preprocessed the same way as the training data"""
+    preprocessors = model_data['preprocessors']
+    feature_columns = model_data['feature_columns']
+    
+    # Prepare user data for prediction
+    input_data = {
+        'year_model': user_data['year_model'],
+        'mileage': user_data['mileage'],
+        'gearbox': user_data['gearbox'],
+        'fuel_type': user_data['fuel_type']
+    }
+    
+    input_df = pd.DataFrame([input_data])
+    
+    # Preprocess input data same as training
+    for col in ['year_model', 'mileage']:
+        if col in input_df.columns:
+            input_df[col] = pd.to_numeric(input_df[col], errors='coerce')
+    
+    # Apply the same preprocessing
+    for col in ['gearbox', 'fuel_type']:
+        if col in input_df.columns and f'{col}_encoder' in preprocessors:
+            encoder = preprocessors[f'{col}_encoder']
+            input_val = str(input_df[col].iloc[0])
+            try:
+                if input_val in encoder.classes_:
+                    encoded_val = encoder.transform([input_val])[0]
+                else:
+                    # Use most common value as fallback
+                    encoded_val = encoder.transform([encoder.classes_[0]])[0]
+                input_df[col] = encoded_val
+            except:
+                input_df[col] = 0
+    
+    # Add engineered features
+    if 'year_model' in input_df.columns:
+        current_year = 1404
+        input_df['car_age'] = current_year - input_df['year_model']
+    
+    # Ensure all columns are present and in correct order
+    for col in feature_columns + (['car_age'] if 'car_age' in model_data.get('feature_stats', {}) else []):
+        if col not in input_df.columns:
+            input_df[col] = 0
+    
+    # Use actual feature names from the model
+    actual_features = [col for col in input_df.columns if col in feature_columns or col == 'car_age']
+    input_df = input_df[actual_features]
+    return input_df
@@ -87,4 +87,34 @@ def display_prediction(user_data, predicted_price):
     print(f"⛽ سوخت: {user_data['fuel_type']}")
     print("─" * 40)
     print(f"💰 قیمت پیش بینی شده: {predicted_price:,.0f} تومان")
-    print("="*60)
\ No newline at end of file
+    print("="*60)
+
+def validate_user_data(raw):
+    """Validate a car specification dict, returns (user_data, error_message)"""
+    if not isinstance(raw, dict):
+        return None, 'مشخصات خودرو باید یک شیء JSON باشد'
+    
+    missing = [field for field in ('brand_model', 'year_model', 'mileage', 'gearbox', 'fuel_type')
+               if raw.get(field) in (None, '')]
+    if missing:
+        return None, f"فیلدهای ضروری وارد نشده: {', '.join(missing)}"
+    
+    try:
+        year_model = int(raw['year_model'])
+        mileage = int(raw['mileage'])
+    except (TypeError, ValueError):
+        return None, 'سال ساخت و کارکرد باید عدد باشند!'
+    
+    if year_model < 1300 or year_model > 1410:
+        return None, 'سال ساخت باید بین ۱۳۰۰ تا ۱۴۱۰ باشد!'
+    
+    if mileage < 0 or mileage > 5000000:
+        return None, 'کارکرد باید بین ۰ تا 5,۰۰۰,۰۰۰ کیلومتر باشد!'
+    
+    return {
+        'brand_model': str(raw['brand_model']).strip(),
+        'year_model': year_model,
+        'mileage': mileage,
+        'gearbox': str(raw['gearbox']).strip(),
+        'fuel_type': str(raw['fuel_type']).strip()
+    }, None
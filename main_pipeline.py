@@ -5,15 +5,18 @@ import os
 # Add current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+import argparse
 import time
 from core.user_input import get_user_input, display_prediction
-from core.save_urls import save_specific_urls
-from core.scrap_specific_ads import scrap_specific_ads
-from core.train_user_model import train_user_model, predict_user_price
-from core.config import get_user_data_file, get_user_model_file, get_search_history_file
-import pandas as pd
+from core.train_user_model import predict_user_price
+from core.config import ensure_data_dirs, PROFILE_PIPELINE
+from core.pipeline import run_prediction_pipeline, save_search_history, find_trained_model
+from core.model_registry import get_model_registry
+from core.result_cache import PredictionCache
+from core.state_store import get_state_store
+from core.metrics import stage_summary
 
-def main():
+def main(budget=None, depth=50, profile=PROFILE_PIPELINE):
     """Main pipeline - from user input to price prediction in one command"""
     print("="*70)
     print("🚗 پیش‌بینیکننده قیمت خودرو - Divar")
@@ -22,6 +25,7 @@ def main():
     print("="*70)
     
     start_time = time.time()
+    ensure_data_dirs()
     
     # Step 1: Get user input
     print("\n📍 مرحله 1: دریافت مشخصات خودرو")
@@ -29,113 +33,75 @@ def main():
     if not user_data:
         return
     
-    # Generate file paths for this specific search
-    data_file = get_user_data_file(
-        user_data['brand_model'], 
-        user_data['year_model'], 
-        user_data['mileage'], 
-        user_data['gearbox'], 
-        user_data['fuel_type']
-    )
-    
-    model_file = get_user_model_file(
-        user_data['brand_model'], 
-        user_data['year_model'], 
-        user_data['mileage'], 
-        user_data['gearbox'], 
-        user_data['fuel_type']
-    )
-    
-    # Check if we already have a model for this search
-    if os.path.exists(model_file):
-        print("\n🔍 مدل از قبل آموزش دیده برای این مشخصات پیدا شد!")
+    # Answer straight from the result cache when we priced this spec recently
+    cache = PredictionCache(get_state_store())
+    cached, cache_state = cache.get(user_data, background_refresh=False)
+    if cached:
+        age_minutes = cached['age'] / 60
+        print(f"\n⚡ پیش‌بینی ذخیره شده ({age_minutes:.0f} دقیقه پیش) پیدا شد")
+        display_prediction(user_data, cached['predicted_price'])
+        if cache_state == 'fresh':
+            elapsed = time.time() - start_time
+            print(f"\n⏱️  کل زمان اجرا: {elapsed:.1f} ثانیه")
+            return
+        print("🔄 پیش‌بینی قدیمی است، در حال به‌روزرسانی...")
+    
+    # Check if we already have a model for this search, or one trained on nearly the same cars
+    registry = get_model_registry()
+    found = None if cached else find_trained_model(user_data, registry)
+    if found:
+        if found['source'] == 'model':
+            print("\n🔍 مدل از قبل آموزش دیده برای این مشخصات پیدا شد!")
+        else:
+            print(f"\n🔍 مدل آموزش دیده با {found['samples']} آگهی از همین خودرو با مشخصات نزدیک پیدا شد!")
         use_existing = input("آیا می‌خواهید از مدل موجود استفاده کنید؟ (y/n): ").strip().lower()
         if use_existing == 'y':
-            predicted_price = predict_user_price(model_file, user_data)
+            predicted_price = predict_user_price(found['model_file'], user_data)
             if predicted_price:
+                registry.touch(found['model_file'])
                 display_prediction(user_data, predicted_price)
                 elapsed = time.time() - start_time
                 print(f"\n⏱️  کل زمان اجرا: {elapsed:.1f} ثانیه")
                 return
     
-    # Step 2: Search for similar ads
-    print("\n📍 مرحله 2: جستجوی آگهی‌های مشابه در دیوار")
-    print("⏳ در حال جستجو... این مرحله ممکن است چند دقیقه طول بکشد")
-    
-    urls = save_specific_urls(
-        brand_model=user_data['brand_model'],
-        year_model=user_data['year_model'],
-        mileage=user_data['mileage'],
-        gearbox=user_data['gearbox'],
-        fuel_type=user_data['fuel_type'],
-        max_ads=50,
-        max_scrolls=60
-    )
-    
-    if not urls:
-        print("❌ هیچ آگهی مشابهی پیدا نشد. لطفا مشخصات را بررسی کنید.")
-        return
-    
-    # Step 3: Scrape ad details
-    print(f"\n📍 مرحله 3: استخراج اطلاعات از {len(urls)} آگهی")
-    print("⏳ در حال استخراج اطلاعات...")
-    
-    ads_count = scrap_specific_ads(urls, data_file)
-    
-    if ads_count < 5:
-        print(f"❌ داده کافی جمع‌آوری نشد (فقط {ads_count} آگهی معتبر).")
-        print("💡 پیشنهاد: مشخصات خودرو را عمومی‌تر وارد کنید")
-        return
-    
-    # Step 4: Train ML model
-    print(f"\n📍 مرحله 4: آموزش مدل هوش مصنوعی")
-    print("⏳ در حال آموزش مدل...")
-    
-    model_data = train_user_model(data_file, model_file, user_data)
-    
-    if not model_data:
-        print("❌ آموزش مدل با شکست مواجه شد.")
-        return
-    
-    # Step 5: Predict price
-    print("\n📍 مرحله 5: پیش‌بینی قیمت")
+    # The global model answers known brands instantly, scraping only refines that answer
+    if not cached:
+        from core.global_model import predict_global
+        answer = predict_global(user_data)
+        if answer:
+            print(f"\n🌐 مدل سراسری این خودرو را با {answer['samples']} آگهی مشابه می‌شناسد")
+            display_prediction(user_data, answer['predicted_price'])
+            cache.put(user_data, answer['predicted_price'], answer['samples'])
+            refine = input("آیا می‌خواهید با آگهی‌های تازه دقیق‌تر شود؟ (y/n): ").strip().lower()
+            if refine != 'y':
+                save_search_history(user_data, answer['predicted_price'], answer['samples'], 'global_model')
+                elapsed = time.time() - start_time
+                print(f"\n⏱️  کل زمان اجرا: {elapsed:.1f} ثانیه")
+                return
     
-    predicted_price = predict_user_price(model_file, user_data)
+    # Steps 2-5: Search, scrape, train and predict
+    result = run_prediction_pipeline(user_data, max_ads=depth, max_scrolls=60, budget=budget,
+                                     profile=profile)
     
-    if predicted_price:
-        display_prediction(user_data, predicted_price)
+    if result:
+        display_prediction(user_data, result['predicted_price'])
+        cache.put(user_data, result['predicted_price'], result['samples'])
         
         # Save search history
-        save_search_history(user_data, predicted_price, model_data['metrics']['samples'])
-    else:
-        print("❌ پیش‌بینی قیمت با شکست مواجه شد.")
+        save_search_history(user_data, result['predicted_price'], result['samples'], 'scrape')
     
     elapsed = time.time() - start_time
     print(f"\n⏱️  کل زمان اجرا: {elapsed:.1f} ثانیه")
-
-def save_search_history(user_data, predicted_price, samples_count):
-    """Save user search history"""
-    history_file = get_search_history_file()
-    
-    from datetime import datetime
-    
-    history_data = {
-        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'brand_model': user_data['brand_model'],
-        'year_model': user_data['year_model'],
-        'mileage': user_data['mileage'],
-        'gearbox': user_data['gearbox'],
-        'fuel_type': user_data['fuel_type'],
-        'predicted_price': predicted_price,
-        'training_samples': samples_count
-    }
-    
-    df = pd.DataFrame([history_data])
-    
-    if os.path.exists(history_file):
-        df.to_csv(history_file, mode='a', header=False, index=False, encoding='utf-8-sig')
-    else:
-        df.to_csv(history_file, index=False, encoding='utf-8-sig')
+    for stage, (count, seconds) in stage_summary().items():
+        print(f"   {stage}: {seconds:.1f} ثانیه ({count} بار)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='پیش‌بینی قیمت خودرو از آگهی‌های دیوار')
+    parser.add_argument('--budget', type=int, default=None,
+                        help='wall-clock budget in seconds, scrape depth is picked to fit it')
+    parser.add_argument('--depth', type=int, default=50,
+                        help='ads to collect when no budget is given (default 50)')
+    parser.add_argument('--profile', action='store_true', default=PROFILE_PIPELINE,
+                        help='profile every stage (cProfile + tracemalloc), reports go to Data/Profiles/')
+    args = parser.parse_args()
+    main(budget=args.budget, depth=args.depth, profile=args.profile)
\ No newline at end of file
@@ -0,0 +1,35 @@
+# tests/conftest.py
+import random
+import pytest
+import core.save_urls
+import core.scrap_specific_ads
+from core.ad_index import SeenAds
+from core.model_registry import ModelRegistry
+from core.pipeline import PredictionPipeline
+from core.storage import StorageManager
+
+USER_DATA = {'brand_model': 'پژو 206 تیپ 2', 'year_model': 1398, 'mileage': 120000,
+             'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}
+
+def fake_rows(count=30):
+    rng = random.Random(7)
+    rows = []
+    for index in range(count):
+        year = rng.randint(1390, 1402)
+        mileage = rng.randint(10, 250) * 1000
+        price = 400000000 + (year - 1390) * 30000000 - mileage * 500 + rng.randint(-5, 5) * 1000000
+        rows.append(['پژو 206 تیپ 2', year, mileage, 'سفید', 'دنده ای', 'بنزین', price, 'تهران',
+                     f'https://divar.ir/v/peugeot-206/AaBbCc{index:04d}'])
+    return rows
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.save_urls, 'save_specific_urls', lambda **kwargs: ['https://divar.ir/v/peugeot-206/AaBbCc0000'])
+    monkeypatch.setattr(core.scrap_specific_ads, 'scrape_ad_rows', lambda urls, **kwargs: fake_rows())
+    registry = ModelRegistry(str(tmp_path / 'registry.sqlite'))
+    pipeline = PredictionPipeline(dict(USER_DATA), seen_ads=SeenAds(str(tmp_path / 'seen.bloom'), capacity=1000),
+                                  registry=registry, storage=StorageManager(str(tmp_path), str(tmp_path),
+                                                                            registry=registry))
+    pipeline.data_file = str(tmp_path / 'data.csv')
+    pipeline.model_file = str(tmp_path / 'model.joblib')
+    return pipeline
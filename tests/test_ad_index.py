@@ -0,0 +1,36 @@
+# tests/test_ad_index.py
+import os
+from core.ad_index import parse_ad_href, ad_token, canonicalize_ad_urls, SeenAds
+
+def test_ad_links_are_canonicalized_by_token():
+    assert parse_ad_href('/v/peugeot-206/AaBbCc0001?ref=feed#top') == \
+        ('AaBbCc0001', 'https://divar.ir/v/peugeot-206/AaBbCc0001')
+    assert ad_token('https://www.divar.ir/v/other-title/AaBbCc0001/') == 'AaBbCc0001'
+    ads = canonicalize_ad_urls(['/v/a/AaBbCc0001', 'https://divar.ir/v/b/AaBbCc0001', '/v/c/AaBbCc0002'])
+    assert ads == {'AaBbCc0001': 'https://divar.ir/v/a/AaBbCc0001',
+                   'AaBbCc0002': 'https://divar.ir/v/c/AaBbCc0002'}
+
+def test_non_ad_links_are_rejected():
+    for href in ['/s/tehran/car', 'https://example.com/v/a/AaBbCc0001', '/v/AaBbCc0001',
+                 '/login', '', None, 'https://divar.ir/s/iran/car?q=/v/a/AaBbCc0001']:
+        assert parse_ad_href(href) is None
+
+def test_seen_ads_persist_and_merge(tmp_path):
+    path = str(tmp_path / 'seen.bloom')
+    first, second = SeenAds(path, capacity=1000), SeenAds(path, capacity=1000)
+    first.add_many(['token-1', 'token-2'])
+    second.add('token-3')
+    assert first.save() and second.save()
+
+    assert os.path.exists(f'{path}.lock')
+    reloaded = SeenAds(path, capacity=1000)
+    assert all(token in reloaded for token in ['token-1', 'token-2', 'token-3'])
+    assert 'token-4' not in reloaded
+    # A filter sized differently cannot read the file and starts empty
+    assert 'token-1' not in SeenAds(path, capacity=5000)
+
+def test_seen_ads_start_over_at_capacity(tmp_path):
+    seen = SeenAds(str(tmp_path / 'seen.bloom'), capacity=10)
+    seen.add_many(f'token-{i}' for i in range(10))
+    seen.add('token-new')
+    assert seen.count == 1 and 'token-new' in seen
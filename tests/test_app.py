@@ -1,6 +1,17 @@
 # tests/test_app.py
+import subprocess
+import sys
+import threading
 import pytest
+import App.app as app_module
 from App.app import app
+import time
+from core.state_store import SQLiteStateStore
+from core.result_cache import PredictionCache
+from core.jobs import JobQueue
+from core.model_registry import ModelRegistry
+from core.global_model import GlobalModelTrainer
+from core.prewarm import Prewarmer
 
 @pytest.fixture
 def client():
@@ -8,6 +19,113 @@ def client():
     with app.test_client() as client:
         yield client
 
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    monkeypatch.setattr(app_module, 'pipeline_store', store)
+    return store
+
 def test_home_page(client):
     response = client.get('/')
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+def test_progress_stream_replays_events(client, store):
+    with client.session_transaction() as sess:
+        sess['session_id'] = 'abc'
+    store.set('pipeline:abc', {'current_step': 'searching'})
+    publish = app_module.session_progress('abc')
+    publish('scroll', {'scroll': 1, 'max_scrolls': 40, 'urls_found': 12, 'new_urls': 12})
+    publish('prediction_done', {'predicted_price': 650000000.0})
+    
+    with client.get('/progress/stream') as response:
+        body = response.get_data(as_text=True)
+    assert response.mimetype == 'text/event-stream'
+    assert 'event: scroll' in body
+    assert '"urls_found": 12' in body
+    assert body.rstrip().endswith('"predicted_price": 650000000.0}')
+
+def test_progress_streams_are_short_and_capped(client, store, monkeypatch):
+    with client.session_transaction() as sess:
+        sess['session_id'] = 'abc'
+    store.set('pipeline:abc', {'current_step': 'scraping'})
+    monkeypatch.setattr(app_module, 'PROGRESS_STREAM_MAX_SECONDS', 0.5)
+    monkeypatch.setattr(app_module, 'progress_streams', threading.BoundedSemaphore(1))
+
+    started = time.time()
+    with client.get('/progress/stream') as response:
+        assert response.get_data(as_text=True).startswith('retry: 2000')
+    assert time.time() - started < 5
+
+    # The closed stream gave its slot back
+    assert app_module.progress_streams.acquire(blocking=False)
+    body = client.get('/progress/stream').get_data(as_text=True)
+    assert body == f'retry: {app_module.PROGRESS_BUSY_RETRY}\n\n'
+    app_module.progress_streams.release()
+
+def test_batch_price_api(client, store, monkeypatch, tmp_path):
+    # No trained or global model answers, whatever is in Data/Models
+    monkeypatch.setattr(app_module, 'model_registry', ModelRegistry(str(tmp_path / 'registry.sqlite')))
+    monkeypatch.setattr(app_module, 'global_model_file', str(tmp_path / 'global_model.pkl'))
+    monkeypatch.setattr('core.pipeline.get_user_model_file', lambda *spec: str(tmp_path / 'model.joblib'))
+    monkeypatch.setattr(app_module, 'prediction_cache', PredictionCache(store))
+    monkeypatch.setattr(app_module, 'pricing_jobs', JobQueue(store, lambda user_data: {'predicted_price': 1.5e9}))
+    monkeypatch.setattr(app_module, 'save_search_history', lambda *args: None)
+    known = {'brand_model': 'پژو 206', 'year_model': 1398, 'mileage': 90000,
+             'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}
+    app_module.prediction_cache.put(known, 650000000, 40)
+    unknown = dict(known, brand_model='تویوتا کمری')
+    
+    response = client.post('/api/v1/price', json={'cars': [known, unknown, {'brand_model': 'x'}]})
+    results = response.get_json()['results']
+    assert results[0]['status'] == 'done' and results[0]['source'] == 'cache'
+    assert results[0]['predicted_price'] == 650000000
+    assert results[1]['status'] == 'queued'
+    assert results[2]['status'] == 'invalid'
+    
+    for _ in range(50):
+        job = client.get(results[1]['status_url']).get_json()
+        if job['status'] == 'done':
+            break
+        time.sleep(0.05)
+    assert job['result'] == {'predicted_price': 1.5e9}
+
+def test_metrics_endpoint(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'car_price_stage_seconds' in response.get_data(as_text=True)
+
+def test_app_import_does_not_load_browser_or_ml_stack():
+    code = ("import sys, App.app; "
+            "print([m for m in ('selenium', 'bs4', 'pandas', 'sklearn', 'joblib') if m in sys.modules])")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
+
+def test_background_tasks_start_only_when_asked(store, monkeypatch):
+    code = ("import threading, App.app; "
+            "print(sorted(thread.name for thread in threading.enumerate() if thread.daemon))")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert output.strip().splitlines()[-1] == '[]'
+
+    trainer = GlobalModelTrainer(store, interval=3600, startup_delay=3600)
+    prewarmer = Prewarmer(store, PredictionCache(store), interval=3600, startup_delay=3600)
+    monkeypatch.setattr(app_module, 'global_model_trainer', trainer)
+    monkeypatch.setattr(app_module, 'prewarmer', prewarmer)
+    monkeypatch.setattr(app_module, 'ensure_data_dirs', lambda: None)
+    app_module.start_background_tasks()
+    assert trainer._thread.is_alive() and prewarmer._thread.is_alive()
+    trainer.stop()
+    prewarmer.stop()
+
+def test_cleanup_cancels_running_steps(client, store):
+    with client.session_transaction() as sess:
+        sess['session_id'] = 'abc'
+    store.set('pipeline:abc', {'current_step': 'scraping', 'user_data': {
+        'brand_model': 'پژو 206', 'year_model': 1398, 'mileage': 120000,
+        'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}})
+    token = app_module.session_pipeline('abc', store.get('pipeline:abc')).cancel_token
+    assert not token.cancelled
+    
+    assert client.post('/cleanup').get_json()['success']
+    assert store.get('pipeline:abc') is None
+    token._last_check = 0
+    assert token.cancelled
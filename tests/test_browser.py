@@ -0,0 +1,64 @@
+# tests/test_browser.py
+import threading
+import pytest
+from fnmatch import fnmatchcase
+from core.browser import BrowserLimiter, BrowserCapacityError, browser_options, LEAN_BLOCKED_URLS
+from core.config import get_chrome_options
+
+def test_slots_queue_and_reject(tmp_path):
+    limiter = BrowserLimiter(slots=1, queue_limit=1, lock_dir=str(tmp_path), poll_interval=0.05)
+    first = limiter.acquire()
+    
+    positions = []
+    acquired = threading.Event()
+    def waiter():
+        slot = limiter.acquire(on_wait=lambda position, eta: positions.append((position, eta)))
+        acquired.set()
+        limiter.release(slot)
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    while not positions:
+        pass
+    
+    with pytest.raises(BrowserCapacityError) as rejected:
+        limiter.acquire()
+    assert rejected.value.retry_after > 0
+    assert positions[0][0] == 1
+    assert not acquired.is_set()
+    
+    limiter.release(first)
+    thread.join(2)
+    assert acquired.is_set()
+    assert limiter.status()['active'] == 0
+
+def test_slots_are_shared_between_limiters(tmp_path):
+    # Two limiters on the same lock files behave like two worker processes
+    workers = [BrowserLimiter(slots=1, queue_timeout=0, lock_dir=str(tmp_path)) for _ in range(2)]
+    slot = workers[0].acquire()
+    with pytest.raises(BrowserCapacityError):
+        workers[1].acquire()
+    workers[0].release(slot)
+    workers[1].release(workers[1].acquire())
+
+def test_lean_profile_extends_the_shared_options():
+    lean = browser_options('lean')
+    assert lean.page_load_strategy == 'eager'
+    assert lean.experimental_options['prefs']['profile.managed_default_content_settings.images'] == 2
+    assert set(get_chrome_options().arguments) < set(lean.arguments)
+    # The cached options are copied, not changed
+    assert get_chrome_options().page_load_strategy == 'normal'
+    assert browser_options('full').arguments == get_chrome_options().arguments
+    with pytest.raises(ValueError):
+        browser_options('tiny')
+
+def test_lean_profile_only_blocks_assets_and_third_party_hosts():
+    def blocked(url):
+        return any(fnmatchcase(url, pattern) for pattern in LEAN_BLOCKED_URLS)
+
+    for url in ['https://divar.ir/s/iran/car/peugeot/206', 'https://divar.ir/v/پژو-206-tiptronic-tiled-roof/AaBbCc01',
+                'https://divar.ir/v/versatile-van/AaBbCc02', 'https://api.divar.ir/v8/posts-v2/web/AaBbCc01',
+                'https://divar.ir/static/js/main.js']:
+        assert not blocked(url), url
+    for url in ['https://a.tile.openstreetmap.org/12/2633/1614.png', 'https://tiles.divar.ir/v1/12/2633/1614',
+                'https://api.mapbox.com/styles/v1/divar/tiles/12', 'https://cdn.divar.ir/posts/photo.webp']:
+        assert blocked(url), url
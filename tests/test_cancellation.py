@@ -0,0 +1,43 @@
+# tests/test_cancellation.py
+import threading
+import time
+import pytest
+from core.cancellation import CancellationToken, OperationCancelled, store_cancel_check
+from core.browser import BrowserLimiter
+from core.state_store import SQLiteStateStore
+
+def test_deadline_and_child_tokens():
+    parent = CancellationToken(timeout=0.2, poll_interval=0.05)
+    child = parent.child(timeout=60)
+    assert child.deadline == parent.deadline
+    assert not child.stopped
+    
+    started = time.time()
+    assert child.sleep(5) is False
+    assert time.time() - started < 1
+    assert child.expired and not child.cancelled
+    assert child.reason() == 'deadline'
+    
+    parent.cancel()
+    assert child.cancelled and child.reason() == 'cancelled'
+
+def test_cancel_from_state_store_wakes_sleeper(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    token = CancellationToken(check=store_cancel_check(store, 'cancel:abc'), poll_interval=0.05)
+    threading.Timer(0.1, lambda: store.set('cancel:abc', {'cancelled_at': time.time()})).start()
+    
+    started = time.time()
+    assert token.sleep(5) is False
+    assert time.time() - started < 1
+    assert token.cancelled
+
+def test_cancelled_waiter_leaves_browser_queue(tmp_path):
+    limiter = BrowserLimiter(slots=1, lock_dir=str(tmp_path), poll_interval=0.05)
+    slot = limiter.acquire()
+    token = CancellationToken()
+    threading.Timer(0.1, token.cancel).start()
+    
+    with pytest.raises(OperationCancelled):
+        limiter.acquire(cancel_token=token)
+    assert limiter.status()['queued'] == 0
+    limiter.release(slot)
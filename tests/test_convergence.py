@@ -0,0 +1,52 @@
+# tests/test_convergence.py
+import random
+from core.convergence import ConvergenceMonitor, quick_estimate
+
+USER_DATA = {'brand_model': 'پژو 206', 'year_model': 1398, 'mileage': 120000,
+             'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}
+
+def ad_rows(count, noise, seed=3):
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        year = rng.randint(1392, 1402)
+        mileage = rng.randint(10, 250) * 1000
+        price = 500000000 + (year - 1392) * 25000000 - mileage * 400
+        price = int(price * (1 + rng.uniform(-noise, noise)))
+        rows.append(['پژو 206', year, mileage, 'سفید', 'دنده ای', 'بنزین', price, 'تهران',
+                     f'https://divar.ir/v/ad/{index}'])
+    return rows
+
+def stopping_point(monitor, rows):
+    for count in range(1, len(rows) + 1):
+        if monitor(rows[:count]):
+            return count
+    return None
+
+def test_quick_estimate_predicts_near_the_true_price():
+    prediction, cv_error = quick_estimate(ad_rows(40, noise=0.02), USER_DATA)
+    true_price = 500000000 + 6 * 25000000 - 120000 * 400
+    assert abs(prediction - true_price) / true_price < 0.1
+    assert 0 <= cv_error < 0.1
+
+def test_stops_early_once_the_estimate_settles():
+    events = []
+    monitor = ConvergenceMonitor(USER_DATA, tolerance=0.05, min_ads=15, every=5, patience=2,
+                                 progress=lambda event, data: events.append(data))
+    stopped_at = stopping_point(monitor, ad_rows(100, noise=0.01))
+    assert stopped_at is not None and stopped_at < 100
+    assert events[-1]['converged'] and events[-1]['ads'] == stopped_at
+
+def test_keeps_scraping_while_the_estimate_moves():
+    monitor = ConvergenceMonitor(USER_DATA, tolerance=0.0001, min_ads=15, every=5, patience=2)
+    assert stopping_point(monitor, ad_rows(60, noise=0.4)) is None
+    assert len(monitor.history) == 10
+
+def test_cv_error_change_is_compared_in_absolute_points(monkeypatch):
+    # Steady prediction; the CV error moves 0.02 → 0.04 → 0.05 → 0.06 (+100%, +25%, +20% of itself)
+    estimates = iter([(6e8, 0.02), (6e8, 0.04), (6e8, 0.05), (6e8, 0.06)])
+    monkeypatch.setattr('core.convergence.quick_estimate', lambda rows, user_data: next(estimates))
+    monitor = ConvergenceMonitor(USER_DATA, tolerance=0.03, error_tolerance=0.015, min_ads=1, every=1,
+                                 patience=2)
+    assert [monitor(['ad'] * count) for count in range(1, 5)] == [False, False, False, True]
+    assert monitor.stable_rounds == 2
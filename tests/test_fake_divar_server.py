@@ -0,0 +1,57 @@
+# tests/test_fake_divar_server.py
+import json
+import os
+import subprocess
+import sys
+import urllib.error
+import urllib.request
+from bs4 import BeautifulSoup
+from benchmarks.fake_divar_server import FakeDivarServer
+from core.save_urls import extract_urls_robust
+from core.scrap_specific_ads import extract_ad_data, clean_row_data
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class PageDriver:
+    def __init__(self, page_source):
+        self.page_source = page_source
+
+    def execute_script(self, script, *args):
+        return []
+
+def fetch(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read().decode('utf-8')
+
+def test_feed_and_ad_pages_parse_like_divar():
+    with FakeDivarServer(feed_pages=3, page_size=10) as server:
+        search_page = fetch(f"{server.base_url}/s/tehran/car?q=%D9%BE%DA%98%D9%88%20206")
+        ads = extract_urls_robust(PageDriver(search_page))
+        assert len(ads) == 10
+
+        feed = json.loads(fetch(f"{server.base_url}/api/feed?page=2&q=x&region=tehran&sort="))
+        assert feed['has_more'] is False and feed['show_more'] is True
+
+        token, url = next(iter(ads.items()))
+        path = url.split('/v/', 1)[1]
+        row = clean_row_data(extract_ad_data(BeautifulSoup(fetch(f"{server.base_url}/v/{path}"), 'html.parser'), url))
+        assert row[0] == 'پژو 206' and row[6] > 0 and 1385 <= row[1] <= 1400
+        assert server.stats['search'] == 1 and server.stats['ad'] == 1
+
+def test_error_rate_fails_ad_pages():
+    with FakeDivarServer(error_rate=1.0) as server:
+        try:
+            fetch(f"{server.base_url}/v/title/AaBbCc0001")
+            assert False, 'expected an HTTP error'
+        except urllib.error.HTTPError as e:
+            assert e.code == 502
+        assert server.stats['errors'] == 1
+
+def test_home_url_can_point_at_a_stand_in():
+    script = ("from core.config import get_search_url; from core.ad_index import parse_ad_href; "
+              "print(get_search_url('x', region='tehran')); "
+              "print(parse_ad_href('http://127.0.0.1:8765/v/a/AaBbCc0001')[1]); "
+              "print(parse_ad_href('https://divar.ir/v/a/AaBbCc0001'))")
+    output = subprocess.run([sys.executable, '-c', script], cwd=BASE_DIR, capture_output=True, text=True, check=True,
+                            env=dict(os.environ, DIVAR_HOME_URL='http://127.0.0.1:8765/')).stdout.split()
+    assert output == ['http://127.0.0.1:8765/s/tehran/car?q=x', 'http://127.0.0.1:8765/v/a/AaBbCc0001', 'None']
@@ -0,0 +1,30 @@
+# tests/test_fixtures.py
+import os
+from bs4 import BeautifulSoup
+from core.save_urls import extract_urls_robust
+from core.scrap_specific_ads import extract_ad_data, clean_row_data
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures')
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+class PageDriver:
+    def __init__(self, page_source):
+        self.page_source = page_source
+
+    def execute_script(self, script, *args):
+        return []
+
+def test_recorded_search_page_yields_each_ad_once():
+    ads = extract_urls_robust(PageDriver(read_fixture('search_page.html')))
+    assert len(ads) == 24
+    assert all(url.startswith('https://divar.ir/v/') and '?' not in url for url in ads.values())
+
+def test_recorded_ad_pages_parse():
+    row = clean_row_data(extract_ad_data(BeautifulSoup(read_fixture('ad_page.html'), 'html.parser'), 'url'))
+    assert row == ['پژو 206 تیپ 2', 1398, 120000, 'سفید', 'دنده ای', 'بنزینی', 650000000, 'iran', 'url']
+    # No "قیمت پایه" row: the price is found in the description text
+    row = clean_row_data(extract_ad_data(BeautifulSoup(read_fixture('ad_page_price_in_text.html'), 'html.parser'), 'url'))
+    assert row[0] == 'پژو 206 تیپ 5' and row[6] == 780000000
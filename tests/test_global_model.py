@@ -0,0 +1,85 @@
+# tests/test_global_model.py
+import os
+import pytest
+from benchmarks.synthetic_ads import write_ads_csv
+from core.global_model import (GlobalModelTrainer, load_scraped_ads, needs_retraining, predict_global,
+                               retrain_global_model)
+from core.pipeline import quick_prediction
+from core.state_store import SQLiteStateStore
+from core.model_registry import ModelRegistry
+
+def car(brand_model, year_model=1398, mileage=60000):
+    return {'brand_model': brand_model, 'year_model': year_model, 'mileage': mileage,
+            'gearbox': 'دنده ای', 'fuel_type': 'بنزینی'}
+
+@pytest.fixture(scope='module')
+def trained(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('global_model')
+    data_dir = workdir / 'UserData'
+    write_ads_csv(str(data_dir / 'user_data_a.csv'), 2000, seed=1)
+    write_ads_csv(str(data_dir / 'user_data_b.csv'), 2000, seed=2)
+    model_file = str(workdir / 'global_model.pkl')
+    registry = ModelRegistry(str(workdir / 'registry.sqlite'))
+    model_data = retrain_global_model(str(data_dir), model_file, registry=registry)
+    return str(data_dir), model_file, model_data, registry
+
+def test_one_model_prices_every_known_brand(trained):
+    data_dir, model_file, model_data, _ = trained
+    assert model_data['metrics']['brands'] == 16 and model_data['metrics']['test_r2'] > 0.8
+
+    pride = predict_global(car('پراید 131 SE'), model_file)
+    camry = predict_global(car('تویوتا کمری'), model_file)
+    # Noise-free synthetic prices of these two cars
+    assert abs(pride['predicted_price'] - 275.7e6) / 275.7e6 < 0.15
+    assert abs(camry['predicted_price'] - 2321.9e6) / 2321.9e6 < 0.15
+    assert pride['samples'] >= 20
+    assert predict_global(car('پراید 131 SE', year_model=1390), model_file)['predicted_price'] < pride['predicted_price']
+
+def test_unknown_brands_still_need_a_scrape(trained):
+    data_dir, model_file, _, registry = trained
+    assert predict_global(car('بی ام و X5'), model_file) is None
+    assert predict_global(car('پراید 131 SE'), model_file, min_brand_ads=100000) is None
+
+    assert quick_prediction(car('بی ام و X5'), registry=registry, global_model_file=model_file) is None
+    assert quick_prediction(car('پراید 131 SE'), registry=registry,
+                            global_model_file=model_file)['source'] == 'global_model'
+
+def test_brands_are_keyed_by_the_search_query(tmp_path):
+    data_dir = tmp_path / 'UserData'
+    registry = ModelRegistry(str(tmp_path / 'registry.sqlite'))
+    # Divar's brand text differs from what the user searched for
+    for spec, query, brands in (('1a2b3c4d', 'پژو 206', [('پژو 206 تیپ 2', 720), ('پژو 206 SD V8', 800)]),
+                                ('5e6f7a8b', 'پراید 131', [('پراید 131 SE', 380)])):
+        write_ads_csv(str(data_dir / f'user_data_{spec}.csv'), 300, seed=len(query), brand_models=brands)
+        registry.register(str(tmp_path / 'Models' / f'user_model_{spec}.pkl'), {'user_data': car(query)})
+    # No registered search, keyed by the ads' own brand text
+    write_ads_csv(str(data_dir / 'user_data_9c0d1e2f.csv'), 300, seed=3, brand_models=[('تویوتا کمری', 3200)])
+    model_file = str(tmp_path / 'global_model.pkl')
+    model_data = retrain_global_model(str(data_dir), model_file, registry=registry)
+
+    assert set(model_data['brand_stats']) == {'پژو 206', 'پراید 131', 'تویوتا کمری'}
+    peugeot = predict_global(car('پژو 206'), model_file)
+    assert peugeot['samples'] >= 250
+    assert predict_global(car('پراید 131'), model_file)['predicted_price'] < peugeot['predicted_price']
+    assert predict_global(car('تویوتا کمری'), model_file)
+
+def test_retrains_only_after_new_ads(trained, tmp_path):
+    data_dir, model_file, _, registry = trained
+    assert not needs_retraining(data_dir, model_file)
+    assert retrain_global_model(data_dir, model_file, registry=registry) is None
+
+    # The same ads found again by another search are counted once
+    copy = tmp_path / 'UserData'
+    copy.mkdir()
+    for name in os.listdir(data_dir):
+        (copy / name).write_bytes(open(os.path.join(data_dir, name), 'rb').read())
+    write_ads_csv(str(copy / 'user_data_c.csv'), 2000, seed=1)
+    assert len(load_scraped_ads(str(copy), registry)) == 4000
+
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    trainer = GlobalModelTrainer(store, data_dir=str(copy), model_file=str(tmp_path / 'model.pkl'), registry=registry)
+    store.add(GlobalModelTrainer.LEASE_KEY, {'pid': 0})
+    assert trainer.run_once() is None  # Another worker is training
+    store.delete(GlobalModelTrainer.LEASE_KEY)
+    assert trainer.run_once()['metrics']['samples'] > 3000
+    assert store.get(GlobalModelTrainer.LEASE_KEY) is None
@@ -0,0 +1,77 @@
+# tests/test_history_store.py
+import os
+import threading
+import time
+from core.history_store import SearchHistoryStore, history_row
+
+PEUGEOT = {'brand_model': 'پژو 206', 'year_model': '1398', 'mileage': '90000',
+           'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}
+PRIDE = dict(PEUGEOT, brand_model='پراید 131', year_model='1395')
+
+def test_records_are_written_in_batches(tmp_path):
+    store = SearchHistoryStore(str(tmp_path / 'history.sqlite'), flush_interval=0.05, batch_size=50)
+    for _ in range(120):
+        store.record(PEUGEOT, 650_000_000, 80, 'model')
+    store.flush()
+
+    assert store.count() == 120
+    latest = store.searches(limit=1)[0]
+    assert latest['brand_model'] == 'پژو 206'
+    assert latest['mileage'] == 90000
+    assert latest['source'] == 'model'
+
+def test_most_requested_within_time_window(tmp_path):
+    store = SearchHistoryStore(str(tmp_path / 'history.sqlite'))
+    now = time.time()
+    old = now - 30 * 24 * 3600
+    store.write_rows([history_row(PRIDE, 300_000_000, 50, timestamp=old) for _ in range(5)] +
+                     [history_row(PEUGEOT, 650_000_000, 80, timestamp=now) for _ in range(3)] +
+                     [history_row(PRIDE, 320_000_000, 50, timestamp=now)])
+
+    week = store.most_requested(since=now - 7 * 24 * 3600)
+    assert [row['brand_model'] for row in week] == ['پژو 206', 'پراید 131']
+    assert week[0]['requests'] == 3
+    assert store.most_requested(limit=1)[0]['requests'] == 6
+    assert store.count(brand_model='پراید  131') == 6
+
+    specs = store.most_requested_specs(since=now - 7 * 24 * 3600)
+    assert specs[0]['year_model'] == 1398
+    assert specs[0]['gearbox'] == 'دنده ای'
+
+def test_import_legacy_csv_skips_garbled_rows(tmp_path):
+    csv_file = tmp_path / 'search_history.csv'
+    csv_file.write_text(
+        'timestamp,brand_model,year_model,mileage,gearbox,fuel_type,predicted_price,training_samples\n'
+        '2024-05-01 10:00:00,پژو 206,1398,90000,دنده ای,بنزین,650000000.0,80\n'
+        '2024-05-01 10:00:01,پراید 131,13952024-05-01 10:00:02,پژو\n'
+        '2024-05-02 09:30:00,پراید 131,1395,150000,دنده ای,بنزین,,0\n',
+        encoding='utf-8'
+    )
+    store = SearchHistoryStore(str(tmp_path / 'history.sqlite'))
+
+    assert store.import_csv(str(csv_file)) == (2, 1)
+    assert not csv_file.exists()
+    assert os.path.exists(f'{csv_file}.imported')
+    rows = store.searches()
+    assert [row['timestamp'] for row in rows] == ['2024-05-02 09:30:00', '2024-05-01 10:00:00']
+    assert rows[0]['predicted_price'] is None
+    assert rows[1]['source'] == 'csv_import'
+
+def test_workers_starting_together_import_the_legacy_csv_once(tmp_path):
+    csv_file = tmp_path / 'search_history.csv'
+    csv_file.write_text(
+        'timestamp,brand_model,year_model,mileage,gearbox,fuel_type,predicted_price,training_samples\n' +
+        '2024-05-01 10:00:00,پژو 206,1398,90000,دنده ای,بنزین,650000000.0,80\n' * 500,
+        encoding='utf-8'
+    )
+    db_file = str(tmp_path / 'history.sqlite')
+    results = []
+    # One store per worker; flock excludes separate opens of the lock file even within a process
+    workers = [threading.Thread(target=lambda: results.append(SearchHistoryStore(db_file).import_csv(str(csv_file))))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert sorted(results) == [(0, 0)] * 3 + [(500, 0)]
+    assert SearchHistoryStore(db_file).count() == 500
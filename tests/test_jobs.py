@@ -0,0 +1,75 @@
+# tests/test_jobs.py
+import threading
+import time
+from core.jobs import JobQueue
+from core.result_cache import spec_cache_key
+from core.state_store import SQLiteStateStore
+
+CAR = {'brand_model': 'پژو 206', 'year_model': 1398, 'mileage': 120000, 'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}
+
+def wait_for(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.02)
+    return queue.get(job_id)
+
+def test_job_of_a_dead_worker_is_failed_and_requeued(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    # Left behind by a worker that died mid-job: running, but nobody renews its lease
+    store.set('job:dead', {'job_id': 'dead', 'status': 'running', 'user_data': CAR, 'options': {}})
+    store.set(f"job_for_spec:{spec_cache_key(CAR)}", {'job_id': 'dead'})
+    queue = JobQueue(store, lambda user_data: {'predicted_price': 1.5e9}, lease_ttl=3)
+
+    assert queue.get('dead')['status'] == 'failed'
+    job = queue.submit(CAR)
+    assert job['job_id'] != 'dead'
+    assert wait_for(queue, job['job_id'])['result'] == {'predicted_price': 1.5e9}
+
+def test_heartbeat_keeps_long_jobs_alive(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    queue = JobQueue(store, lambda user_data: time.sleep(1.5) or {'predicted_price': 1.5e9}, lease_ttl=0.6)
+
+    job = queue.submit(CAR)
+    time.sleep(1)
+    assert queue.get(job['job_id'])['status'] == 'running'
+    assert queue.submit(CAR)['job_id'] == job['job_id']
+    assert wait_for(queue, job['job_id'])['status'] == 'done'
+
+def test_concurrent_submits_share_one_job_per_spec_and_options(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    calls = []
+    queue = JobQueue(store, lambda user_data, **options: calls.append(options) or time.sleep(0.3) or {'ok': 1})
+
+    jobs = []
+    threads = [threading.Thread(target=lambda: jobs.append(queue.submit(CAR))) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({job['job_id'] for job in jobs}) == 1
+
+    deep = queue.submit(CAR, {'depth': 200})
+    assert deep['job_id'] != jobs[0]['job_id']
+    assert queue.submit(CAR, {'depth': 200})['job_id'] == deep['job_id']
+    assert wait_for(queue, deep['job_id'])['status'] == 'done'
+    assert sorted(calls, key=len) == [{}, {'depth': 200}]
+
+def test_lost_job_keeps_its_failure_and_the_newer_jobs_spec(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    spec_key = f"job_for_spec:{spec_cache_key(CAR)}"
+
+    def outlived_by_its_lease(user_data):
+        # Meanwhile its lease lapsed, the job was reported failed and the spec went to a newer job
+        job_id = store.get(spec_key)['job_id']
+        store.update(f"job:{job_id}", {'status': 'failed'})
+        store.set(spec_key, {'job_id': 'newer'})
+        return {'predicted_price': 1.5e9}
+
+    queue = JobQueue(store, outlived_by_its_lease)
+    job = queue.submit(CAR)
+    queue.executor.shutdown(wait=True)
+    assert queue.get(job['job_id'])['status'] == 'failed'
+    assert store.get(spec_key) == {'job_id': 'newer'}
@@ -0,0 +1,48 @@
+# tests/test_latency_budget.py
+import pytest
+from core.latency_budget import LatencyModel, LatencyTracker
+from core.pipeline import PredictionPipeline
+from core.state_store import SQLiteStateStore
+
+USER_DATA = {'brand_model': 'پژو 206', 'year_model': 1398, 'mileage': 120000,
+             'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}
+
+@pytest.fixture
+def model(tmp_path):
+    return LatencyModel(SQLiteStateStore(str(tmp_path / 'state.sqlite')))
+
+def test_plan_scales_depth_with_budget(model):
+    short, long = model.plan(60), model.plan(600)
+    assert short['max_ads'] < long['max_ads']
+    assert sum(short['deadlines'].values()) == pytest.approx(60, abs=1)
+    assert model.plan(5)['max_ads'] == 10  # Never below the useful minimum
+
+def test_measured_timings_change_the_plan(model):
+    before = model.plan(120)
+    for _ in range(10):
+        model.observe(ad=0.5, scroll=1.0, urls_per_scroll=12)
+    assert model.estimates()['ad'] == pytest.approx(0.5, rel=0.1)
+    assert model.plan(120)['max_ads'] > before['max_ads']
+
+def test_tracker_measures_stage_events(model):
+    clock = iter([100.0, 102.0, 112.0, 200.0, 201.0, 211.0])
+    events = []
+    track = LatencyTracker(model, lambda event, data: events.append(event), clock=lambda: next(clock))
+    
+    track('stage_started', {'stage': 'search'})
+    track('search_started', {'max_scrolls': 10})
+    track('search_done', {'scrolls': 5, 'urls_found': 40})
+    track('stage_started', {'stage': 'scrape'})
+    track('scrape_started', {'total': 10})
+    track('scrape_done', {'parsed': 8, 'failed': 2})
+    
+    est = model.estimates()
+    assert est['scroll'] == 2.0 and est['urls_per_scroll'] == 8.0 and est['ad'] == 1.0
+    assert est['browser_start'] == pytest.approx(1.7)  # 2s, then 1s folded in
+    assert len(events) == 6
+
+def test_pipeline_takes_depth_and_deadlines_from_budget(model):
+    pipeline = PredictionPipeline(dict(USER_DATA), budget=90, latency_model=model)
+    plan = model.plan(90)
+    assert pipeline.max_ads == plan['max_ads'] and pipeline.max_scrolls == plan['max_scrolls']
+    assert pipeline.deadlines['scrape'] == plan['deadlines']['scrape']
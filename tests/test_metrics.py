@@ -0,0 +1,24 @@
+# tests/test_metrics.py
+from core.metrics import Registry, Counter, Gauge, Histogram
+
+def test_render_prometheus_text():
+    registry = Registry()
+    stages = Histogram('stage_seconds', 'Stage duration', ['stage'], buckets=(1, 5), registry=registry)
+    scraped = Counter('ads_scraped_total', 'Ads scraped', registry=registry)
+    drivers = Gauge('active_drivers', 'Running browsers', registry=registry)
+    
+    stages.labels(stage='train').observe(0.5)
+    stages.labels(stage='train').observe(3)
+    with stages.labels(stage='predict').time():
+        pass
+    scraped.inc(3)
+    drivers.inc()
+    drivers.dec()
+    
+    text = registry.render()
+    assert '# TYPE stage_seconds histogram' in text
+    assert 'stage_seconds_bucket{stage="train",le="1"} 1' in text
+    assert 'stage_seconds_bucket{stage="train",le="+Inf"} 2' in text
+    assert 'stage_seconds_count{stage="predict"} 1' in text
+    assert 'ads_scraped_total 3' in text
+    assert 'active_drivers 0' in text
@@ -0,0 +1,67 @@
+# tests/test_model_registry.py
+import os
+import random
+import pytest
+from core.model_registry import ModelRegistry
+from core.pipeline import quick_prediction
+from core.train_user_model import ads_dataframe, train_model_on_dataframe
+
+USER_DATA = {'brand_model': 'پژو 206 تیپ 2', 'year_model': 1398, 'mileage': 120000,
+             'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}
+
+def ad_rows(count, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        year = rng.randint(1392, 1400)
+        mileage = rng.randint(10, 200) * 1000
+        price = 400000000 + (year - 1390) * 30000000 - mileage * 500 + rng.randint(-5, 5) * 1000000
+        rows.append(['پژو 206 تیپ 2', year, mileage, 'سفید', 'دنده ای', 'بنزین', price, 'تهران',
+                     f'https://divar.ir/v/peugeot-206/AaBbCc{index:04d}'])
+    return rows
+
+@pytest.fixture
+def registry(tmp_path):
+    return ModelRegistry(str(tmp_path / 'registry.sqlite'))
+
+def train(tmp_path, name, rows, user_data=USER_DATA):
+    model_file = str(tmp_path / f'{name}.pkl')
+    return model_file, train_model_on_dataframe(ads_dataframe(rows), model_file, dict(user_data))
+
+def test_register_indexes_spec_window_and_metrics(tmp_path, registry):
+    model_file, model_data = train(tmp_path, 'a', ad_rows(40))
+    registry.register(model_file, model_data)
+
+    entry = registry.get(model_file)
+    assert entry['brand_model'] == USER_DATA['brand_model'] and entry['samples'] == 40
+    assert 1392 <= entry['year_min'] <= entry['year_max'] <= 1400
+    assert entry['size_bytes'] == os.path.getsize(model_file) and entry['uses'] == 0
+    registry.touch(model_file)
+    assert registry.get(model_file)['uses'] == 1
+    assert [e['model_file'] for e in registry.entries('پژو  206 تیپ 2')] == [entry['model_file']]
+
+def test_nearest_picks_the_closest_covering_model(tmp_path, registry):
+    small_file, small = train(tmp_path, 'small', ad_rows(20, seed=1))
+    large_file, large = train(tmp_path, 'large', ad_rows(60, seed=2))
+    registry.register(small_file, small)
+    registry.register(large_file, large)
+
+    other_spec = dict(USER_DATA, year_model=1395, mileage=90000)
+    nearest = registry.nearest(other_spec)
+    assert nearest['model_file'] == os.path.abspath(large_file) and nearest['distance'] == 0
+    assert registry.nearest(dict(other_spec, year_model=1380)) is None
+    assert registry.nearest(dict(other_spec, brand_model='پراید 131')) is None
+    assert registry.nearest(dict(other_spec, year_model=1401))['distance'] == 1
+
+    os.remove(large_file)
+    assert registry.nearest(other_spec)['model_file'] == os.path.abspath(small_file)
+    assert registry.get(large_file) is None
+
+def test_quick_prediction_reuses_a_similar_model(tmp_path, registry):
+    model_file, model_data = train(tmp_path, 'a', ad_rows(40))
+    registry.register(model_file, model_data)
+
+    answer = quick_prediction(dict(USER_DATA, year_model=1396, mileage=95000), registry=registry)
+    assert answer['source'] == 'similar_model' and answer['predicted_price'] > 0
+    assert 'model_file' not in answer
+    assert registry.get(model_file)['uses'] == 1
@@ -0,0 +1,67 @@
+# tests/test_pipeline.py
+import os
+import pytest
+import core.pipeline
+import core.scrap_specific_ads
+from core.pipeline import PredictionPipeline, PipelineCancelled, find_trained_model
+from core.ad_index import SeenAds
+from tests.conftest import USER_DATA, fake_rows
+
+def test_stages_share_data_in_memory_and_persist_in_background(pipeline):
+    seen = []
+    pipeline.add_hook('before_stage', lambda p, stage: seen.append(('before', stage)))
+    pipeline.add_hook('after_stage', lambda p, stage, result: seen.append(('after', stage)))
+
+    result = pipeline.run()
+    pipeline.wait_persisted()
+
+    assert result['predicted_price'] > 0
+    assert result['samples'] > 0
+    assert set(result['timings']) == set(PredictionPipeline.STAGES)
+    assert [stage for event, stage in seen if event == 'after'] == list(PredictionPipeline.STAGES)
+    assert os.path.exists(pipeline.data_file) and os.path.exists(pipeline.model_file)
+    assert 'AaBbCc0000' in SeenAds(pipeline.seen_ads.path, capacity=1000)
+    assert pipeline.registry.get(pipeline.model_file)['samples'] == result['samples']
+
+def test_restored_pipeline_continues_from_state(pipeline):
+    pipeline.run_stage('search')
+    pipeline.run_stage('scrape')
+
+    follower = PredictionPipeline(dict(USER_DATA), seen_ads=pipeline.seen_ads, registry=pipeline.registry,
+                                  storage=pipeline.storage).restore(pipeline.state())
+    follower.model_file = pipeline.model_file
+    assert follower.run_stage('train') and follower.run_stage('predict') > 0
+
+def test_cancel_stops_before_next_stage(pipeline):
+    pipeline.add_hook('after_stage', lambda p, stage, result: p.cancel())
+    with pytest.raises(PipelineCancelled):
+        pipeline.run_stage('search')
+        pipeline.run_stage('scrape')
+    assert pipeline.rows is None
+    assert pipeline.run() is None
+
+def test_deadline_keeps_partial_rows(pipeline, monkeypatch):
+    def slow_scrape(urls, progress=None, cancel_token=None, stop_when=None):
+        rows = []
+        for row in fake_rows():
+            if cancel_token.stopped:
+                break
+            rows.append(row)
+            cancel_token.sleep(0.05)
+        return rows
+    monkeypatch.setattr(core.scrap_specific_ads, 'scrape_ad_rows', slow_scrape)
+    pipeline.deadlines['scrape'] = 0.5
+    
+    pipeline.run_stage('search')
+    rows = pipeline.run_stage('scrape')
+    assert 0 < len(rows) < 30
+    assert pipeline.deadline_hits == ['scrape']
+    assert pipeline.run_stage('train')
+
+def test_own_model_reports_its_registered_samples(pipeline, monkeypatch):
+    result = pipeline.run()
+    pipeline.wait_persisted()
+    monkeypatch.setattr(core.pipeline, 'get_user_model_file', lambda *spec: pipeline.model_file)
+    found = find_trained_model(USER_DATA, pipeline.registry)
+    assert found['source'] == 'model'
+    assert found['samples'] == result['samples'] > 0
@@ -0,0 +1,75 @@
+# tests/test_prewarm.py
+import time
+import pytest
+from core.history_store import SearchHistoryStore, history_row
+from core.prewarm import Prewarmer
+from core.result_cache import PredictionCache
+from core.state_store import SQLiteStateStore
+
+def spec(brand, mileage=90000):
+    return {'brand_model': brand, 'year_model': 1398, 'mileage': mileage, 'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}
+
+class FakeBrowser:
+    def __init__(self, active=0, queued=0):
+        self.state = {'slots': 2, 'active': active, 'queued': queued}
+
+    def status(self):
+        return dict(self.state)
+
+@pytest.fixture
+def setup(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    history = SearchHistoryStore(str(tmp_path / 'history.sqlite'))
+    now = time.time()
+    rows = []
+    for brand, requests in (('پیش‌گرم الف', 6), ('پیش‌گرم ب', 4), ('پیش‌گرم ج', 3), ('پیش‌گرم د', 2)):
+        rows += [history_row(spec(brand), 500_000_000, 40, timestamp=now) for _ in range(requests)]
+    # Same cache key as 90000 km, counted together
+    rows += [history_row(spec('پیش‌گرم د', 90200), 500_000_000, 40, timestamp=now) for _ in range(3)]
+    # Outside the window
+    rows += [history_row(spec('پیش‌گرم قدیمی'), 500_000_000, 40, timestamp=now - 60 * 24 * 3600)
+             for _ in range(20)]
+    history.write_rows(rows)
+    scraped = []
+
+    def run(user_data):
+        scraped.append(user_data['brand_model'])
+        return {'predicted_price': 700_000_000, 'samples': 50}
+
+    def make(browser=None, **kwargs):
+        return Prewarmer(store, PredictionCache(store), history=history, run=run, max_load=0,
+                         browser=browser or FakeBrowser(), **kwargs)
+    return make, scraped
+
+def test_rank_merges_mileage_buckets_within_window(setup):
+    make, _ = setup
+    ranking = make().rank()
+    assert [(s['brand_model'], s['requests']) for s in ranking] == [
+        ('پیش‌گرم الف', 6), ('پیش‌گرم د', 5), ('پیش‌گرم ب', 4), ('پیش‌گرم ج', 3)]
+
+def test_round_scrapes_within_budget_and_skips_warm_specs(setup):
+    make, scraped = setup
+    prewarmer = make(max_scrapes=2)
+    prewarmer.cache.put(spec('پیش‌گرم الف'), 650_000_000, 80)
+
+    report = prewarmer.run_once()
+    assert scraped == ['پیش‌گرم د', 'پیش‌گرم ب']
+    assert (report['warm'], report['scrape'], report['deferred']) == (1, 2, 1)
+    assert report['deferred_by'] == 'scrapes'
+    assert prewarmer.cache.peek(spec('پیش‌گرم ب'))['predicted_price'] == 700_000_000
+
+    # The next round picks up what was left over
+    report = make(max_scrapes=2).run_once()
+    assert scraped[2:] == ['پیش‌گرم ج']
+    assert report['warm'] == 3
+
+def test_users_waiting_for_a_browser_defer_scrapes(setup):
+    make, scraped = setup
+    report = make(browser=FakeBrowser(active=1, queued=1)).run_once()
+    assert scraped == []
+    assert report['deferred'] == 4
+    assert report['deferred_by'] == 'browser'
+
+    prewarmer = make()
+    prewarmer.store.add(Prewarmer.LEASE_KEY, {'pid': 0})
+    assert prewarmer.run_once() is None
@@ -0,0 +1,38 @@
+# tests/test_profiling.py
+import json
+import os
+import tracemalloc
+import pytest
+import core.scrap_specific_ads
+from core.pipeline import PredictionPipeline
+from core.profiling import StageProfiler
+
+def test_every_stage_gets_a_report(pipeline, tmp_path):
+    profiler = StageProfiler(run_id='run', output_dir=str(tmp_path / 'profiles')).attach(pipeline)
+    assert pipeline.run()
+    pipeline.wait_persisted()
+
+    with open(os.path.join(profiler.run_dir, 'report.json'), encoding='utf-8') as f:
+        report = json.load(f)
+    assert list(report['stages']) == list(PredictionPipeline.STAGES)
+    train = report['stages']['train']
+    assert train['ok'] and train['top_functions'] and train['allocation_hotspots']
+    assert any('fit' in row['function'] for row in train['top_functions'])
+    assert abs(sum(report['breakdown'].values()) - 1) < 0.01
+    assert os.path.exists(os.path.join(profiler.run_dir, 'train.prof'))
+    assert not tracemalloc.is_tracing()
+
+def test_failed_stage_is_reported_and_tracing_stops(pipeline, tmp_path, monkeypatch):
+    def broken_scrape(urls, **kwargs):
+        raise RuntimeError('driver crashed')
+    monkeypatch.setattr(core.scrap_specific_ads, 'scrape_ad_rows', broken_scrape)
+    profiler = StageProfiler(run_id='run', output_dir=str(tmp_path / 'profiles')).attach(pipeline)
+
+    pipeline.run_stage('search')
+    with pytest.raises(RuntimeError):
+        pipeline.run_stage('scrape')
+
+    with open(os.path.join(profiler.run_dir, 'report.json'), encoding='utf-8') as f:
+        scrape = json.load(f)['stages']['scrape']
+    assert scrape['ok'] is False and 'driver crashed' in scrape['error']
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,37 @@
+# tests/test_result_cache.py
+import threading
+import time
+from core.result_cache import PredictionCache, spec_cache_key
+from core.state_store import SQLiteStateStore
+
+USER_DATA = {'brand_model': 'پژو 206 تيپ 2', 'year_model': 1398, 'mileage': 120300,
+             'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}
+
+def test_spec_key_normalizes_spelling_and_mileage():
+    other = dict(USER_DATA, brand_model=' پژو ۲۰۶  تیپ 2', mileage=119800)
+    assert spec_cache_key(USER_DATA) == spec_cache_key(other)
+
+def test_fresh_stale_and_background_refresh(tmp_path):
+    refreshed = threading.Event()
+    def refresh(user_data):
+        refreshed.set()
+        return {'predicted_price': 700000000, 'samples': 40}
+    
+    cache = PredictionCache(SQLiteStateStore(str(tmp_path / 'state.sqlite')), refresh=refresh, ttl=1)
+    assert cache.get(USER_DATA) == (None, 'miss')
+    cache.put(USER_DATA, 650000000, 35)
+    
+    entry, state = cache.get(USER_DATA)
+    assert state == 'fresh' and entry['predicted_price'] == 650000000
+    
+    time.sleep(1.1)
+    entry, state = cache.get(USER_DATA)
+    assert state == 'stale' and entry['predicted_price'] == 650000000
+    assert refreshed.wait(2)
+    time.sleep(0.2)
+    
+    entry, state = cache.get(USER_DATA)
+    assert state == 'fresh' and entry['predicted_price'] == 700000000
+    stats = cache.stats()
+    assert stats['misses'] == 1 and stats['stale_hits'] == 1
+    assert stats['hit_ratio'] == 0.75
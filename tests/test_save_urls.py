@@ -0,0 +1,69 @@
+# tests/test_save_urls.py
+import pytest
+import core.save_urls as save_urls
+from core.ad_index import canonicalize_ad_urls, SeenAds
+from core.browser import BrowserCapacityError
+
+def feed(region, count, offset=0):
+    # Same ad tokens under different titles, as different feeds list them
+    return canonicalize_ad_urls(f'https://divar.ir/v/{region}-title-{i}/AaBbCc{i:04d}'
+                                for i in range(offset, offset + count))
+
+def test_shards_are_merged_and_deduplicated(monkeypatch):
+    seen_urls = []
+    def fake_shard(search_url, max_ads, max_scrolls, scroll_pause_time, cancel_token, on_ready, on_scroll,
+                   on_wait=None):
+        seen_urls.append(search_url)
+        on_ready()
+        region = search_url.split('/s/')[1].split('/')[0]
+        for scroll in range(max_scrolls):
+            on_scroll(feed(region, 5, offset=scroll * 5))
+        return None
+    monkeypatch.setattr(save_urls, 'collect_shard_urls', fake_shard)
+    
+    events = []
+    urls = save_urls.save_specific_urls('پژو 206', max_ads=100, max_scrolls=12, regions=['tehran', 'karaj'],
+                                        sorts=['', 'sort_date'], progress=lambda e, d: events.append((e, d)))
+    assert len(seen_urls) == 4
+    assert any('/s/karaj/car' in url and 'sort=sort_date' in url for url in seen_urls)
+    # 4 shards × 3 scrolls × 5 ads, but every shard lists the same 15 tokens
+    assert len(urls) == 15
+    assert events[-1] == ('search_done', {'urls_found': 15, 'scrolls': 12, 'stopped': None})
+
+def test_reaching_the_target_stops_other_shards(monkeypatch):
+    stopped = []
+    def fake_shard(search_url, max_ads, max_scrolls, scroll_pause_time, cancel_token, on_ready, on_scroll,
+                   on_wait=None):
+        region = search_url.split('/s/')[1].split('/')[0]
+        for scroll in range(max_scrolls):
+            if cancel_token.stopped:
+                stopped.append(region)
+                break
+            on_scroll(feed(region, 10, offset=1000 * len(region) + scroll * 10))
+        return None
+    monkeypatch.setattr(save_urls, 'collect_shard_urls', fake_shard)
+    
+    urls = save_urls.save_specific_urls('پژو 206', max_ads=20, max_scrolls=20, regions=['a', 'bb', 'ccc'],
+                                        shard_workers=1, progress=lambda e, d: None)
+    assert len(urls) == 20
+    assert stopped == ['a', 'bb', 'ccc']  # Every shard ended on the shared token, none ran out of scrolls
+
+def test_capacity_error_reaches_caller_when_every_shard_is_rejected(monkeypatch):
+    monkeypatch.setattr(save_urls, 'collect_shard_urls',
+                        lambda *args, **kwargs: BrowserCapacityError('busy', retry_after=30))
+    with pytest.raises(BrowserCapacityError):
+        save_urls.save_specific_urls('پژو 206', regions=['tehran'], progress=lambda e, d: None)
+
+def test_skip_seen_ignores_known_ads(tmp_path, monkeypatch):
+    def fake_shard(search_url, max_ads, max_scrolls, scroll_pause_time, cancel_token, on_ready, on_scroll,
+                   on_wait=None):
+        on_ready()
+        on_scroll(feed('tehran', 10))
+        return None
+    monkeypatch.setattr(save_urls, 'collect_shard_urls', fake_shard)
+    seen = SeenAds(str(tmp_path / 'seen.bloom'), capacity=1000)
+    seen.add_many(f'AaBbCc{i:04d}' for i in range(6))
+    
+    urls = save_urls.save_specific_urls('پژو 206', regions=['tehran'], skip_seen=True, seen_ads=seen,
+                                        progress=lambda e, d: None)
+    assert sorted(urls) == [f'https://divar.ir/v/tehran-title-{i}/AaBbCc{i:04d}' for i in range(6, 10)]
@@ -0,0 +1,105 @@
+# tests/test_singleflight.py
+import threading
+import time
+from core.singleflight import SingleFlight, Unshared
+from core.state_store import SQLiteStateStore
+
+def run_concurrently(flights, key, fn, count=5):
+    results = []
+    threads = [threading.Thread(target=lambda f=flights[i % len(flights)]: results.append(f.do(key, fn)))
+               for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_duplicates_share_one_call():
+    calls = []
+    def search():
+        calls.append(1)
+        time.sleep(0.2)
+        return ['https://divar.ir/v/peugeot-206/AaBbCcDd']
+    
+    results = run_concurrently([SingleFlight()], 'search:پژو 206', search)
+    assert len(calls) == 1
+    assert results == [['https://divar.ir/v/peugeot-206/AaBbCcDd']] * 5
+
+def test_workers_coalesce_through_shared_store(tmp_path):
+    db_file = str(tmp_path / 'state.sqlite')
+    workers = [SingleFlight(SQLiteStateStore(db_file), poll_interval=0.05) for _ in range(2)]
+    calls = []
+    def scrape():
+        calls.append(1)
+        time.sleep(0.5)
+        return {'ads_count': 42}
+    
+    results = run_concurrently(workers, 'scrape:پژو 206', scrape, count=4)
+    assert len(calls) == 1
+    assert results == [{'ads_count': 42}] * 4
+    assert workers[0].store.get('inflight:scrape:پژو 206') is None
+
+def test_add_only_sets_missing_keys(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    assert store.add('inflight:x', {'flight_id': 'a'})
+    assert not store.add('inflight:x', {'flight_id': 'b'})
+    assert store.get('inflight:x') == {'flight_id': 'a'}
+
+def test_waiter_takes_result_published_as_lease_vanishes(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    flight = SingleFlight(store, poll_interval=0.05)
+    store.add('inflight:search:پراید', {'flight_id': 'other-worker'})
+
+    def finish_elsewhere():
+        time.sleep(0.2)
+        # Published under the key waiters look up when the flight id is unknown
+        store.set('inflight:search:پراید:last', {'result': ['url'], 'published_at': time.time()})
+        store.delete('inflight:search:پراید')
+
+    threading.Thread(target=finish_elsewhere).start()
+    calls = []
+    assert flight.do('search:پراید', lambda: calls.append(1) or ['again']) == ['url']
+    assert calls == []
+
+def test_unshared_result_makes_waiters_run_their_own_call():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def cut_short():
+        calls.append('leader')
+        started.set()
+        time.sleep(0.2)
+        raise Unshared(['partial'])
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('scrape:پژو', cut_short)))
+    leader.start()
+    started.wait()
+    assert flight.do('scrape:پژو', lambda: calls.append('follower') or ['full']) == ['full']
+    leader.join()
+    assert results == [['partial']]
+    assert calls == ['leader', 'follower']
+
+def test_leader_keeps_its_lease_past_the_ttl(tmp_path):
+    db_file = str(tmp_path / 'state.sqlite')
+    workers = [SingleFlight(SQLiteStateStore(db_file), lease_ttl=1, poll_interval=0.05) for _ in range(2)]
+    calls = []
+    def slow_scrape():
+        calls.append(1)
+        time.sleep(2.5)
+        return {'ads_count': 7}
+
+    assert run_concurrently(workers, 'scrape:سمند', slow_scrape, count=3) == [{'ads_count': 7}] * 3
+    assert len(calls) == 1
+
+def test_leader_leaves_a_lease_taken_over_by_another_flight(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    flight = SingleFlight(store, lease_ttl=60)
+
+    def lapse_and_lose_the_lease():
+        store.set('inflight:scrape:تیبا', {'flight_id': 'new-leader'}, ttl=60)
+        return ['rows']
+
+    assert flight.do('scrape:تیبا', lapse_and_lose_the_lease) == ['rows']
+    assert store.get('inflight:scrape:تیبا') == {'flight_id': 'new-leader'}
@@ -0,0 +1,121 @@
+# tests/test_state_store.py
+import socketserver
+import threading
+import time
+import pytest
+from core.state_store import SQLiteStateStore, RedisStateStore
+
+class RespStandIn(socketserver.StreamRequestHandler):
+    """Minimal Redis-protocol server understanding GET/SET/DEL and WATCH/MULTI/EXEC"""
+    data = {}
+    lock = threading.Lock()
+
+    def handle(self):
+        watched, queued = {}, None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            command = args[0].upper()
+            if command == b'WATCH':
+                with self.lock:
+                    watched[args[1]] = self.data.get(args[1])
+                self.wfile.write(b"+OK\r\n")
+            elif command == b'UNWATCH':
+                watched = {}
+                self.wfile.write(b"+OK\r\n")
+            elif command == b'MULTI':
+                queued = []
+                self.wfile.write(b"+OK\r\n")
+            elif command == b'EXEC':
+                with self.lock:
+                    if any(self.data.get(key) != value for key, value in watched.items()):
+                        replies = None
+                    else:
+                        replies = [self.run(queued_args) for queued_args in queued]
+                watched, queued = {}, None
+                self.wfile.write(b"*-1\r\n" if replies is None else b"*%d\r\n" % len(replies) + b''.join(replies))
+            elif queued is not None:
+                queued.append(args)
+                self.wfile.write(b"+QUEUED\r\n")
+            else:
+                with self.lock:
+                    self.wfile.write(self.run(args))
+
+    def run(self, args):
+        command = args[0].upper()
+        if command == b'SET':
+            ttl = int(args[4]) if len(args) > 4 else None
+            self.data[args[1]] = (args[2], time.time() + ttl if ttl else None)
+            return b"+OK\r\n"
+        if command == b'GET':
+            value, expires_at = self.data.get(args[1], (None, None))
+            if value is None or (expires_at and expires_at <= time.time()):
+                return b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if command == b'DEL':
+            removed = self.data.pop(args[1], None) is not None
+            return b":%d\r\n" % removed
+        return b"-ERR unknown command\r\n"
+
+@pytest.fixture
+def redis_url():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), RespStandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+    return RedisStateStore(request.getfixturevalue('redis_url'))
+
+def test_roundtrip_and_update(store):
+    store.set('pipeline:a', {'user_data': {'brand_model': 'پژو 206'}, 'urls': []})
+    assert store.get('pipeline:a')['user_data']['brand_model'] == 'پژو 206'
+    store.update('pipeline:a', {'urls': ['https://divar.ir/v/x/abc']})
+    assert store.get('pipeline:a')['urls'] == ['https://divar.ir/v/x/abc']
+    store.delete('pipeline:a')
+    assert store.get('pipeline:a') is None
+
+def test_guarded_update_and_delete_let_one_worker_win(store):
+    store.set('job:a', {'status': 'queued'})
+    winners = []
+
+    def start(worker):
+        if store.update('job:a', {'status': 'running', 'worker': worker}, expect={'status': 'queued'}):
+            winners.append(worker)
+
+    threads = [threading.Thread(target=start, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(winners) == 1
+    assert store.get('job:a') == {'status': 'running', 'worker': winners[0]}
+    assert store.update('missing', {'status': 'done'}) is None
+
+    assert not store.delete_if('job:a', {'worker': winners[0] + 1})
+    assert store.delete_if('job:a', {'worker': winners[0]})
+    assert store.get('job:a') is None
+
+def test_entries_expire(store):
+    store.set('pipeline:old', {'current_step': 'searching'}, ttl=1)
+    time.sleep(1.1)
+    assert store.get('pipeline:old') is None
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    db_file = str(tmp_path / 'state.sqlite')
+    SQLiteStateStore(db_file).set('pipeline:b', {'current_step': 'training'})
+    other = SQLiteStateStore(db_file)
+    assert other.get('pipeline:b') == {'current_step': 'training'}
+    other.set('pipeline:c', {}, ttl=1)
+    time.sleep(1.1)
+    assert other.purge_expired() == 1
@@ -0,0 +1,127 @@
+# tests/test_storage.py
+import os
+import time
+import pytest
+from benchmarks.synthetic_ads import write_ads_csv
+from core.global_model import retrain_global_model
+from core.model_registry import ModelRegistry
+from core.storage import StorageManager
+
+DAY = 24 * 3600
+
+@pytest.fixture
+def dirs(tmp_path):
+    data_dir, models_dir = tmp_path / 'UserData', tmp_path / 'Models'
+    data_dir.mkdir()
+    models_dir.mkdir()
+    return str(data_dir), str(models_dir)
+
+def write(directory, name, size, age_days):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    mtime = time.time() - age_days * DAY
+    os.utime(path, (mtime, mtime))
+    return path
+
+def register(registry, model_file, uses=0, brand_model='پژو 206'):
+    model_data = {'user_data': {'brand_model': brand_model, 'year_model': 1398, 'mileage': 90000,
+                                'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}}
+    registry.register(model_file, model_data)
+    for _ in range(uses):
+        registry.touch(model_file)
+
+def manager(dirs, tmp_path, **options):
+    registry = ModelRegistry(str(tmp_path / 'registry.sqlite'))
+    return StorageManager(*dirs, registry=registry, protected=(os.path.join(dirs[1], 'global_model.pkl'),),
+                          **options), registry
+
+def test_evicts_least_recently_used_pairs_until_the_budget_fits(dirs, tmp_path):
+    storage, registry = manager(dirs, tmp_path, budget_mb=2500 / 2 ** 20, max_age_days=0)
+    data_dir, models_dir = dirs
+    for name, age in (('old', 5), ('mid', 3), ('new', 1)):
+        write(data_dir, f'user_data_{name}.csv', 500, age)
+        write(models_dir, f'user_model_{name}.pkl', 500, age)
+    # The oldest search's model was used a minute ago, so its CSV stays too
+    register(registry, os.path.join(models_dir, 'user_model_old.pkl'), uses=1)
+    write(models_dir, 'global_model.pkl', 500, 10)
+
+    report = storage.evict()
+    evicted = sorted(os.path.basename(info['path']) for info in report['evicted'])
+    assert evicted == ['user_data_mid.csv', 'user_model_mid.pkl']
+    assert report['bytes_before'] == 3000 and report['bytes_after'] == 2000 <= storage.budget
+    assert os.path.exists(os.path.join(models_dir, 'global_model.pkl'))
+    assert storage.stats()['reclaimed_bytes'] == 1000
+
+def test_expires_idle_files_and_keeps_pinned_ones(dirs, tmp_path):
+    storage, registry = manager(dirs, tmp_path, budget_mb=0, max_age_days=30, pin_uses=3)
+    data_dir, models_dir = dirs
+    pinned = write(models_dir, 'user_model_pinned.pkl', 100, 60)
+    popular = write(models_dir, 'user_model_popular.pkl', 100, 60)
+    write(data_dir, 'user_data_pinned.csv', 100, 60)
+    stale = write(models_dir, 'user_model_stale.pkl', 100, 60)
+    fresh = write(data_dir, 'user_data_fresh.csv', 100, 2)
+    for model_file in (pinned, popular, stale):
+        register(registry, model_file)
+    registry.pin(pinned)
+    for _ in range(3):
+        registry.touch(popular)
+    # Old registry entries look unused for the test
+    registry._connect().execute("UPDATE models SET last_used_at = ?", (time.time() - 60 * DAY,))
+
+    dry = storage.evict(dry_run=True)
+    assert [info['path'] for info in dry['evicted']] == [stale] and os.path.exists(stale)
+
+    report = storage.evict()
+    assert report['expired_files'] == 1 and not os.path.exists(stale)
+    assert registry.get(stale) is None
+    assert all(os.path.exists(path) for path in (pinned, popular, fresh, os.path.join(data_dir, 'user_data_pinned.csv')))
+
+def test_background_eviction_is_throttled(dirs, tmp_path):
+    storage, _ = manager(dirs, tmp_path, budget_mb=0, max_age_days=1, interval=3600)
+    write(dirs[0], 'user_data_a.csv', 10, 5)
+    assert storage.evict_in_background()
+    deadline = time.time() + 5
+    while storage.stats()['runs'] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert storage.stats()['evicted_files'] == 1
+    assert not storage.evict_in_background()
+
+def test_leaves_files_other_than_search_csvs_and_models_alone(dirs, tmp_path):
+    storage, _ = manager(dirs, tmp_path, budget_mb=0, max_age_days=1)
+    data_dir, models_dir = dirs
+    kept = [write(directory, name, 10, 90) for directory in dirs for name in ('.gitkeep', 'notes.txt')]
+    kept.append(write(models_dir, 'user_model_a.pkl.tmp', 10, 90))
+    stale = write(data_dir, 'user_data_a.csv', 10, 90)
+
+    report = storage.evict()
+    assert [info['path'] for info in report['evicted']] == [stale]
+    assert report['files'] == 1
+    assert all(os.path.exists(path) for path in kept)
+
+def test_evicted_ads_stay_in_the_global_model_corpus(dirs, tmp_path):
+    storage, registry = manager(dirs, tmp_path, budget_mb=0, max_age_days=30)
+    data_dir, models_dir = dirs
+    # The Peugeot search is idle for 60 days, its ads are listed as "پژو 206 تیپ 2"
+    for spec, query, brands, age_days in (('1a2b3c4d', 'پژو 206', [('پژو 206 تیپ 2', 720)], 60),
+                                          ('5e6f7a8b', 'پراید', [('پراید 131 SE', 380)], 0)):
+        csv_file = write_ads_csv(os.path.join(data_dir, f'user_data_{spec}.csv'), 200, seed=len(query),
+                                 brand_models=brands)
+        mtime = time.time() - age_days * DAY
+        os.utime(csv_file, (mtime, mtime))
+        model_file = write(models_dir, f'user_model_{spec}.pkl', 100, age_days)
+        register(registry, model_file, brand_model=query)
+        registry._connect().execute("UPDATE models SET last_used_at = ? WHERE model_file = ?", (mtime, model_file))
+    before = retrain_global_model(data_dir, str(tmp_path / 'before.pkl'), registry=registry)
+
+    report = storage.evict()
+    assert report['evicted_files'] == 2
+    assert not os.path.exists(os.path.join(data_dir, 'user_data_1a2b3c4d.csv'))
+    assert os.path.exists(storage.corpus_file)
+
+    after = retrain_global_model(data_dir, str(tmp_path / 'after.pkl'), registry=registry)
+    assert after['brand_stats'].keys() == before['brand_stats'].keys() == {'پژو 206', 'پراید'}
+    assert after['brand_stats']['پژو 206'][0] == before['brand_stats']['پژو 206'][0]
+
+    # Archiving again adds nothing twice
+    assert storage.evict()['evicted_files'] == 0
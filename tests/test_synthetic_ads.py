@@ -0,0 +1,22 @@
+# tests/test_synthetic_ads.py
+import pandas as pd
+from benchmarks.synthetic_ads import generate_ads, write_ads_csv
+from core.scrap_specific_ads import AD_COLUMNS
+from core.train_user_model import clean_and_preprocess_data
+
+def test_generated_ads_match_the_scraper_csv(tmp_path):
+    path = write_ads_csv(str(tmp_path / 'ads.csv'), 2000, seed=3)
+    df = pd.read_csv(path, encoding='utf-8-sig')
+    assert list(df.columns) == AD_COLUMNS and len(df) == 2000
+    assert df['url'].is_unique
+    assert df.isna().any(axis=1).sum() > 0  # Missing fields were injected
+
+    df_clean, info = clean_and_preprocess_data(df)
+    assert 0 < len(df_clean) < len(df)  # Injected outliers are removed
+    # Older cars are cheaper
+    by_year = df_clean.groupby('year_model')['price'].median()
+    assert by_year.loc[1400:].mean() > by_year.loc[:1392].mean()
+
+def test_generation_is_reproducible():
+    assert list(generate_ads(50, seed=1)) == list(generate_ads(50, seed=1))
+    assert list(generate_ads(50, seed=1)) != list(generate_ads(50, seed=2))
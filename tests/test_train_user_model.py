@@ -0,0 +1,36 @@
+# tests/test_train_user_model.py
+import pandas as pd
+from benchmarks.synthetic_ads import generate_ads
+from core.train_user_model import (ads_dataframe, clean_and_preprocess_data, preprocess_features_with_engineering,
+                                   train_model_on_dataframe)
+
+def test_cleaning_uses_compact_dtypes_and_leaves_input_alone():
+    df = ads_dataframe(list(generate_ads(3000, seed=5, outlier_rate=0.05, missing_rate=0.1)))
+    before = df.copy()
+    df_clean, info = clean_and_preprocess_data(df)
+
+    pd.testing.assert_frame_equal(df, before)
+    removed = sum(value for name, value in info.items() if name.endswith('_removed'))
+    assert info['final_samples'] == len(df_clean) == len(df) - removed
+    assert str(df_clean['year_model'].dtype) == 'int16' and str(df_clean['mileage'].dtype) == 'int32'
+    assert all(isinstance(df_clean[col].dtype, pd.CategoricalDtype) for col in ['gearbox', 'fuel_type', 'brand_model'])
+    assert df_clean['gearbox'].notna().all()
+    assert 0 < info['memory_after_mb'] < info['memory_before_mb']
+
+def test_preprocessing_counts_missing_prices_and_keeps_features_aligned():
+    rows = list(generate_ads(300, seed=7, outlier_rate=0, missing_rate=0))
+    for row in rows[:4]:
+        row[6] = ''  # price
+    for row in rows[4:10]:
+        row[1] = 1405  # model year past the age feature's reference year
+    df = ads_dataframe(rows)
+    df_clean, info = clean_and_preprocess_data(df)
+    assert info['missing_price_removed'] == 4
+
+    X = df_clean[['year_model', 'mileage', 'gearbox', 'fuel_type']]
+    before = X.copy()
+    X_processed, _ = preprocess_features_with_engineering(X, df_clean['price'])
+    pd.testing.assert_frame_equal(X, before)
+    assert len(X_processed) == len(X) - 6
+    assert train_model_on_dataframe(df, None, {'brand_model': 'پژو 206', 'year_model': 1398, 'mileage': 90000,
+                                               'gearbox': 'دنده ای', 'fuel_type': 'بنزین'}, save=False)